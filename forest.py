@@ -2,9 +2,27 @@ import os
 import sys
 import bpy
 import math
+import argparse
 import numpy as np
 from typing import Tuple
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+from pose import pose_batch, pose2mtx, invert_pose
+from sampling import stream
+from manifest import Manifest, cam2str, cam_name, shard_name
+from export import Exporter
+from journal import Journal
+from lod import load_lods, ring_distance, select_lod
+from animation import bake_camera, clear_animation, render_frames, rename_frames
+from passes import setup_outputs, viewer_pixels
+from writer import AsyncWriter
+from timing import Timer, write_summary
+from coverage import object_points, cull_poses
+from planner import object_triangles, plan_views, scale_intrinsic
+from preview import frame_stats, is_bad, write_preview, save_index
+from dataset import ShardWriter, member_name, member_ref
+from tiles import pass_flags, tile_grid, set_border, clear_border, tile_path, save_layout, stitch
+
 # IO format
 io_folder = 'D:/Mesh/scenes/forest'
 file_format = 'JPEG'
@@ -13,6 +31,33 @@ color_mode = 'RGB'
 resolution_x = 1280
 resolution_y = 720
 views = 40 # views per radius
+seed = 0 # pose plan seed, shared by all shards
+sampler = 'cube' # the legacy 'cube', or opt in to 'fibonacci', 'stratified', 'halton', 'uniform'
+min_elevation = -90. # degrees above the target for the opt in samplers, 0 keeps cameras above it
+max_elevation = 90.
+verify_every = 0 # compare extrinsics with matrix_world every n views, 0 to disable
+render_mode = 'still' # 'still' renders view by view, 'animation' bakes each radius ring into keyframes
+async_write = 0 # PNG encoder threads writing off the render thread in still mode, 0 writes through the compositor
+async_pending = 8 # frames waiting for the encoder before rendering blocks
+cam_format = 'txt' # 'txt' for one NN-III_cam.txt per view, 'manifest' for a single cams.npy
+export_formats = [] # also stream poses to 'colmap' cameras/images.txt and 'nerf' transforms.json
+lod_folder = '' # folder of scripts/lod.py meshes, '' renders the full scene for every radius
+lod_pixel_error = 0.5 # largest projected LOD error in pixels
+lod_margin = None # scene extent around the target, None to take the distance from the ring's cameras to the nearest vertex
+timing_format = 'jsonl' # per view stage timings written to timings.jsonl or timings.csv
+min_coverage = 0. # redraw poses whose projected scene vertices cover less of the screen grid, 0 to disable
+min_depth = 0. # also redraw poses with scene geometry closer than this
+coverage_samples = 20000 # scene vertices projected per pose
+coverage_tries = 10 # redraws before a pose below the thresholds is skipped
+coverage_target = 0. # render only the fewest views seeing this fraction of the surface seen by all views, 0 renders all
+plan_scale = 0.25 # resolution scale of the visibility renders of the planner
+preview_percentage = 0 # render the plan at this resolution percentage into preview/ first, 0 disables
+preview_skip_bad = True # skip views the preview flags as empty or fully occluded at full resolution
+preview_min_coverage = 0.05 # fraction of preview pixels that show the scene, not the world color
+preview_min_contrast = 0.01 # luminance standard deviation of those pixels
+tiles = [1, 1] # columns, rows of border regions a frame is rendered in, for frames larger than memory
+tile_passes = [] # passes stitched next to tiled images as <image>-<pass>.npy: 'depth', 'normal', 'albedo', 'id'
+shard_size = 0 # MB per tar shard packing every view's files into shards/ with an index, 0 writes loose files
 
 # Camera config
 cam_location = [40.748, -18.083, 15.867]
@@ -27,6 +72,22 @@ light_location = [15.499, -46.782, 29.921]
 light_rotation = [68.6, 7.67, 15.3]
 energy = 1
 
+# Sharding, set by scripts/launch.py, and overrides of the config above, used by scripts/benchmark.py
+parser = argparse.ArgumentParser(description='Forest rendering')
+parser.add_argument('--shard', type=int, default=0)
+parser.add_argument('--shards', type=int, default=1)
+parser.add_argument('--threads', type=int, default=0, help='render threads, 0 for auto')
+parser.add_argument('--resume', action='store_true', default=False, help='skip views completed by a previous run')
+parser.add_argument('--io_folder', default=io_folder)
+parser.add_argument('--views', type=int, default=views)
+parser.add_argument('--radius', type=float, nargs='+', default=radius)
+parser.add_argument('--target', type=float, nargs=3, default=target_location)
+parser.add_argument('--resolution', type=int, nargs=2, default=[resolution_x, resolution_y])
+parser.add_argument('--engine', default='BLENDER_EEVEE')
+argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+args = parser.parse_args(argv)
+io_folder, views, radius, target_location = args.io_folder, args.views, args.radius, args.target
+resolution_x, resolution_y = args.resolution
 
 context = bpy.context
 scene = bpy.context.scene
@@ -78,6 +139,7 @@ class Camera(object):
         self.camera.rotation_mode = 'XYZ'
         for i in range(3):
             self.rotation[i] = math.radians(rotation[i])
+        self.pose = (np.array(location, dtype=float), np.array(rotation, dtype=float))
         return None
     
     def intrinsic(self):
@@ -98,58 +160,77 @@ class Camera(object):
         ], dtype=float)
         return self.intrinsic_matrix
 
-    def extrinsic(self):
+    def extrinsic(self, verify=False):
         # camera 2 world transformation matrix
-        context.view_layer.update()
-        self.extrinsic_matrix = np.array(self.camera.matrix_world, dtype=float)
+        # computed from the pose applied by set_camera(), the camera has no parent
+        # so this skips the depsgraph evaluation needed to refresh matrix_world
+        self.extrinsic_matrix = pose2mtx(*self.pose)[0]
+        if verify:
+            context.view_layer.update()
+            matrix_world = np.array(self.camera.matrix_world, dtype=float)
+            if not np.allclose(self.extrinsic_matrix, matrix_world, atol=1e-5):
+                print(f"Extrinsic mismatch, falling back to matrix_world:\n{self.extrinsic_matrix}\n{matrix_world}")
+                self.extrinsic_matrix = matrix_world
         return self.extrinsic_matrix
 
+    def world2cam(self):
+        # world 2 camera transformation matrix of the last extrinsic()
+        return invert_pose(self.extrinsic_matrix)[0]
+
+
+class LOD(object):
+    def __init__(
+        self,
+        folder: str,
+    ):
+        super().__init__()
+        lods = load_lods(folder)
+        self.levels = lods['levels']
+        # the full resolution scene is level 0, its sampled vertices give the
+        # distance from a ring's cameras to the nearest geometry
+        self.full = [obj for obj in scene.objects if obj.type == 'MESH']
+        self.points = object_points(self.full, coverage_samples, stream(seed, 'lod'))
+        self.objects = []
+        self.materials = []
+        self.images = []
+        self.level = 0
+
+    def distance(self, r, ring_locations):
+        if lod_margin is not None:
+            return r - lod_margin
+        return ring_distance(ring_locations, self.points)
+
+    def set_level(self, level):
+        if level == self.level:
+            return None
+        # the swapped out level goes with the materials and images it imported
+        meshes = [obj.data for obj in self.objects]
+        for obj in self.objects:
+            bpy.data.objects.remove(obj, do_unlink=True)
+        for mesh in meshes:
+            bpy.data.meshes.remove(mesh)
+        for material in self.materials:
+            bpy.data.materials.remove(material)
+        for image in self.images:
+            bpy.data.images.remove(image)
+        self.objects, self.materials, self.images = [], [], []
+        if level > 0:
+            materials, images = set(bpy.data.materials), set(bpy.data.images)
+            bpy.ops.object.select_all(action='DESELECT')
+            bpy.ops.import_scene.obj(filepath=self.levels[level]['path'])
+            self.objects = list(context.selected_objects)
+            self.materials = [m for m in bpy.data.materials if m not in materials]
+            self.images = [i for i in bpy.data.images if i not in images]
+            for obj in self.objects:
+                obj.pass_index = 1
+        for obj in self.full:
+            obj.hide_render = level > 0
+        self.level = level
+        return None
 
-def track(
-    cam_location: Tuple[float],
-    target_location: Tuple[float],
-):
-    cam_location = np.array(cam_location)
-    target_location = np.array(target_location)
-    relative = target_location-cam_location
-    x, y, z = relative
-    for i in [x, y, z]:
-        if i == 0:
-            i += 1e-5
-    rotation = np.zeros(3)
-    l = np.linalg.norm(relative, ord=2)
-    rotation[0] = np.rad2deg(np.arccos(-z / l))
-    rotation[2] = np.rad2deg(np.arctan(-x / y))
-    if y < 0. :
-        rotation[2] += 180
-    return rotation
-
-
-def random_sphere(
-    center: Tuple[float],
-    radius: float,
-):
-    translation = np.random.rand(3)-0.5
-    norm = np.linalg.norm(translation, ord=2)
-    translation /= norm
-    location = center+translation*radius
-    return location
-
-
-def mtx2str(array, digits=8):
-    s = ''
-    lines = array.tolist()
-    for line in lines:
-        for number in line:
-            if digits==8:
-                s += f"{number:.8f} "
-            elif digits==2:
-                s += f"{number:.2f} "
-        s += '\n'
-    return s
 
 # Render setting
-render.engine = "BLENDER_EEVEE"
+render.engine = args.engine
 render.image_settings.file_format = file_format
 render.image_settings.color_depth = color_depth
 render.image_settings.color_mode = color_mode
@@ -157,23 +238,36 @@ render.resolution_x = resolution_x
 render.resolution_y = resolution_y
 render.resolution_percentage = 100
 render.film_transparent = False
+if args.threads:
+    render.threads_mode = 'FIXED'
+    render.threads = args.threads
 scene.world.color = (1, 1, 1)
 
-# Set up output
-scene.use_nodes = True
-context.view_layer.use_pass_normal = True
-context.view_layer.use_pass_diffuse_color = True
-context.view_layer.use_pass_object_index = True
-tree = scene.node_tree
-links = tree.links
-# Clear default nodes
-for n in tree.nodes:
-    tree.nodes.remove(n)
-render_layers = tree.nodes.new('CompositorNodeRLayers')
-image_file_output = tree.nodes.new(type="CompositorNodeOutputFile")
-image_file_output.label = 'Image'
-image_file_output.base_path = ''
-links.new(render_layers.outputs['Image'], image_file_output.inputs[0])
+# Set up output, only the image pass is written
+tile_mode = tiles[0]*tiles[1] > 1 and render_mode == 'still'
+async_write = async_write if render_mode == 'still' and not tile_mode else 0
+if tile_mode:
+    # tiles are multilayer EXRs with every enabled pass, stitched by scripts/tiles.py
+    # into a PNG with the Standard view transform and float32 .npy passes
+    render.image_settings.file_format = 'OPEN_EXR_MULTILAYER'
+    render.image_settings.color_depth = '32'
+    render.image_settings.exr_codec = 'ZIP'
+    scene.view_settings.view_transform = 'Standard'
+    image_file_output = None
+    setup_outputs([], viewer=preview_percentage > 0)
+    for name in tile_passes:
+        setattr(context.view_layer, pass_flags[name], True)
+elif async_write:
+    # frames are read back from a Viewer node and encoded as PNG by AsyncWriter,
+    # the Standard view transform is what its sRGB encoding reproduces
+    render.image_settings.file_format = 'PNG'
+    scene.view_settings.view_transform = 'Standard'
+    writer = AsyncWriter(async_write, async_pending, color_depth, len(color_mode))
+    image_file_output = None
+    setup_outputs([], viewer=True)
+else:
+    # preview frames are read back from a Viewer node
+    image_file_output = setup_outputs(['image'], viewer=preview_percentage > 0)['image']
 
 # Light and camera
 light = Light(light_location, light_rotation, energy)
@@ -183,23 +277,246 @@ intrinsic = cam.intrinsic()
 # Rendering
 img_folder = os.path.join(io_folder, "blended_images/")
 cam_folder = os.path.join(io_folder, "cams")
-if not os.path.isdir(img_folder):
-    os.mkdir(img_folder)
-if not os.path.isdir(cam_folder):
-    os.mkdir(cam_folder)
+os.makedirs(img_folder, exist_ok=True)
+os.makedirs(cam_folder, exist_ok=True)
 render.filepath = img_folder
-for r in radius:
+if tile_mode:
+    grid = tile_grid(resolution_x, resolution_y, *tiles)
+    tile_folder = os.path.join(io_folder, "tiles")
+    os.makedirs(tile_folder, exist_ok=True)
+    save_layout(tile_folder, resolution_x, resolution_y, *tiles, color_depth, len(color_mode))
+if cam_format == 'manifest':
+    manifest_name = "cams.npy" if args.shards == 1 else shard_name(args.shard, args.shards)
+    manifest = Manifest(os.path.join(cam_folder, manifest_name), len(radius)*views, resume=args.resume)
+# sharded runs export from the merged manifest in scripts/launch.py
+export_formats = export_formats if args.shards == 1 else []
+if export_formats:
+    exporter = Exporter(io_folder, intrinsic, resolution_x, resolution_y,
+        colmap='colmap' in export_formats, nerf='nerf' in export_formats)
+journal_name = "journal.jsonl" if args.shards == 1 else f"journal-{args.shard:02d}-of-{args.shards:02d}.jsonl"
+journal = Journal(os.path.join(io_folder, journal_name), args.resume)
+packer = None
+if shard_size > 0:
+    # views are journaled with their shard once it is finished, a torn shard is rendered again
+    packer = ShardWriter(os.path.join(io_folder, "shards"), "data" if args.shards == 1 else f"data-{args.shard:02d}-of-{args.shards:02d}",
+        max_size=shard_size << 20)
+    packed = {}
+
+
+def view_key(k):
+    return f"{int(radius[k // views]):0>2d}-{k % views:0>3d}"
+
+
+def finish_view(k, outputs):
+    if packer is None:
+        journal.record(k, outputs, (locations[k], rotations[k]))
+        return
+    key = view_key(k)
+    packed[key] = k
+    finished = packer.write(key, {member_name(path, key): path for path in outputs})
+    for path in outputs:
+        os.remove(path)
+    for key_done, path in finished:
+        k_done = packed.pop(key_done)
+        journal.record(k_done, [path], (locations[k_done], rotations[k_done]))
+
+
+timing_name = "timings" if args.shards == 1 else f"timings-{args.shard:02d}-of-{args.shards:02d}"
+timer = Timer(os.path.join(io_folder, f"{timing_name}.{timing_format}"), args.resume)
+timer.watch_render()
+with timer.stage('pose'):
+    # keyed streams: every ring, the coverage points and the redraws draw
+    # independently, every shard draws the same plan
+    if min_coverage > 0 or min_depth > 0:
+        points = object_points([obj for obj in scene.objects if obj.type == 'MESH'], coverage_samples, stream(seed, 'coverage'))
+        locations, rotations, _, scores = cull_poses(target_location, radius, views, points, intrinsic,
+            resolution_x, resolution_y, min_coverage, min_depth, coverage_tries, stream(seed, 'redraw'),
+            sampler=sampler, min_elevation=min_elevation, max_elevation=max_elevation, seed=seed)
+        accepted = scores['accepted']
+        print(f"Coverage: {(~accepted).sum()} of {len(accepted)} poses below the thresholds are skipped")
+    else:
+        locations, rotations, _ = pose_batch(target_location, radius, views, None, sampler, min_elevation, max_elevation, seed)
+        accepted = np.ones(len(locations), dtype=bool)
+    if coverage_target > 0:
+        # the views of the plan are the candidates of the greedy set cover
+        candidates = np.flatnonzero(accepted)
+        vertices, faces = object_triangles([obj for obj in scene.objects if obj.type == 'MESH'])
+        selected, covered = plan_views(vertices, faces, intrinsic, pose2mtx(locations, rotations)[candidates],
+            resolution_x, resolution_y, coverage_target, plan_scale)
+        accepted[:] = False
+        accepted[candidates[selected]] = True
+        print(f"Planner: {len(selected)} of {len(candidates)} views cover {covered[-1] if len(covered) else 0.:.1%} of the surface")
+lod = LOD(lod_folder) if lod_folder else None
+
+# Preview pass: the whole plan at preview_percentage, with matching intrinsics
+if preview_percentage > 0:
+    preview_folder = os.path.join(io_folder, "preview")
+    os.makedirs(os.path.join(preview_folder, "blended_images"), exist_ok=True)
+    os.makedirs(os.path.join(preview_folder, "cams"), exist_ok=True)
+    preview_intrinsic = scale_intrinsic(intrinsic, preview_percentage / 100)
+    render.resolution_percentage = preview_percentage
+    if image_file_output is not None:
+        image_file_output.mute = True
+    entries = []
+    for j, r in enumerate(radius):
+        if lod is not None:
+            lod.set_level(select_lod(lod.levels, lod.distance(r, locations[j*views:(j+1)*views]), lens, sensor_width, resolution_x, lod_pixel_error))
+        for i in range(views):
+            k = j*views + i
+            # tiles of a view are spread over all shards, so in tile mode every
+            # shard previews every view and they all skip the same ones
+            owner = k % args.shards == args.shard
+            if not (owner or tile_mode) or not accepted[k]:
+                continue
+            timer.start(f"preview-{k}", 0)
+            with timer.stage('preview'):
+                cam.set_camera(locations[k], rotations[k])
+                extrinsic = cam.extrinsic()
+                bpy.ops.render.render()
+                pixels = viewer_pixels()
+                stats = frame_stats(pixels, scene.world.color)
+                image = f"{int(r):0>2d}-{i:0>3d}.png"
+                if owner:
+                    write_preview(os.path.join(preview_folder, "blended_images", image), pixels, channels=len(color_mode))
+                    with open(os.path.join(preview_folder, "cams", cam_name(r, i)), 'w') as f:
+                        f.write(cam2str(extrinsic, preview_intrinsic))
+            bad = is_bad(stats, preview_min_coverage, preview_min_contrast)
+            if owner:
+                entries.append({'view': int(k), 'image': image, 'bad': bad, **stats})
+            if bad and preview_skip_bad:
+                accepted[k] = False
+    preview_name = "preview.json" if args.shards == 1 else f"preview-{args.shard:02d}-of-{args.shards:02d}.json"
+    save_index(os.path.join(preview_folder, preview_name), entries,
+        percentage=preview_percentage, resolution=[resolution_x, resolution_y])
+    print(f"Preview: {sum(e['bad'] for e in entries)} of {len(entries)} views flagged, see {preview_folder}")
+    render.resolution_percentage = 100
+    if image_file_output is not None:
+        image_file_output.mute = False
+
+for j, r in enumerate(radius):
+    if lod is not None:
+        timer.start(f"lod-{j}", 0)
+        with timer.stage('lod'):
+            level = select_lod(lod.levels, lod.distance(r, locations[j*views:(j+1)*views]), lens, sensor_width, resolution_x, lod_pixel_error)
+            print(f"Radius {r}: LOD {level}")
+            lod.set_level(level)
+    if render_mode == 'animation':
+        clear_animation(cam.camera)
+        pending = []
     for i in range(views):
-        cam_location = random_sphere(target_location, r)
-        cam_rotation = track(cam_location, target_location)
-        cam.set_camera(cam_location, cam_rotation)
-        extrinsic = cam.extrinsic()
-
-        image_file_output.file_slots[0].path = render.filepath + f"{int(r):0>2d}-{i:0>3d}-"
-        with open(os.path.join(cam_folder, f"{int(r):02d}-{i:0>3d}_cam.txt"), 'w') as f:
-            f.write("extrinsic\n")
-            f.write(mtx2str(extrinsic)+'\n\n')
-            f.write("intrinsic\n")
-            f.write(mtx2str(intrinsic, digits=2)+'\n\n')
-
-        bpy.ops.render.render(write_still=True)
\ No newline at end of file
+        k = j*views + i
+        if not accepted[k]:
+            continue
+        if tile_mode:
+            # shards split the tiles of all frames, the shard of tile 0 writes the camera record
+            shard_tiles = [t for t in range(len(grid)) if (k*len(grid) + t) % args.shards == args.shard]
+            if not shard_tiles:
+                continue
+            write_records = k*len(grid) % args.shards == args.shard
+        elif k % args.shards != args.shard:
+            continue
+        else:
+            write_records = True
+        timer.start(k)
+        with timer.stage('set_camera'):
+            cam.set_camera(locations[k], rotations[k])
+        with timer.stage('extrinsic'):
+            extrinsic = cam.extrinsic(verify=verify_every > 0 and k % verify_every == 0)
+
+        if image_file_output is not None:
+            image_file_output.file_slots[0].path = render.filepath + f"{int(r):0>2d}-{i:0>3d}-"
+        stem = f"{int(r):0>2d}-{i:0>3d}-{scene.frame_current:04d}"
+        image = stem + (".png" if tile_mode else render.file_extension)
+        outputs = [os.path.join(img_folder, image)]
+        # packed images are referenced through the shard index, see scripts/dataset.py
+        image_ref = member_ref("shards", view_key(k), member_name(image, view_key(k))) if packer is not None else image
+        done = journal.done(k, (locations[k], rotations[k]))
+        with timer.stage('records'):
+            if not write_records:
+                pass
+            elif cam_format == 'manifest':
+                manifest.write(k, extrinsic, intrinsic, r, i, image_ref)
+            elif not (done and packer is not None):
+                # a packed view's record lives in its shard
+                outputs.append(os.path.join(cam_folder, cam_name(r, i)))
+                with open(outputs[-1], 'w') as f:
+                    f.write(cam2str(extrinsic, intrinsic))
+            if export_formats and write_records:
+                exporter.write(extrinsic, image_ref if packer is not None else "blended_images/" + image)
+
+        # camera records are cheap and always rewritten, only the render is skipped
+        if done:
+            continue
+        if render_mode == 'animation':
+            pending.append((k, outputs))
+            continue
+        if tile_mode:
+            with timer.stage('render'):
+                for t in shard_tiles:
+                    path = tile_path(tile_folder, stem, t)
+                    if journal.done(f"tile-{k}-{t}", (locations[k], rotations[k])):
+                        continue
+                    set_border(render, grid[t], resolution_x, resolution_y)
+                    render.filepath = path
+                    bpy.ops.render.render(write_still=True)
+                    journal.record(f"tile-{k}-{t}", [path], (locations[k], rotations[k]))
+                clear_border(render)
+                render.filepath = img_folder
+            if args.shards == 1:
+                # sharded runs stitch once all workers are done, see scripts/tiles.py
+                paths = [tile_path(tile_folder, stem, t) for t in range(len(grid))]
+                with timer.stage('stitch'):
+                    outputs = stitch(paths, grid, resolution_x, resolution_y, outputs[0], color_depth, len(color_mode)) + outputs[1:]
+                for path in paths:
+                    os.remove(path)
+                with timer.stage('journal'):
+                    finish_view(k, outputs)
+            continue
+        if async_write:
+            with timer.stage('render'):
+                bpy.ops.render.render()
+            # journal finished writes first, write() raises once a write failed
+            for k_done, outputs_done in writer.done():
+                finish_view(k_done, outputs_done)
+            with timer.stage('queue'):
+                writer.write(outputs[0], viewer_pixels(), (k, outputs))
+            continue
+        with timer.stage('render'):
+            bpy.ops.render.render(write_still=True)
+        with timer.stage('journal'):
+            finish_view(k, outputs)
+    if render_mode == 'animation' and pending:
+        # one record for the whole ring, spread over its views in the summary
+        timer.start(f"ring-{j}", len(pending))
+        frames = [k for k, _ in pending]
+        with timer.stage('bake'):
+            bake_camera(cam.camera, locations[frames], rotations[frames])
+        image_file_output.file_slots[0].path = render.filepath + "frame-"
+        with timer.stage('render'):
+            render_frames(len(frames), keep_output=False)
+        with timer.stage('rename'):
+            rename_frames(render.filepath + "frame-", [outputs[0] for _, outputs in pending], render.file_extension)
+        with timer.stage('journal'):
+            for k, outputs in pending:
+                finish_view(k, outputs)
+        clear_animation(cam.camera)
+if async_write:
+    timer.start('drain', 0)
+    with timer.stage('queue'):
+        finished = writer.close()
+    for k_done, outputs_done in finished:
+        finish_view(k_done, outputs_done)
+    # failed views are not journaled, a resumed run renders them again
+    writer.check()
+if packer is not None:
+    for key_done, path in packer.close():
+        k_done = packed.pop(key_done)
+        journal.record(k_done, [path], (locations[k_done], rotations[k_done]))
+if journal.stale:
+    print(f"Resume: re-rendered {journal.stale} views journaled with a different pose")
+journal.close()
+write_summary(timer.close(), os.path.join(io_folder, f"{timing_name}-summary.json"))
+if cam_format == 'manifest':
+    manifest.close()
+if export_formats:
+    exporter.close()
@@ -0,0 +1,68 @@
+import os
+import bpy
+import tempfile
+import numpy as np
+
+# Render a whole pose plan with one animation render instead of one
+# render.render() per view. Poses are baked into keyframes with foreach_set,
+# the frame numbered outputs are renamed to the per view names afterwards.
+
+
+def bake_keys(obj, data_path, values, frame_start=1):
+    # values (N, C): one fcurve per channel, key k at frame frame_start + k
+    values = np.asarray(values, dtype=float).reshape(len(values), -1)
+    if obj.animation_data is None:
+        obj.animation_data_create()
+    if obj.animation_data.action is None:
+        obj.animation_data.action = bpy.data.actions.new(f"{obj.name}Plan")
+    fcurves = obj.animation_data.action.fcurves
+    frames = frame_start + np.arange(len(values), dtype=float)
+    for index in range(values.shape[1]):
+        fcurve = fcurves.find(data_path, index=index)
+        if fcurve is not None:
+            fcurves.remove(fcurve)
+        fcurve = fcurves.new(data_path, index=index)
+        fcurve.keyframe_points.add(len(values))
+        fcurve.keyframe_points.foreach_set('co', np.stack([frames, values[:, index]], axis=1).ravel())
+        # constant interpolation, nothing moves between two views
+        fcurve.keyframe_points.foreach_set('interpolation', np.zeros(len(values), dtype=np.int32))
+        fcurve.update()
+
+
+def bake_camera(obj, locations, rotations, frame_start=1):
+    # rotations are XYZ euler angles in degrees like Camera.set_camera()
+    obj.rotation_mode = 'XYZ'
+    bake_keys(obj, 'location', locations, frame_start)
+    bake_keys(obj, 'rotation_euler', np.radians(rotations), frame_start)
+
+
+def clear_animation(obj):
+    if obj.animation_data is not None and obj.animation_data.action is not None:
+        action = obj.animation_data.action
+        obj.animation_data.action = None
+        bpy.data.actions.remove(action)
+
+
+def render_frames(n, frame_start=1, keep_output=True):
+    # keep_output=False is for scenes whose images come from File Output nodes:
+    # the main output frames go to a temporary folder that is removed afterwards
+    scene = bpy.context.scene
+    scene.frame_start = frame_start
+    scene.frame_end = frame_start + n - 1
+    if keep_output:
+        bpy.ops.render.render(animation=True)
+    else:
+        filepath = scene.render.filepath
+        with tempfile.TemporaryDirectory() as folder:
+            scene.render.filepath = os.path.join(folder, "")
+            try:
+                bpy.ops.render.render(animation=True)
+            finally:
+                scene.render.filepath = filepath
+    scene.frame_set(frame_start)
+
+
+def rename_frames(prefix, names, ext, frame_start=1):
+    # prefix0001.ext, prefix0002.ext, ... -> names
+    for k, name in enumerate(names):
+        os.replace(f"{prefix}{frame_start + k:04d}{ext}", name)
@@ -0,0 +1,337 @@
+# Rendering benchmark on procedural scenes, no external assets needed.
+#
+# Run with plain python the script builds a forest of instanced trees in a
+# headless Blender for every case of a suite, saved as a .blend (and an OBJ),
+# and renders it with the real pipeline: forest.py on the .blend for the
+# image, scripts/example.py on the OBJ for the passes. Both time their views
+# with scripts/timing.py, the summaries of all cases are written to one JSON
+# file, --compare prints the throughput change between two of them.
+#
+# Example:
+# python scripts/benchmark.py --suite default --results bench.json
+# python scripts/benchmark.py --compare bench-old.json bench.json
+# blender --background --factory-startup --python scripts/benchmark.py -- --case '{"engine": "CYCLES"}' --blend scene.blend
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import itertools
+import subprocess
+import tempfile
+import numpy as np
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+scripts_folder = os.path.dirname(os.path.abspath(__file__))
+forest_script = os.path.join(os.path.dirname(scripts_folder), "forest.py")
+example_script = os.path.join(scripts_folder, "example.py")
+
+# engines that render on a CPU only machine, and the outputs each can write
+engine_outputs = {
+    'BLENDER_WORKBENCH': ('image', 'depth'),
+    'CYCLES': ('image', 'depth', 'normal', 'albedo', 'id'),
+}
+
+default_case = {
+    'script': 'forest', # forest.py renders the image only, example.py the image and the passes
+    'engine': 'BLENDER_WORKBENCH',
+    'trees': 64,
+    'triangles': 2000, # per tree
+    'textured': False,
+    'resolution': [640, 360],
+    'outputs': ['image'],
+    'views': 8,
+    'samples': 16, # Cycles only
+    'seed': 0,
+}
+
+suites = {
+    'smoke': {
+        'script': ['forest', 'example'],
+        'engine': ['BLENDER_WORKBENCH', 'CYCLES'],
+        'trees': [16],
+        'triangles': [500],
+        'textured': [False],
+        'resolution': [[320, 180]],
+        'outputs': [['image'], ['image', 'depth', 'id']],
+        'views': [2],
+    },
+    'default': {
+        'script': ['forest', 'example'],
+        'engine': ['BLENDER_WORKBENCH', 'CYCLES'],
+        'trees': [64, 1024],
+        'triangles': [2000],
+        'textured': [False, True],
+        'resolution': [[640, 360], [1280, 720]],
+        'outputs': [['image'], ['image', 'depth', 'normal', 'albedo', 'id']],
+        'views': [8],
+    },
+    'scaling': {
+        'engine': ['BLENDER_WORKBENCH', 'CYCLES'],
+        'trees': [16, 256, 4096],
+        'triangles': [500, 8000],
+        'textured': [True],
+        'resolution': [[640, 360]],
+        'outputs': [['image']],
+        'views': [8],
+    },
+}
+
+
+def suite_cases(suite):
+    keys = list(suite)
+    names = set()
+    for values in itertools.product(*[suite[k] for k in keys]):
+        case = {**default_case, **dict(zip(keys, values))}
+        # passes the engine or the script can not write are dropped, the case still runs
+        case['outputs'] = [o for o in case['outputs'] if o in engine_outputs[case['engine']]]
+        if case['script'] == 'forest':
+            case['outputs'] = ['image']
+        elif len(case['outputs']) < 2:
+            # example.py is there for the passes
+            continue
+        else:
+            # example.py renders square frames
+            case['resolution'] = [case['resolution'][0]] * 2
+        if case_name(case) not in names:
+            names.add(case_name(case))
+            yield case
+
+
+def case_name(case):
+    return (f"{case['script']}-{case['engine'].lower()}-{case['trees']}x{case['triangles']}"
+        f"{'-tex' if case['textured'] else ''}-{case['resolution'][0]}x{case['resolution'][1]}"
+        f"-{'+'.join(case['outputs'])}-{case['views']}v")
+
+
+def version_info():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=root,
+            capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'commit': commit,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+        'system': platform.platform(),
+        'python': platform.python_version(),
+    }
+
+
+# Blender side
+
+
+def clear_scene():
+    for obj in list(bpy.data.objects):
+        if obj.type == 'MESH':
+            bpy.data.objects.remove(obj, do_unlink=True)
+    for mesh in list(bpy.data.meshes):
+        bpy.data.meshes.remove(mesh)
+
+
+def tree_mesh(triangles, textured):
+    # a trunk cylinder and a UV sphere crown with about `triangles` triangles
+    segments = max(4, int(np.sqrt(triangles)))
+    bpy.ops.mesh.primitive_cylinder_add(vertices=8, radius=0.2, depth=2, location=(0, 0, 1))
+    trunk = bpy.context.active_object
+    bpy.ops.mesh.primitive_uv_sphere_add(segments=segments, ring_count=max(3, segments // 2),
+        radius=1.2, location=(0, 0, 3))
+    crown = bpy.context.active_object
+    trunk.select_set(True)
+    bpy.ops.object.join()
+    mesh = crown.data
+    mesh.materials.append(tree_material(textured))
+    bpy.data.objects.remove(crown, do_unlink=True)
+    return mesh
+
+
+def tree_material(textured):
+    material = bpy.data.materials.new("Tree")
+    material.use_nodes = True
+    bsdf = material.node_tree.nodes['Principled BSDF']
+    if textured:
+        # generated UV grid, no image files needed
+        image = bpy.data.images.new("Grid", 1024, 1024)
+        image.generated_type = 'UV_GRID'
+        texture = material.node_tree.nodes.new('ShaderNodeTexImage')
+        texture.image = image
+        material.node_tree.links.new(texture.outputs['Color'], bsdf.inputs['Base Color'])
+    else:
+        bsdf.inputs['Base Color'].default_value = (0.1, 0.4, 0.1, 1)
+    return material
+
+
+def build_scene(case):
+    # trees share one mesh and are scattered on a square ground plane
+    rng = np.random.default_rng(case['seed'])
+    clear_scene()
+    mesh = tree_mesh(case['triangles'], case['textured'])
+    extent = 2. * np.sqrt(case['trees'])
+    bpy.ops.mesh.primitive_plane_add(size=2 * extent)
+    locations = rng.uniform(-extent, extent, (case['trees'], 2))
+    angles = rng.uniform(0, 2 * np.pi, case['trees'])
+    scales = rng.uniform(0.8, 1.2, case['trees'])
+    collection = bpy.context.scene.collection
+    for t in range(case['trees']):
+        obj = bpy.data.objects.new(f"Tree{t:05d}", mesh)
+        obj.location = (locations[t, 0], locations[t, 1], 0)
+        obj.rotation_euler[2] = angles[t]
+        obj.scale = (scales[t],) * 3
+        obj.pass_index = t + 1
+        collection.objects.link(obj)
+    mesh.calc_loop_triangles()
+    return {
+        'objects': case['trees'] + 1,
+        'triangles': case['trees'] * len(mesh.loop_triangles) + 2,
+        'extent': float(extent),
+    }
+
+
+def setup_scene(case):
+    # engine settings saved with the .blend, forest.py keeps what it does not set
+    scene = bpy.context.scene
+    if case['engine'] == 'CYCLES':
+        scene.cycles.device = 'CPU'
+        scene.cycles.samples = case['samples']
+        scene.cycles.seed = case['seed']
+        scene.cycles.use_denoising = False
+    else:
+        scene.display.shading.color_type = 'TEXTURE' if case['textured'] else 'MATERIAL'
+    # forest.py drives the light named 'Sun'
+    light = next(obj for obj in scene.objects if obj.type == 'LIGHT')
+    light.name = light.data.name = 'Sun'
+    light.data.type = 'SUN'
+
+
+def save_case(case, blend, obj=''):
+    # build the scene of a case, save it as a .blend for forest.py and
+    # optionally as an OBJ for example.py, generated textures are packed into
+    # the .blend only
+    begin = time.perf_counter()
+    info = build_scene(case)
+    setup_scene(case)
+    bpy.ops.file.pack_all()
+    bpy.ops.wm.save_as_mainfile(filepath=blend)
+    if obj:
+        bpy.ops.export_scene.obj(filepath=obj, use_materials=True)
+    info['build'] = time.perf_counter() - begin
+    info['blender'] = bpy.app.version_string
+    return info
+
+
+# Driver side
+
+
+def script_command(case, blender, blend, obj, folder, extent, threads=0):
+    # command line of the script a case times, and the summary it writes
+    if case['script'] == 'forest':
+        command = [blender, blend, '--background', '--python', forest_script, '--',
+            '--io_folder', folder, '--views', str(case['views']), '--radius', str(1.5 * extent),
+            '--target', '0', '0', '2', '--resolution', *[str(r) for r in case['resolution']],
+            '--engine', case['engine'], '--threads', str(threads)]
+        return command, os.path.join(folder, "timings-summary.json")
+    # example.py renders square frames of the first resolution, it writes the
+    # image itself and the passes through --outputs. The image stays 8 bit like
+    # in production, the ID pass is 16 bit so more than 255 trees do not wrap
+    passes = [o for o in case['outputs'] if o != 'image']
+    command = [blender, '--background', '--factory-startup', '--python', example_script, '--',
+        obj, '--output_folder', folder, '--views', str(case['views']),
+        '--resolution', str(case['resolution'][0]), '--outputs', *passes,
+        '--engine', case['engine'], '--samples', str(case['samples'] if case['engine'] == 'CYCLES' else 0),
+        '--color_depth', '8', '--id_color_depth', '16', '--threads', str(threads)]
+    model_identifier = os.path.basename(os.path.dirname(obj))
+    return command, os.path.join(folder, model_identifier, "timings-summary.json")
+
+
+def run_case(case, blender='blender', threads=0):
+    name = case_name(case)
+    with tempfile.TemporaryDirectory() as folder:
+        scene_folder = os.path.join(folder, "scene")
+        output_folder = os.path.join(folder, "output")
+        os.makedirs(scene_folder)
+        os.makedirs(output_folder)
+        blend = os.path.join(scene_folder, "scene.blend")
+        obj = os.path.join(scene_folder, "scene.obj") if case['script'] == 'example' else ''
+        info_path = os.path.join(scene_folder, "scene.json")
+        command = [blender, '--background', '--factory-startup', '--python', os.path.abspath(__file__), '--',
+            '--case', json.dumps(case), '--blend', blend, '--obj', obj, '--result', info_path]
+        process = subprocess.run(command, capture_output=True, text=True)
+        if process.returncode != 0 or not os.path.isfile(info_path):
+            print(f"{name}: scene failed\n{process.stdout[-2000:]}{process.stderr[-2000:]}")
+            return {'name': name, 'case': case, 'error': process.returncode or 1}
+        with open(info_path, 'r') as f:
+            info = json.load(f)
+        command, summary_path = script_command(case, blender, blend, obj, output_folder, info['extent'], threads)
+        process = subprocess.run(command, capture_output=True, text=True)
+        if process.returncode != 0 or not os.path.isfile(summary_path):
+            print(f"{name}: {case['script']} failed\n{process.stdout[-2000:]}{process.stderr[-2000:]}")
+            return {'name': name, 'case': case, 'scene': info, 'error': process.returncode or 1}
+        with open(summary_path, 'r') as f:
+            summary = json.load(f)
+    return {
+        'name': name,
+        'case': case,
+        'scene': info,
+        'blender': info['blender'],
+        'summary': summary,
+    }
+
+
+def run_suite(cases, blender='blender', threads=0):
+    results = []
+    for case in cases:
+        result = run_case(case, blender, threads)
+        if 'summary' in result:
+            summary = result['summary']
+            print(f"{result['name']}: {summary['throughput']:.3f} views/s, "
+                f"{summary['stages']['total']['wall']['p50']:.3f} s p50")
+        results.append(result)
+    return results
+
+
+def compare(old_path, new_path):
+    with open(old_path, 'r') as f:
+        old = {r['name']: r for r in json.load(f)['results'] if 'summary' in r}
+    with open(new_path, 'r') as f:
+        new = {r['name']: r for r in json.load(f)['results'] if 'summary' in r}
+    for name in sorted(set(old) & set(new)):
+        a, b = old[name]['summary']['throughput'], new[name]['summary']['throughput']
+        print(f"{name:<64}{a:>10.3f}{b:>10.3f}{b / a - 1 if a > 0 else 0.:>+10.1%}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rendering benchmark on procedural scenes')
+    parser.add_argument('--suite', default='smoke', choices=sorted(suites), help='grid of cases to run')
+    parser.add_argument('--results', default='benchmark.json', help='results file of the suite')
+    parser.add_argument('--blender', default='blender', help='Blender executable')
+    parser.add_argument('-t', '--threads', type=int, default=0, help='render threads, 0 for auto')
+    parser.add_argument('--compare', nargs=2, default=None, help='print the throughput change between two results files')
+    parser.add_argument('--case', default='', help='JSON case to build inside Blender')
+    parser.add_argument('--blend', default='scene.blend', help='.blend file the case is saved to')
+    parser.add_argument('--obj', default='', help='also export the case to this OBJ file')
+    parser.add_argument('--result', default='', help='scene info file of --case')
+    if bpy is not None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+        args = parser.parse_args(argv)
+        info = save_case({**default_case, **json.loads(args.case or '{}')},
+            os.path.abspath(args.blend), os.path.abspath(args.obj) if args.obj else '')
+        with open(args.result or 'benchmark-scene.json', 'w') as f:
+            json.dump(info, f, indent=4)
+    else:
+        args = parser.parse_args(sys.argv[1:])
+        if args.compare:
+            compare(*args.compare)
+            sys.exit(0)
+        results = run_suite(suite_cases(suites[args.suite]), args.blender, args.threads)
+        with open(args.results, 'w') as f:
+            json.dump({'version': version_info(), 'suite': args.suite, 'results': results}, f, indent=4)
+        sys.exit(sum('error' in r for r in results))
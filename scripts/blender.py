@@ -1,5 +1,9 @@
 import bpy
-import os, math
+import os, sys, math
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from preprocess import clean_objects
+from passes import setup_outputs
 
 # Set up
 format = "OPEN_EXR"
@@ -9,6 +13,7 @@ depth_scale = 1.4
 views = 5
 remove_doubles = True
 edge_split = True
+outputs = ['depth', 'normal', 'albedo', 'id']
 
 context = bpy.context
 scene = bpy.context.scene
@@ -23,97 +28,7 @@ render.resolution_y = 720
 render.resolution_percentage = 100
 render.film_transparent = True
 
-scene.use_nodes = True
-scene.view_layers["ViewLayer"].use_pass_normal = True
-scene.view_layers["ViewLayer"].use_pass_diffuse_color = True
-scene.view_layers["ViewLayer"].use_pass_object_index = True
-
-nodes = bpy.context.scene.node_tree.nodes
-links = bpy.context.scene.node_tree.links
-
-# Clear default nodes
-for n in nodes:
-    nodes.remove(n)
-
-render_layers = nodes.new('CompositorNodeRLayers')
-
-# Create depth output nodes
-depth_file_output = nodes.new(type="CompositorNodeOutputFile")
-depth_file_output.label = 'Depth Output'
-depth_file_output.base_path = ''
-depth_file_output.file_slots[0].use_node_format = True
-depth_file_output.format.file_format = format
-depth_file_output.format.color_depth = color_depth
-if format == 'OPEN_EXR':
-    links.new(render_layers.outputs['Depth'], depth_file_output.inputs[0])
-else:
-    depth_file_output.format.color_mode = "BW"
-
-    # Remap as other types can not represent the full range of depth.
-    map = nodes.new(type="CompositorNodeMapValue")
-    # Size is chosen kind of arbitrarily, try out until you're satisfied with resulting depth map.
-    map.offset = [-0.7]
-    map.size = [depth_scale]
-    map.use_min = True
-    map.min = [0]
-
-    links.new(render_layers.outputs['Depth'], map.inputs[0])
-    links.new(map.outputs[0], depth_file_output.inputs[0])
-
-# Create normal output nodes
-scale_node = nodes.new(type="CompositorNodeMixRGB")
-scale_node.blend_type = "MULTIPLY"
-# scale_node.use_alpha = True
-scale_node.inputs[2].default_value = (0.5, 0.5, 0.5, 1)
-links.new(render_layers.outputs['Normal'], scale_node.inputs[1])
-
-bias_node = nodes.new(type="CompositorNodeMixRGB")
-bias_node.blend_type = 'ADD'
-# bias_node.use_alpha = True
-bias_node.inputs[2].default_value = (0.5, 0.5, 0.5, 0)
-links.new(scale_node.outputs[0], bias_node.inputs[1])
-
-normal_file_output = nodes.new(type="CompositorNodeOutputFile")
-normal_file_output.label = 'Normal Output'
-normal_file_output.base_path = ''
-normal_file_output.file_slots[0].use_node_format = True
-normal_file_output.format.file_format = format
-links.new(bias_node.outputs[0], normal_file_output.inputs[0])
-
-# Create albedo output nodes
-alpha_albedo = nodes.new(type="CompositorNodeSetAlpha")
-links.new(render_layers.outputs['DiffCol'], alpha_albedo.inputs['Image'])
-links.new(render_layers.outputs['Alpha'], alpha_albedo.inputs['Alpha'])
-
-albedo_file_output = nodes.new(type="CompositorNodeOutputFile")
-albedo_file_output.label = 'Albedo Output'
-albedo_file_output.base_path = ''
-albedo_file_output.file_slots[0].use_node_format = True
-albedo_file_output.format.file_format = format
-albedo_file_output.format.color_mode = 'RGBA'
-albedo_file_output.format.color_depth = color_depth
-links.new(alpha_albedo.outputs['Image'], albedo_file_output.inputs[0])
-
-# Create id map output nodes
-id_file_output = nodes.new(type="CompositorNodeOutputFile")
-id_file_output.label = 'ID Output'
-id_file_output.base_path = ''
-id_file_output.file_slots[0].use_node_format = True
-id_file_output.format.file_format = format
-id_file_output.format.color_depth = color_depth
-
-if format == 'OPEN_EXR':
-    links.new(render_layers.outputs['IndexOB'], id_file_output.inputs[0])
-else:
-    id_file_output.format.color_mode = 'BW'
-
-    divide_node = nodes.new(type='CompositorNodeMath')
-    divide_node.operation = 'DIVIDE'
-    divide_node.use_clamp = False
-    divide_node.inputs[1].default_value = 2**int(color_depth)
-
-    links.new(render_layers.outputs['IndexOB'], divide_node.inputs[0])
-    links.new(divide_node.outputs[0], id_file_output.inputs[0])
+file_outputs = setup_outputs(outputs, format, color_depth, depth_scale, view_layer=scene.view_layers["ViewLayer"])
 
 # Delete default cube
 context.active_object.select_set(True)
@@ -129,24 +44,20 @@ obj = bpy.context.selected_objects[0] #need reload all scenes
 context.view_layer.objects.active = obj
 
 # Possibly disable specular shading
-for slot in obj.material_slots:
-    node = slot.material.node_tree.nodes['Principled BSDF']
-    node.inputs['Specular'].default_value = 0.05
+for selected in bpy.context.selected_objects:
+    for slot in selected.material_slots:
+        node = slot.material.node_tree.nodes['Principled BSDF']
+        node.inputs['Specular'].default_value = 0.05
 
 if scale != 1:
     bpy.ops.transform.resize(value=(scale,scale,scale))
     bpy.ops.object.transform_apply(scale=True)
-if remove_doubles:
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.remove_doubles()
-    bpy.ops.object.mode_set(mode='OBJECT')
-if edge_split:
-    bpy.ops.object.modifier_add(type='EDGE_SPLIT')
-    context.object.modifiers["EdgeSplit"].split_angle = 1.32645
-    bpy.ops.object.modifier_apply(modifier="EdgeSplit")
+if remove_doubles or edge_split:
+    clean_objects(bpy.context.selected_objects, remove_doubles, edge_split, split_angle=1.32645)
 
 # Set objekt IDs
-obj.pass_index = 1
+for selected in bpy.context.selected_objects:
+    selected.pass_index = 1
 
 # Make light just directional, disable shadows.
 light = bpy.data.lights['Light']
@@ -195,10 +106,8 @@ for i in range(0, views):
     render_file_path = fp + '_r_{0:03d}'.format(int(i * stepsize))
 
     scene.render.filepath = render_file_path
-    depth_file_output.file_slots[0].path = render_file_path + "_depth"
-    normal_file_output.file_slots[0].path = render_file_path + "_normal"
-    albedo_file_output.file_slots[0].path = render_file_path + "_albedo"
-    id_file_output.file_slots[0].path = render_file_path + "_id"
+    for name, node in file_outputs.items():
+        node.file_slots[0].path = render_file_path + "_" + name
 
     bpy.ops.render.render(write_still=True)  # render still
 
@@ -1,19 +1,31 @@
 import bpy
-import os, math
+import os, sys, math
 
-def import_obj(io_folder=""):
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from cache import cache_path, load_scene, save_scene
+from preprocess import clean_objects
+from passes import setup_outputs, set_depth_range
+from depth import object_bounds, camera_record
+from manifest import cam2str
+
+def import_obj(io_folder="", cache=""):
 
     bpy.context.active_object.select_set(True)
     bpy.ops.object.delete()
 
+    if cache and os.path.isfile(cache):
+        load_scene(cache)
+        return True
     obj_path = os.path.join(io_folder, "scene.obj")
     bpy.ops.import_scene.obj(filepath=obj_path)
+    return False
 
 def main(
     io_folder="D:/Mesh/blender/small", load=True,
     format="OPEN_EXR", x=1280, y=720, 
     depth=True, normal=False, albedo=False,
-    camera_location=(0, 2, -3), views=5
+    camera_location=(0, 2, -3), views=5, cache=True,
+    depth_codec="map"
 ):
     if format == "PNG":
         color_depth = "8"
@@ -38,122 +50,42 @@ def main(
     render.resolution_percentage = 100
     render.film_transparent = True
 
-    scene.use_nodes = True
-    scene.view_layers["ViewLayer"].use_pass_normal = True
-    scene.view_layers["ViewLayer"].use_pass_diffuse_color = True
-    scene.view_layers["ViewLayer"].use_pass_object_index = True
-
-    nodes = bpy.context.scene.node_tree.nodes
-    links = bpy.context.scene.node_tree.links
-
-    # Clear default nodes
-    for n in nodes:
-        nodes.remove(n)
-
-    render_layers = nodes.new('CompositorNodeRLayers')
-
-    if depth:
-        depth_file_output = nodes.new(type="CompositorNodeOutputFile")
-        depth_file_output.label = 'Depth Output'
-        depth_file_output.base_path = ''
-        depth_file_output.file_slots[0].use_node_format = True
-        depth_file_output.format.file_format = format
-        depth_file_output.format.color_depth = color_depth
-        if format == 'OPEN_EXR':
-            links.new(render_layers.outputs['Depth'], depth_file_output.inputs[0])
-        else:
-            depth_file_output.format.color_mode = "BW"
-
-            # Remap as other types can not represent the full range of depth.
-            map = nodes.new(type="CompositorNodeMapValue")
-            #TODO Size is chosen kind of arbitrarily, try out until you're satisfied with resulting depth map.
-            map.offset = [-0.7]
-            map.size = [depth_scale]
-            map.use_min = True
-            map.min = [0]
-
-            links.new(render_layers.outputs['Depth'], map.inputs[0])
-            links.new(map.outputs[0], depth_file_output.inputs[0])
-    
-    if normal:
-        scale_node = nodes.new(type="CompositorNodeMixRGB")
-        scale_node.blend_type = "MULTIPLY"
-        # scale_node.use_alpha = True
-        scale_node.inputs[2].default_value = (0.5, 0.5, 0.5, 1)
-        links.new(render_layers.outputs['Normal'], scale_node.inputs[1])
-
-        bias_node = nodes.new(type="CompositorNodeMixRGB")
-        bias_node.blend_type = 'ADD'
-        # bias_node.use_alpha = True
-        bias_node.inputs[2].default_value = (0.5, 0.5, 0.5, 0)
-        links.new(scale_node.outputs[0], bias_node.inputs[1])
-
-        normal_file_output = nodes.new(type="CompositorNodeOutputFile")
-        normal_file_output.label = 'Normal Output'
-        normal_file_output.base_path = ''
-        normal_file_output.file_slots[0].use_node_format = True
-        normal_file_output.format.file_format = format
-        links.new(bias_node.outputs[0], normal_file_output.inputs[0])
-    
-    if albedo:
-        alpha_albedo = nodes.new(type="CompositorNodeSetAlpha")
-        links.new(render_layers.outputs['DiffCol'], alpha_albedo.inputs['Image'])
-        links.new(render_layers.outputs['Alpha'], alpha_albedo.inputs['Alpha'])
-
-        albedo_file_output = nodes.new(type="CompositorNodeOutputFile")
-        albedo_file_output.label = 'Albedo Output'
-        albedo_file_output.base_path = ''
-        albedo_file_output.file_slots[0].use_node_format = True
-        albedo_file_output.format.file_format = format
-        albedo_file_output.format.color_mode = 'RGBA'
-        albedo_file_output.format.color_depth = color_depth
-        links.new(alpha_albedo.outputs['Image'], albedo_file_output.inputs[0])
-    
-    id_file_output = nodes.new(type="CompositorNodeOutputFile")
-    id_file_output.label = 'ID Output'
-    id_file_output.base_path = ''
-    id_file_output.file_slots[0].use_node_format = True
-    id_file_output.format.file_format = format
-    id_file_output.format.color_depth = color_depth
-
-    if format == 'OPEN_EXR':
-        links.new(render_layers.outputs['IndexOB'], id_file_output.inputs[0])
-    else:
-        id_file_output.format.color_mode = 'BW'
-
-        divide_node = nodes.new(type='CompositorNodeMath')
-        divide_node.operation = 'DIVIDE'
-        divide_node.use_clamp = False
-        divide_node.inputs[1].default_value = 2**int(color_depth)
-
-        links.new(render_layers.outputs['IndexOB'], divide_node.inputs[0])
-        links.new(divide_node.outputs[0], id_file_output.inputs[0])
-
-    # Load scene obj
+    outputs = [name for name, on in [('depth', depth), ('normal', normal), ('albedo', albedo), ('id', True)] if on]
+    file_outputs = setup_outputs(outputs, format, color_depth, depth_scale, view_layer=scene.view_layers["ViewLayer"],
+        depth_codec=depth_codec)
+    # "linear" writes 16 bit PNG depth between per view bounds stored in <view>_cam.txt,
+    # it needs File Output color management overrides and turns off dithering, also of the image
+    linear_depth = depth and depth_codec == "linear" and format != "OPEN_EXR"
+
+    # Load scene obj, from the prepared scene cache if possible
+    cached = False
     if load:
-        import_obj(io_folder)
+        cache_file = cache_path(os.path.join(io_folder, "scene.obj"), scale=scale,
+            remove_doubles=remove_doubles, edge_split=edge_split) if cache else ""
+        cached = import_obj(io_folder, cache_file)
     obj = bpy.context.selected_objects[0]
     context.view_layer.objects.active = obj
 
-    # Possibly disable specular shading
-    for slot in obj.material_slots:
-        node = slot.material.node_tree.nodes['Principled BSDF']
-        node.inputs['Specular'].default_value = 0.05
-
-    if scale != 1:
-        bpy.ops.transform.resize(value=(scale,scale,scale))
-        bpy.ops.object.transform_apply(scale=True)
-    if remove_doubles:
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.remove_doubles()
-        bpy.ops.object.mode_set(mode='OBJECT')
-    if edge_split:
-        bpy.ops.object.modifier_add(type='EDGE_SPLIT')
-        context.object.modifiers["EdgeSplit"].split_angle = 1.32645
-        bpy.ops.object.modifier_apply(modifier="EdgeSplit")
-    
-    # Set objekt IDs
-    obj.pass_index = 1
+    if not cached:
+        # Possibly disable specular shading
+        for selected in bpy.context.selected_objects:
+            for slot in selected.material_slots:
+                node = slot.material.node_tree.nodes['Principled BSDF']
+                node.inputs['Specular'].default_value = 0.05
+
+        if scale != 1:
+            bpy.ops.transform.resize(value=(scale,scale,scale))
+            bpy.ops.object.transform_apply(scale=True)
+        if remove_doubles or edge_split:
+            clean_objects(bpy.context.selected_objects, remove_doubles, edge_split, split_angle=1.32645)
+
+        # Set objekt IDs
+        for selected in bpy.context.selected_objects:
+            selected.pass_index = 1
+        if load and cache:
+            save_scene(cache_file, bpy.context.selected_objects)
+    if linear_depth:
+        bounds = object_bounds(bpy.context.selected_objects)
 
     # Make light just directional, disable shadows.
     light = bpy.data.lights['Light']
@@ -195,6 +127,8 @@ def main(
 
     model_identifier = os.path.split(os.path.split(io_folder)[0])[1]
     fp = os.path.join(os.path.abspath(io_folder), model_identifier, model_identifier)
+    if linear_depth:
+        os.makedirs(os.path.dirname(fp), exist_ok=True)
 
     # Render and output
     for i in range(0, views):
@@ -203,13 +137,14 @@ def main(
         render_file_path = fp + '_r_{0:03d}'.format(int(i * stepsize))
 
         scene.render.filepath = render_file_path
-        if depth:
-            depth_file_output.file_slots[0].path = render_file_path + "_depth"
-        if normal:
-            normal_file_output.file_slots[0].path = render_file_path + "_normal"
-        if albedo:
-            albedo_file_output.file_slots[0].path = render_file_path + "_albedo"
-        id_file_output.file_slots[0].path = render_file_path + "_id"
+        for name, node in file_outputs.items():
+            node.file_slots[0].path = render_file_path + "_" + name
+        if linear_depth:
+            context.view_layer.update()
+            extrinsic, intrinsic, near_far = camera_record(cam, render, bounds)
+            set_depth_range(*near_far)
+            with open(render_file_path + "_cam.txt", 'w') as f:
+                f.write(cam2str(extrinsic, intrinsic, near_far))
 
         bpy.ops.render.render(write_still=True)  # render still
 
@@ -0,0 +1,94 @@
+import os
+import re
+import json
+import hashlib
+import bpy
+
+from preprocess import version as preprocess_version
+
+# Cache of fully prepared scenes. The imported and preprocessed objects are
+# written to a .blend keyed by the OBJ/MTL/texture contents, the
+# preprocessing options and the version of scripts/preprocess.py, and
+# appended back instead of re-importing.
+
+chunk_size = 1 << 20
+# statement options of a texture map and their arguments, the path is what follows
+map_options = re.compile(r'^(?:-\w+(?:\s+(?:[-+]?[\d.]+(?:[eE][-+]?\d+)?|on|off|[rgbmlz](?=\s)))*\s+)*')
+map_statements = ('map_', 'bump', 'disp', 'decal', 'refl')
+
+
+def file_hash(path, digest):
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+
+
+def statement_paths(folder, rest):
+    # the rest of the line as one path, paths may hold spaces, else a list of paths
+    path = os.path.join(folder, rest)
+    if os.path.isfile(path):
+        return [path]
+    return [os.path.join(folder, p) for p in rest.split()]
+
+
+def scene_files(obj_path):
+    # the OBJ, its material libraries and every texture they reference
+    folder = os.path.dirname(obj_path)
+    mtls = []
+    with open(obj_path, 'r', errors='ignore') as f:
+        for line in f:
+            if line.startswith('mtllib'):
+                rest = line[len('mtllib'):].strip()
+                if rest:
+                    mtls += statement_paths(folder, rest)
+    if not mtls and os.path.isfile(os.path.splitext(obj_path)[0] + '.mtl'):
+        mtls = [os.path.splitext(obj_path)[0] + '.mtl']
+    files = [obj_path]
+    for mtl in mtls:
+        if not os.path.isfile(mtl):
+            continue
+        files.append(mtl)
+        textures = set()
+        with open(mtl, 'r', errors='ignore') as f:
+            for line in f:
+                parts = line.split(None, 1)
+                if len(parts) == 2 and parts[0].startswith(map_statements):
+                    textures.add(map_options.sub('', parts[1].strip(), count=1))
+        for texture in sorted(textures):
+            path = os.path.join(os.path.dirname(mtl), texture)
+            if os.path.isfile(path):
+                files.append(path)
+    return files
+
+
+def scene_key(obj_path, **options):
+    digest = hashlib.sha1(json.dumps({**options, 'preprocess': preprocess_version}, sort_keys=True).encode())
+    for path in scene_files(obj_path):
+        digest.update(os.path.relpath(path, os.path.dirname(obj_path)).encode())
+        file_hash(path, digest)
+    return digest.hexdigest()
+
+
+def cache_path(obj_path, **options):
+    folder = os.path.join(os.path.dirname(obj_path), ".cache")
+    return os.path.join(folder, f"scene-{scene_key(obj_path, **options)[:16]}.blend")
+
+
+def load_scene(path):
+    # append the cached objects to the current scene and select them
+    with bpy.data.libraries.load(path, link=False) as (data_from, data_to):
+        data_to.objects = data_from.objects
+    bpy.ops.object.select_all(action='DESELECT')
+    for obj in data_to.objects:
+        bpy.context.scene.collection.objects.link(obj)
+        obj.select_set(True)
+    bpy.context.view_layer.objects.active = data_to.objects[0]
+    return data_to.objects
+
+
+def save_scene(path, objects):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write to a temporary file so a killed job never leaves a half written cache entry
+    temp_path = os.path.splitext(path)[0] + ".tmp.blend"
+    bpy.data.libraries.write(temp_path, set(objects), fake_user=True)
+    os.replace(temp_path, path)
@@ -0,0 +1,129 @@
+import numpy as np
+
+from pose import invert_pose, pose2mtx, sphere_batch, track_batch, pose_batch
+from sampling import sample_sphere
+from export import gl2cv
+
+# Predicted scene coverage of candidate poses, scored before anything is
+# rendered. A subsample of scene vertices is projected through every pose at
+# once; coverage is the fraction of cells of a coarse screen grid that hold a
+# projected vertex. Poses below the threshold are resampled on their radius.
+
+
+def subsample(points, n=20000, rng=None):
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    if len(points) <= n:
+        return points
+    rng = rng if rng is not None else np.random.default_rng(0)
+    return points[np.sort(rng.choice(len(points), n, replace=False))]
+
+
+def object_points(objects, n=20000, rng=None):
+    # world space vertices of Blender mesh objects, about n of them
+    counts = np.array([len(obj.data.vertices) for obj in objects])
+    rng = rng if rng is not None else np.random.default_rng(0)
+    fraction = min(1., n / max(counts.sum(), 1))
+    points = []
+    for obj, count in zip(objects, counts):
+        co = np.empty(count * 3)
+        obj.data.vertices.foreach_get('co', co)
+        co = co.reshape(-1, 3)[rng.random(count) < fraction]
+        matrix = np.array(obj.matrix_world)
+        points.append(co @ matrix[:3, :3].T + matrix[:3, 3])
+    return np.concatenate(points) if points else np.zeros((0, 3))
+
+
+def score_poses(points, extrinsics, intrinsic, width, height, grid=(32, 18), near=1e-3, chunk=64):
+    # (N, 4, 4) camera 2 world extrinsics -> per pose coverage, fraction of the
+    # points in view and 10th / 50th percentile camera space depth of those
+    world2cam = gl2cv @ invert_pose(extrinsics)
+    n = len(world2cam)
+    cells = grid[0] * grid[1]
+    scores = {
+        'coverage': np.zeros(n),
+        'visible': np.zeros(n),
+        'depth_near': np.full(n, np.inf),
+        'depth_median': np.full(n, np.inf),
+    }
+    if len(points) == 0:
+        return scores
+    intrinsic = np.asarray(intrinsic, dtype=float)
+    for start in range(0, n, chunk):
+        mtx = world2cam[start:start + chunk]
+        cam = np.einsum('nij,pj->npi', mtx[:, :3, :3], points) + mtx[:, None, :3, 3]
+        z = cam[..., 2]
+        pixel = cam @ intrinsic.T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            u, v = pixel[..., 0] / z, pixel[..., 1] / z
+        inside = (z > near) & (u >= 0) & (u < width) & (v >= 0) & (v < height)
+        pose, point = np.nonzero(inside)
+        cell = ((v[pose, point] * grid[1] / height).astype(np.int64) * grid[0]
+            + (u[pose, point] * grid[0] / width).astype(np.int64))
+        occupied = np.bincount(pose * cells + cell, minlength=len(mtx) * cells).reshape(len(mtx), cells) > 0
+        stop = start + len(mtx)
+        scores['coverage'][start:stop] = occupied.mean(axis=1)
+        scores['visible'][start:stop] = inside.mean(axis=1)
+        depth = np.where(inside, z, np.nan)
+        seen = inside.any(axis=1)
+        if seen.any():
+            near_depth, median_depth = np.nanpercentile(depth[seen], [10, 50], axis=1)
+            scores['depth_near'][start:stop][seen] = near_depth
+            scores['depth_median'][start:stop][seen] = median_depth
+    return scores
+
+
+def accept_poses(scores, min_coverage=0.2, min_depth=0.):
+    return (scores['coverage'] >= min_coverage) & (scores['depth_near'] >= min_depth)
+
+
+def cull_poses(
+    target_location,
+    radius,
+    views,
+    points,
+    intrinsic,
+    width,
+    height,
+    min_coverage=0.2,
+    min_depth=0.,
+    tries=10,
+    rng=None,
+    grid=(32, 18),
+    sampler='cube',
+    min_elevation=-90.,
+    max_elevation=90.,
+    seed=None,
+):
+    # pose_batch() whose poses below min_coverage, or closer than min_depth to
+    # the scene, are redrawn on their radius up to `tries` times. The best
+    # candidate is kept, scores['accepted'] marks those meeting the thresholds.
+    # A seed draws the plan from per ring streams, rng then only draws the redraws.
+    locations, rotations, matrices = pose_batch(target_location, radius, views, rng, sampler, min_elevation, max_elevation, seed)
+    scores = score_poses(points, matrices, intrinsic, width, height, grid)
+    radii = np.repeat(np.asarray(radius, dtype=float).reshape(-1), views)
+    # a lattice sampler without rng would redraw the same points
+    redraw_rng = rng if rng is not None else np.random.default_rng()
+    for _ in range(tries):
+        rejected = np.flatnonzero(~accept_poses(scores, min_coverage, min_depth))
+        if not len(rejected):
+            break
+        if sampler == 'cube':
+            new_locations = sphere_batch(target_location, radii[rejected, None], len(rejected), redraw_rng)
+        else:
+            # the same slots of a fresh ring of the configured sampler, a
+            # stratified view is redrawn in its own cell, a Halton view with a new shift
+            directions = sample_sphere(sampler, views, redraw_rng, min_elevation, max_elevation)[rejected % views]
+            new_locations = np.asarray(target_location, dtype=float) + directions*radii[rejected, None]
+        new_rotations = track_batch(new_locations, target_location)
+        new_matrices = pose2mtx(new_locations, new_rotations)
+        new_scores = score_poses(points, new_matrices, intrinsic, width, height, grid)
+        # a redraw replaces the pose if it is accepted or covers more
+        better = accept_poses(new_scores, min_coverage, min_depth) | (new_scores['coverage'] > scores['coverage'][rejected])
+        replaced = rejected[better]
+        locations[replaced] = new_locations[better]
+        rotations[replaced] = new_rotations[better]
+        matrices[replaced] = new_matrices[better]
+        for key in scores:
+            scores[key][replaced] = new_scores[key][better]
+    scores['accepted'] = accept_poses(scores, min_coverage, min_depth)
+    return locations, rotations, matrices, scores
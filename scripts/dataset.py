@@ -0,0 +1,174 @@
+import io
+import os
+import sys
+import glob
+import json
+import tarfile
+import argparse
+
+# Sharded dataset output. The files of every view are packed into sequential
+# tar shards in the WebDataset layout, members <key>.<ext> grouped by key,
+# so a dataset is a few large files instead of millions of small ones. A
+# shard is written to a .tmp file and renamed once full, finished shards
+# never change. Every finished shard appends its members to
+# <prefix>.index.jsonl, one line per view with the byte offset and size of
+# every member, which gives random access without scanning the tars.
+# Manifests and exports reference packed files as <folder>#<key>.<ext>.
+#
+# Example, list a dataset and unpack one view:
+# python scripts/dataset.py D:/Mesh/scenes/forest/shards --extract 32-000 --output_folder /tmp
+
+index_suffix = ".index.jsonl"
+
+
+def shard_file(prefix, n):
+    return f"{prefix}-{n:06d}.tar"
+
+
+def member_name(path, key):
+    # '32-000-0001.jpg' -> 'jpg', '32-000_cam.txt' -> 'cam.txt', '32-000-0001-depth.npy' -> 'depth.npy'
+    name = os.path.basename(path)
+    if name.startswith(key):
+        return name[len(key):].lstrip('-_.0123456789')
+    return name
+
+
+def member_ref(folder, key, ext):
+    # '<folder>#<key>.<ext>', how manifests and exports reference a packed file
+    return f"{folder}#{key}.{ext}"
+
+
+def split_ref(ref):
+    # '<folder>#<key>.<ext>' -> folder, key, ext
+    folder, member = ref.split('#', 1)
+    key, ext = member.split('.', 1)
+    return folder, key, ext
+
+
+class ShardWriter(object):
+    def __init__(
+        self,
+        folder: str,
+        prefix: str='data',
+        max_size: int=1 << 30,
+        max_count: int=100000,
+    ):
+        super().__init__()
+        self.folder = folder
+        self.prefix = prefix
+        self.max_size = max_size
+        self.max_count = max_count
+        os.makedirs(folder, exist_ok=True)
+        # a resumed run continues after the finished shards, a torn .tmp is overwritten
+        self.n = 0
+        while os.path.isfile(os.path.join(folder, shard_file(prefix, self.n))):
+            self.n += 1
+        self.index = open(os.path.join(folder, prefix + index_suffix), 'a')
+        self.tar = None
+
+    def open(self):
+        self.path = os.path.join(self.folder, shard_file(self.prefix, self.n))
+        self.tar = tarfile.open(self.path + '.tmp', 'w', format=tarfile.GNU_FORMAT)
+        self.entries = []
+
+    def write(self, key, files):
+        # files: {ext: bytes or path}, returns the keys of a shard this finished
+        # as [(key, shard path)], empty while the shard is still open
+        if '.' in key:
+            raise ValueError(f"Dataset key {key} must not contain '.'")
+        if self.tar is None:
+            self.open()
+        members = {}
+        for ext, data in files.items():
+            if isinstance(data, str):
+                with open(data, 'rb') as f:
+                    data = f.read()
+            info = tarfile.TarInfo(f"{key}.{ext}")
+            info.size = len(data)
+            self.tar.addfile(info, io.BytesIO(data))
+            # the member data ends the archive so far, padded to whole 512 byte blocks
+            members[ext] = [self.tar.offset - (len(data) + 511) // 512 * 512, len(data)]
+        self.entries.append({'key': key, 'shard': os.path.basename(self.path), 'members': members})
+        if self.tar.offset >= self.max_size or len(self.entries) >= self.max_count:
+            return self.finish()
+        return []
+
+    def finish(self):
+        if self.tar is None:
+            return []
+        self.tar.close()
+        with open(self.path + '.tmp', 'rb+') as f:
+            os.fsync(f.fileno())
+        os.replace(self.path + '.tmp', self.path)
+        for entry in self.entries:
+            self.index.write(json.dumps(entry) + '\n')
+        self.index.flush()
+        os.fsync(self.index.fileno())
+        self.tar = None
+        self.n += 1
+        return [(entry['key'], self.path) for entry in self.entries]
+
+    def close(self):
+        finished = self.finish()
+        self.index.close()
+        return finished
+
+
+class ShardReader(object):
+    def __init__(
+        self,
+        folder: str,
+    ):
+        super().__init__()
+        self.folder = folder
+        self.entries = {}
+        for path in sorted(glob.glob(os.path.join(folder, '*' + index_suffix))):
+            with open(path, 'r') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.entries[entry['key']] = entry
+        self.files = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def keys(self):
+        return list(self.entries)
+
+    def read(self, key, ext):
+        entry = self.entries[key]
+        if entry['shard'] not in self.files:
+            self.files[entry['shard']] = open(os.path.join(self.folder, entry['shard']), 'rb')
+        f = self.files[entry['shard']]
+        offset, size = entry['members'][ext]
+        f.seek(offset)
+        return f.read(size)
+
+    def read_ref(self, ref):
+        # a member referenced relative to the dataset folder's parent
+        _, key, ext = split_ref(ref)
+        return self.read(key, ext)
+
+    def __getitem__(self, key):
+        return {ext: self.read(key, ext) for ext in self.entries[key]['members']}
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspect a sharded dataset')
+    parser.add_argument('folder', type=str, help='folder of tar shards and their .index.jsonl')
+    parser.add_argument('--extract', nargs='*', default=[], help='keys to unpack into --output_folder')
+    parser.add_argument('--output_folder', default='.')
+    args = parser.parse_args(sys.argv[1:])
+    reader = ShardReader(args.folder)
+    shards = {entry['shard'] for entry in reader.entries.values()}
+    print(f"{len(reader)} views in {len(shards)} shards")
+    for key in args.extract:
+        for ext, data in reader[key].items():
+            with open(os.path.join(args.output_folder, f"{key}.{ext}"), 'wb') as f:
+                f.write(data)
+    reader.close()
@@ -0,0 +1,74 @@
+import numpy as np
+
+from pose import invert_pose
+from export import gl2cv
+
+# Linear 16 bit depth. Depth is quantized between a per frame near / far
+# range that bounds the scene as seen from the camera: the depths of the
+# corners of the world space scene bounding box. The range is stored in the
+# camera record, so metric depth is recovered exactly up to half a step of
+# (far - near) / 65534. Code 65535 is reserved for the background and
+# anything beyond far.
+
+background = 65535
+
+
+def object_bounds(objects):
+    # world space (min, max) corners of Blender objects
+    corners = []
+    for obj in objects:
+        box = np.array([tuple(corner) for corner in obj.bound_box], dtype=float)
+        matrix = np.array(obj.matrix_world, dtype=float)
+        corners.append(box @ matrix[:3, :3].T + matrix[:3, 3])
+    corners = np.concatenate(corners)
+    return corners.min(axis=0), corners.max(axis=0)
+
+
+def box_corners(bounds_min, bounds_max):
+    lo, hi = np.asarray(bounds_min, dtype=float), np.asarray(bounds_max, dtype=float)
+    return np.array([[(lo, hi)[i][0], (lo, hi)[j][1], (lo, hi)[k][2]]
+        for i in (0, 1) for j in (0, 1) for k in (0, 1)])
+
+
+def depth_range(bounds_min, bounds_max, extrinsic, clip_start=0.1, clip_end=1000.):
+    # (near, far) depth along the optical axis of the box seen through a camera
+    # 2 world extrinsic, clamped to the clip range, which bounds what renders
+    world2cam = gl2cv @ invert_pose(extrinsic)[0]
+    z = box_corners(bounds_min, bounds_max) @ world2cam[2, :3] + world2cam[2, 3]
+    near = float(np.clip(z.min(), clip_start, clip_end))
+    far = float(np.clip(z.max(), clip_start, clip_end))
+    return near, max(far, near + 1e-6)
+
+
+def camera_intrinsic(camera, render):
+    # camera 2 image matrix of a Blender camera object, horizontal sensor fit
+    width = render.resolution_x * render.resolution_percentage // 100
+    height = render.resolution_y * render.resolution_percentage // 100
+    pixel_aspect_ratio = render.pixel_aspect_y / render.pixel_aspect_x
+    s_u = camera.data.lens / camera.data.sensor_width * width
+    return np.array([
+        [s_u, 0, width/2 - camera.data.shift_x*width],
+        [0, s_u / pixel_aspect_ratio, height/2 - camera.data.shift_y*width/pixel_aspect_ratio],
+        [0, 0, 1],
+    ], dtype=float)
+
+
+def camera_record(camera, render, bounds):
+    # extrinsic, intrinsic and depth range of a camera object's evaluated
+    # matrix_world, update the view layer after moving it
+    extrinsic = np.array(camera.matrix_world, dtype=float)
+    near_far = depth_range(*bounds, extrinsic, camera.data.clip_start, camera.data.clip_end)
+    return extrinsic, camera_intrinsic(camera, render), near_far
+
+
+def encode_depth(depth, near, far):
+    # metric depth -> uint16 codes, what the compositor writes with the same range
+    code = np.rint((np.asarray(depth, dtype=float) - near) / (far - near) * (background - 1))
+    return np.where(code > background - 1, background, np.clip(code, 0, background - 1)).astype(np.uint16)
+
+
+def decode_depth(code, near, far):
+    # uint16 codes -> metric depth, inf for the background
+    code = np.asarray(code)
+    depth = near + code.astype(np.float64) * ((far - near) / (background - 1))
+    return np.where(code == background, np.inf, depth)
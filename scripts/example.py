@@ -7,10 +7,19 @@
 # blender --background --python mytest.py -- --views 10 /path/to/my.obj
 #
 
-import argparse, sys, os, math, re
+import argparse, sys, os, math, re, json
 import bpy
 from glob import glob
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from preprocess import clean_objects
+from animation import bake_keys, render_frames, rename_frames
+from passes import setup_outputs, set_depth_range, bake_depth_ranges
+from dataset import ShardWriter
+from timing import Timer, write_summary
+from depth import object_bounds, camera_record
+from manifest import cam2str
+
 parser = argparse.ArgumentParser(description='Renders given obj file by rotation a camera around it.')
 parser.add_argument('--views', type=int, default=30,
                     help='number of views to be rendered')
@@ -28,15 +37,54 @@ parser.add_argument('--depth_scale', type=float, default=1.4,
                     help='Scaling that is applied to depth. Depends on size of mesh. Try out various values until you get a good result. Ignored if format is OPEN_EXR.')
 parser.add_argument('--color_depth', type=str, default='8',
                     help='Number of bit per channel used for output. Either 8 or 16.')
+parser.add_argument('--id_color_depth', type=str, default='',
+                    help='Bits per channel of the ID pass, 16 keeps more than 255 objects apart. Default: --color_depth.')
 parser.add_argument('--format', type=str, default='PNG',
                     help='Format of files generated. Either PNG or OPEN_EXR')
 parser.add_argument('--resolution', type=int, default=600,
                     help='Resolution of the images.')
+parser.add_argument('--outputs', type=str, nargs='+', default=['depth', 'normal', 'albedo', 'id'],
+                    help='Passes written next to the rendered image, any of depth, normal, albedo, id.')
 parser.add_argument('--engine', type=str, default='BLENDER_EEVEE',
                     help='Blender internal engine for rendering. E.g. CYCLES, BLENDER_EEVEE, ...')
+parser.add_argument('--shard', type=int, default=0,
+                    help='Render only views i with i %% shards == shard, set by scripts/launch.py.')
+parser.add_argument('--shards', type=int, default=1,
+                    help='Number of shards the views are split into.')
+parser.add_argument('--threads', type=int, default=0,
+                    help='Number of render threads, 0 for auto.')
+parser.add_argument('--animation', action='store_true', default=False,
+                    help='Bake the rotations into keyframes and render them with a single animation render.')
+parser.add_argument('--tune_time', type=float, default=0,
+                    help='Cycles only. Tune samples, adaptive sampling and denoising for this many seconds per frame.')
+parser.add_argument('--tune_noise', type=float, default=0,
+                    help='Cycles only. Tune samples, adaptive sampling and denoising for this noise level (0-1 color units).')
+parser.add_argument('--tune_views', type=int, default=3,
+                    help='Number of calibration views rendered for tuning.')
+parser.add_argument('--tune_percentage', type=int, default=25,
+                    help='Resolution percentage of the calibration renders.')
+parser.add_argument('--tuning', type=str, default='',
+                    help='Tuning file: apply its settings instead of tuning, or with --tune_only the file to save to.')
+parser.add_argument('--tune_only', action='store_true', default=False,
+                    help='Tune, save the result to --tuning and exit, see scripts/launch.py --tune.')
+parser.add_argument('--samples', type=int, default=0,
+                    help='Cycles samples, 0 keeps the scene setting.')
+parser.add_argument('--timing_format', type=str, default='jsonl',
+                    help="Per view stage timings file next to the outputs, 'jsonl' or 'csv'.")
+parser.add_argument('--depth_codec', type=str, default='map', choices=['map', 'linear'],
+                    help='PNG depth: remap with --depth_scale, or 16 bit linear between per view near / far bounds stored in <view>_cam.txt. '
+                         'linear needs File Output color management overrides and turns off dithering, also of the image.')
+parser.add_argument('--shard_size', type=int, default=0,
+                    help='Pack the files of every view into tar shards of this many MB with an index, 0 writes loose files.')
 
 argv = sys.argv[sys.argv.index("--") + 1:]
 args = parser.parse_args(argv)
+if args.tune_only and args.engine != 'CYCLES':
+    parser.error('--tune_only tunes Cycles, use --engine CYCLES')
+if args.tune_only and not (args.tune_time or args.tune_noise):
+    parser.error('--tune_only needs --tune_time or --tune_noise')
+if args.tune_only and not args.tuning:
+    parser.error('--tune_only needs --tuning to save to')
 
 # Set up rendering
 context = bpy.context
@@ -51,99 +99,16 @@ render.resolution_x = args.resolution
 render.resolution_y = args.resolution
 render.resolution_percentage = 100
 render.film_transparent = True
+if args.threads:
+    render.threads_mode = 'FIXED'
+    render.threads = args.threads
+if args.engine == 'CYCLES' and args.samples:
+    scene.cycles.samples = args.samples
 
-scene.use_nodes = True
-scene.view_layers["View Layer"].use_pass_normal = True
-scene.view_layers["View Layer"].use_pass_diffuse_color = True
-scene.view_layers["View Layer"].use_pass_object_index = True
-
-nodes = bpy.context.scene.node_tree.nodes
-links = bpy.context.scene.node_tree.links
-
-# Clear default nodes
-for n in nodes:
-    nodes.remove(n)
-
-# Create input render layer node
-render_layers = nodes.new('CompositorNodeRLayers')
-
-# Create depth output nodes
-depth_file_output = nodes.new(type="CompositorNodeOutputFile")
-depth_file_output.label = 'Depth Output'
-depth_file_output.base_path = ''
-depth_file_output.file_slots[0].use_node_format = True
-depth_file_output.format.file_format = args.format
-depth_file_output.format.color_depth = args.color_depth
-if args.format == 'OPEN_EXR':
-    links.new(render_layers.outputs['Depth'], depth_file_output.inputs[0])
-else:
-    depth_file_output.format.color_mode = "BW"
-
-    # Remap as other types can not represent the full range of depth.
-    map = nodes.new(type="CompositorNodeMapValue")
-    # Size is chosen kind of arbitrarily, try out until you're satisfied with resulting depth map.
-    map.offset = [-0.7]
-    map.size = [args.depth_scale]
-    map.use_min = True
-    map.min = [0]
-
-    links.new(render_layers.outputs['Depth'], map.inputs[0])
-    links.new(map.outputs[0], depth_file_output.inputs[0])
-
-# Create normal output nodes
-scale_node = nodes.new(type="CompositorNodeMixRGB")
-scale_node.blend_type = 'MULTIPLY'
-# scale_node.use_alpha = True
-scale_node.inputs[2].default_value = (0.5, 0.5, 0.5, 1)
-links.new(render_layers.outputs['Normal'], scale_node.inputs[1])
-
-bias_node = nodes.new(type="CompositorNodeMixRGB")
-bias_node.blend_type = 'ADD'
-# bias_node.use_alpha = True
-bias_node.inputs[2].default_value = (0.5, 0.5, 0.5, 0)
-links.new(scale_node.outputs[0], bias_node.inputs[1])
-
-normal_file_output = nodes.new(type="CompositorNodeOutputFile")
-normal_file_output.label = 'Normal Output'
-normal_file_output.base_path = ''
-normal_file_output.file_slots[0].use_node_format = True
-normal_file_output.format.file_format = args.format
-links.new(bias_node.outputs[0], normal_file_output.inputs[0])
-
-# Create albedo output nodes
-alpha_albedo = nodes.new(type="CompositorNodeSetAlpha")
-links.new(render_layers.outputs['DiffCol'], alpha_albedo.inputs['Image'])
-links.new(render_layers.outputs['Alpha'], alpha_albedo.inputs['Alpha'])
-
-albedo_file_output = nodes.new(type="CompositorNodeOutputFile")
-albedo_file_output.label = 'Albedo Output'
-albedo_file_output.base_path = ''
-albedo_file_output.file_slots[0].use_node_format = True
-albedo_file_output.format.file_format = args.format
-albedo_file_output.format.color_mode = 'RGBA'
-albedo_file_output.format.color_depth = args.color_depth
-links.new(alpha_albedo.outputs['Image'], albedo_file_output.inputs[0])
-
-# Create id map output nodes
-id_file_output = nodes.new(type="CompositorNodeOutputFile")
-id_file_output.label = 'ID Output'
-id_file_output.base_path = ''
-id_file_output.file_slots[0].use_node_format = True
-id_file_output.format.file_format = args.format
-id_file_output.format.color_depth = args.color_depth
-
-if args.format == 'OPEN_EXR':
-    links.new(render_layers.outputs['IndexOB'], id_file_output.inputs[0])
-else:
-    id_file_output.format.color_mode = 'BW'
-
-    divide_node = nodes.new(type='CompositorNodeMath')
-    divide_node.operation = 'DIVIDE'
-    divide_node.use_clamp = False
-    divide_node.inputs[1].default_value = 2**int(args.color_depth)
-
-    links.new(render_layers.outputs['IndexOB'], divide_node.inputs[0])
-    links.new(divide_node.outputs[0], id_file_output.inputs[0])
+file_outputs = setup_outputs(args.outputs, args.format, args.color_depth, args.depth_scale,
+                             view_layer=scene.view_layers["View Layer"], depth_codec=args.depth_codec,
+                             id_color_depth=args.id_color_depth or None)
+linear_depth = args.depth_codec == 'linear' and 'depth' in args.outputs and args.format != 'OPEN_EXR'
 
 # Delete default cube
 context.active_object.select_set(True)
@@ -158,24 +123,22 @@ obj = bpy.context.selected_objects[0]
 context.view_layer.objects.active = obj
 
 # Possibly disable specular shading
-for slot in obj.material_slots:
-    node = slot.material.node_tree.nodes['Principled BSDF']
-    node.inputs['Specular'].default_value = 0.05
+for selected in bpy.context.selected_objects:
+    for slot in selected.material_slots:
+        node = slot.material.node_tree.nodes['Principled BSDF']
+        node.inputs['Specular'].default_value = 0.05
 
 if args.scale != 1:
     bpy.ops.transform.resize(value=(args.scale,args.scale,args.scale))
     bpy.ops.object.transform_apply(scale=True)
-if args.remove_doubles:
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.remove_doubles()
-    bpy.ops.object.mode_set(mode='OBJECT')
-if args.edge_split:
-    bpy.ops.object.modifier_add(type='EDGE_SPLIT')
-    context.object.modifiers["EdgeSplit"].split_angle = 1.32645
-    bpy.ops.object.modifier_apply(modifier="EdgeSplit")
+if args.remove_doubles or args.edge_split:
+    clean_objects(bpy.context.selected_objects, args.remove_doubles, args.edge_split, split_angle=1.32645)
 
 # Set objekt IDs
-obj.pass_index = 1
+for selected in bpy.context.selected_objects:
+    selected.pass_index = 1
+if linear_depth:
+    bounds = object_bounds(bpy.context.selected_objects)
 
 # Make light just directional, disable shadows.
 light = bpy.data.lights['Light']
@@ -218,20 +181,128 @@ rotation_mode = 'XYZ'
 model_identifier = os.path.split(os.path.split(args.obj)[0])[1]
 fp = os.path.join(os.path.abspath(args.output_folder), model_identifier, model_identifier)
 
+frame = '{0:04d}'.format(scene.frame_current)
+pending = []
+
+# Run metadata, with the Cycles settings chosen by tuning
+metadata = {'args': vars(args), 'blender': bpy.app.version_string}
+if args.engine == 'CYCLES' and args.tuning and not args.tune_only:
+    # tuned once for all shards
+    from tuning import load_tuning
+    metadata['tuning'] = load_tuning(args.tuning)
+elif args.engine == 'CYCLES' and (args.tune_time or args.tune_noise):
+    from tuning import tune, save_tuning
+    if args.shards > 1:
+        raise ValueError("Shards would tune to different settings, tune once with scripts/launch.py --tune")
+
+    def set_view(i):
+        cam_empty.rotation_euler[2] = math.radians(stepsize * i)
+
+    calibration_views = list(range(0, args.views, max(1, args.views // args.tune_views)))[:args.tune_views]
+    metadata['tuning'] = tune(set_view, calibration_views, args.tune_time or None, args.tune_noise or None,
+                              percentage=args.tune_percentage)
+    print("Tuned Cycles: {}".format(metadata['tuning']['settings']))
+    if args.tune_only:
+        save_tuning(args.tuning, metadata['tuning'])
+        sys.exit(0)
+if args.engine == 'CYCLES':
+    metadata['cycles'] = {key: getattr(scene.cycles, key) for key in
+                          ('samples', 'use_adaptive_sampling', 'adaptive_threshold', 'use_denoising')}
+os.makedirs(os.path.dirname(fp), exist_ok=True)
+metadata_name = 'run.json' if args.shards == 1 else 'run-{:02d}-of-{:02d}.json'.format(args.shard, args.shards)
+with open(os.path.join(os.path.dirname(fp), metadata_name), 'w') as f:
+    json.dump(metadata, f, indent=4)
+
+timing_name = 'timings' if args.shards == 1 else 'timings-{:02d}-of-{:02d}'.format(args.shard, args.shards)
+timer = Timer(os.path.join(os.path.dirname(fp), '{}.{}'.format(timing_name, args.timing_format)))
+timer.watch_render()
+
+packer = None
+if args.shard_size:
+    prefix = 'data' if args.shards == 1 else 'data-{:02d}-of-{:02d}'.format(args.shard, args.shards)
+    packer = ShardWriter(os.path.join(os.path.dirname(fp), 'shards'), prefix, max_size=args.shard_size << 20)
+
+
+def write_record(render_file_path, record):
+    extrinsic, intrinsic, near_far = record
+    with open(render_file_path + '_cam.txt', 'w') as f:
+        f.write(cam2str(extrinsic, intrinsic, near_far))
+
+
+def pack(render_file_path):
+    # move the image and pass files of a rendered view into the current shard
+    ext = scene.render.file_extension
+    files = {ext[1:]: render_file_path + ext}
+    for name in file_outputs:
+        files[name + ext] = render_file_path + '_' + name + frame + ext
+    if linear_depth:
+        files['cam.txt'] = render_file_path + '_cam.txt'
+    packer.write(os.path.basename(render_file_path).replace('.', '_'), files)
+    for path in files.values():
+        os.remove(path)
+
+
 for i in range(0, args.views):
+    if i % args.shards != args.shard:
+        continue
+    if args.animation:
+        pending.append(i)
+        continue
     print("Rotation {}, {}".format((stepsize * i), math.radians(stepsize * i)))
+    timer.start(i)
+    with timer.stage('set_camera'):
+        cam_empty.rotation_euler[2] = math.radians(stepsize * i)
 
     render_file_path = fp + '_r_{0:03d}'.format(int(i * stepsize))
 
     scene.render.filepath = render_file_path
-    depth_file_output.file_slots[0].path = render_file_path + "_depth"
-    normal_file_output.file_slots[0].path = render_file_path + "_normal"
-    albedo_file_output.file_slots[0].path = render_file_path + "_albedo"
-    id_file_output.file_slots[0].path = render_file_path + "_id"
-
-    bpy.ops.render.render(write_still=True)  # render still
-
-    cam_empty.rotation_euler[2] += math.radians(stepsize)
+    for name, node in file_outputs.items():
+        node.file_slots[0].path = render_file_path + "_" + name
+    if linear_depth:
+        with timer.stage('records'):
+            context.view_layer.update()
+            record = camera_record(cam, render, bounds)
+            set_depth_range(*record[2])
+            write_record(render_file_path, record)
+
+    with timer.stage('render'):
+        bpy.ops.render.render(write_still=True)  # render still
+    if packer is not None:
+        with timer.stage('pack'):
+            pack(render_file_path)
+
+if pending:
+    # one animation render, then rename the frame numbered files to the per view names
+    timer.start('animation', len(pending))
+    bake_keys(cam_empty, 'rotation_euler', [[0, 0, math.radians(stepsize * i)] for i in pending])
+    render_file_paths = [fp + '_r_{0:03d}'.format(int(i * stepsize)) for i in pending]
+    scene.render.filepath = fp + '_frame_'
+    for name, node in file_outputs.items():
+        node.file_slots[0].path = fp + '_frame_' + name + '_'
+    if linear_depth:
+        # every frame keeps its own depth range, keyed like the camera
+        records = []
+        for k in range(len(pending)):
+            scene.frame_set(1 + k)
+            records.append(camera_record(cam, render, bounds))
+        bake_depth_ranges([record[2] for record in records])
+        for render_file_path, record in zip(render_file_paths, records):
+            write_record(render_file_path, record)
+    with timer.stage('render'):
+        render_frames(len(pending))
+
+    ext = scene.render.file_extension
+    # the main image of a still render carries no frame number, the file outputs do
+    rename_frames(fp + '_frame_', [p + ext for p in render_file_paths], ext)
+    for name in file_outputs:
+        rename_frames(fp + '_frame_' + name + '_', [p + '_' + name + frame + ext for p in render_file_paths], ext)
+    if packer is not None:
+        for render_file_path in render_file_paths:
+            pack(render_file_path)
+
+if packer is not None:
+    packer.close()
+write_summary(timer.close(), os.path.join(os.path.dirname(fp), '{}-summary.json'.format(timing_name)))
 
 # For debugging the workflow
 #bpy.ops.wm.save_as_mainfile(filepath='debug.blend')
\ No newline at end of file
@@ -0,0 +1,106 @@
+import os
+import json
+import math
+import numpy as np
+
+from pose import invert_pose, mtx2quat
+from manifest import load_manifest
+
+# Streaming export of (image, camera pose) pairs to COLMAP text models and
+# NeRF transforms.json. Poses are buffered in chunks, converted with NumPy
+# and written out, so the whole plan never sits in memory as text.
+
+# Blender / OpenGL camera (-Z forward, +Y up) to OpenCV camera (+Z forward, +Y down)
+gl2cv = np.diag([1., -1., -1., 1.])
+
+
+class Exporter(object):
+    def __init__(
+        self,
+        folder: str,
+        intrinsic: np.ndarray,
+        width: int,
+        height: int,
+        colmap: bool=True,
+        nerf: bool=True,
+        chunk: int=1024,
+    ):
+        super().__init__()
+        self.chunk = chunk
+        self.extrinsics = []
+        self.images = []
+        self.count = 0
+        self.colmap = self.nerf = None
+        fx, fy = intrinsic[0, 0], intrinsic[1, 1]
+        cx, cy = intrinsic[0, 2], intrinsic[1, 2]
+        if colmap:
+            colmap_folder = os.path.join(folder, 'colmap')
+            os.makedirs(colmap_folder, exist_ok=True)
+            with open(os.path.join(colmap_folder, 'cameras.txt'), 'w') as f:
+                f.write("# CAMERA_ID, MODEL, WIDTH, HEIGHT, PARAMS[]\n")
+                f.write(f"1 PINHOLE {width} {height} {fx:.8f} {fy:.8f} {cx:.8f} {cy:.8f}\n")
+            open(os.path.join(colmap_folder, 'points3D.txt'), 'w').close()
+            self.colmap = open(os.path.join(colmap_folder, 'images.txt'), 'w')
+            self.colmap.write("# IMAGE_ID, QW, QX, QY, QZ, TX, TY, TZ, CAMERA_ID, NAME\n# POINTS2D[] as (X, Y, POINT3D_ID)\n")
+        if nerf:
+            self.nerf = open(os.path.join(folder, 'transforms.json'), 'w')
+            header = {
+                'camera_angle_x': 2*math.atan(width / (2*fx)),
+                'camera_angle_y': 2*math.atan(height / (2*fy)),
+                'fl_x': fx, 'fl_y': fy, 'cx': cx, 'cy': cy,
+                'w': width, 'h': height,
+            }
+            # frames are streamed into the still open list
+            self.nerf.write(json.dumps(header, indent=4)[:-2] + ',\n    "frames": [')
+
+    def write(self, extrinsic, image):
+        # one camera 2 world matrix or a (N, 4, 4) batch with a list of image paths
+        extrinsic = np.asarray(extrinsic, dtype=float).reshape(-1, 4, 4)
+        self.extrinsics.append(extrinsic)
+        self.images.extend([image] if isinstance(image, str) else image)
+        if sum(len(e) for e in self.extrinsics) >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        if not self.images:
+            return
+        extrinsic = np.concatenate(self.extrinsics)
+        images = self.images
+        self.extrinsics, self.images = [], []
+        if self.colmap is not None:
+            world2cam = invert_pose(extrinsic @ gl2cv)
+            quat = mtx2quat(world2cam[:, :3, :3])
+            pose = np.concatenate([quat, world2cam[:, :3, 3]], axis=1)
+            self.colmap.write(''.join(
+                f"{self.count + k + 1} {' '.join(f'{v:.10f}' for v in p)} 1 {name}\n\n"
+                for k, (p, name) in enumerate(zip(pose.tolist(), images))
+            ))
+            self.colmap.flush()
+        if self.nerf is not None:
+            # NeRF uses Blender's camera convention, the matrix goes in as is
+            self.nerf.write(''.join(
+                ('' if self.count + k == 0 else ',') + '\n        '
+                + json.dumps({'file_path': name, 'transform_matrix': m})
+                for k, (m, name) in enumerate(zip(extrinsic.tolist(), images))
+            ))
+            self.nerf.flush()
+        self.count += len(images)
+
+    def close(self):
+        self.flush()
+        if self.colmap is not None:
+            self.colmap.close()
+        if self.nerf is not None:
+            self.nerf.write('\n    ]\n}\n')
+            self.nerf.close()
+
+
+def manifest2export(path: str, folder: str, width: int, height: int, image_folder: str='', **kwargs):
+    # export a camera manifest written by forest.py, chunk by chunk from the memory map
+    records = load_manifest(path)
+    written = np.flatnonzero(records['view'] >= 0)
+    exporter = Exporter(folder, records['intrinsic'][written[0]], width, height, **kwargs)
+    for start in range(0, len(written), exporter.chunk):
+        batch = records[written[start:start + exporter.chunk]]
+        exporter.write(batch['extrinsic'], [os.path.join(image_folder, i.decode()) for i in batch['image']])
+    exporter.close()
@@ -0,0 +1,158 @@
+import zlib
+import struct
+import numpy as np
+
+# Minimal OpenEXR reader for the files Blender writes: single part scanline
+# images, uncompressed or with RLE, ZIPS or ZIP compression, HALF / FLOAT /
+# UINT channels. Blocks are decoded one at a time, so a file never has to fit
+# in memory as a whole.
+
+magic = 20000630
+pixel_dtypes = {0: np.dtype('<u4'), 1: np.dtype('<f2'), 2: np.dtype('<f4')}
+block_lines = {0: 1, 1: 1, 2: 1, 3: 16}
+compressions = {0: 'NONE', 1: 'RLE', 2: 'ZIPS', 3: 'ZIP', 4: 'PIZ', 5: 'PXR24', 6: 'B44', 7: 'B44A', 8: 'DWAA', 9: 'DWAB'}
+
+
+def read_string(f):
+    chars = bytearray()
+    while True:
+        c = f.read(1)
+        if not c:
+            raise ValueError("Unexpected end of EXR header")
+        if c == b'\0':
+            return chars.decode()
+        chars += c
+
+
+def parse_channels(data):
+    channels, i = [], 0
+    while data[i] != 0:
+        end = data.index(b'\0', i)
+        name = data[i:end].decode()
+        pixel_type, _, _, x_sampling, y_sampling = struct.unpack('<iB3sii', data[end + 1:end + 17])
+        channels.append({'name': name, 'type': pixel_type, 'sampling': (x_sampling, y_sampling)})
+        i = end + 17
+    return channels
+
+
+def read_header(f):
+    number, version = struct.unpack('<ii', f.read(8))
+    if number != magic:
+        raise ValueError("Not an OpenEXR file")
+    if version & 0x1a00:
+        raise ValueError("Tiled, deep and multi part EXR files are not supported")
+    header = {}
+    while True:
+        name = read_string(f)
+        if not name:
+            break
+        kind = read_string(f)
+        size, = struct.unpack('<i', f.read(4))
+        data = f.read(size)
+        if kind == 'chlist':
+            header[name] = parse_channels(data)
+        elif kind == 'compression':
+            header[name] = data[0]
+        elif kind == 'box2i':
+            header[name] = struct.unpack('<iiii', data)
+        else:
+            header[name] = data
+    channels = header['channels']
+    if any(c['sampling'] != (1, 1) for c in channels):
+        raise ValueError("Subsampled EXR channels are not supported")
+    if header['compression'] not in block_lines:
+        raise ValueError(f"EXR compression {compressions.get(header['compression'])} is not supported, "
+            "write NONE, RLE, ZIPS or ZIP")
+    x_min, y_min, x_max, y_max = header['dataWindow']
+    header['width'], header['height'] = x_max - x_min + 1, y_max - y_min + 1
+    return header
+
+
+def unpredict(data):
+    # undo the ZIP / RLE byte predictor and the split of even and odd bytes
+    t = np.frombuffer(data, dtype=np.uint8).astype(np.int64)
+    t[1:] -= 128
+    t = (np.cumsum(t) & 0xff).astype(np.uint8)
+    out = np.empty_like(t)
+    half = (len(t) + 1) // 2
+    out[0::2] = t[:half]
+    out[1::2] = t[half:]
+    return out.tobytes()
+
+
+def rle_decode(data):
+    out = bytearray()
+    i = 0
+    while i < len(data):
+        count = struct.unpack('b', data[i:i + 1])[0]
+        if count < 0:
+            out += data[i + 1:i + 1 - count]
+            i += 1 - count
+        else:
+            out += data[i + 1:i + 2] * (count + 1)
+            i += 2
+    return bytes(out)
+
+
+def decode_block(data, expected, compression):
+    if len(data) == expected or compression == 0:
+        # blocks that do not compress are stored raw
+        return data
+    if compression == 1:
+        return unpredict(rle_decode(data))
+    return unpredict(zlib.decompress(data))
+
+
+def iter_blocks(path):
+    # yields (first row, {channel: (rows, width) array}) in file order, rows top first
+    with open(path, 'rb') as f:
+        header = read_header(f)
+        width, height = header['width'], header['height']
+        y_min = header['dataWindow'][1]
+        lines = block_lines[header['compression']]
+        blocks = (height + lines - 1) // lines
+        offsets = np.frombuffer(f.read(8 * blocks), dtype='<u8')
+        channels = sorted(header['channels'], key=lambda c: c['name'])
+        line_size = sum(pixel_dtypes[c['type']].itemsize for c in channels) * width
+        for offset in offsets:
+            f.seek(int(offset))
+            y, size = struct.unpack('<ii', f.read(8))
+            rows = min(lines, y_min + height - y)
+            data = decode_block(f.read(size), rows * line_size, header['compression'])
+            block, start = {}, 0
+            for c in channels:
+                dtype = pixel_dtypes[c['type']]
+                block[c['name']] = np.empty((rows, width), dtype=dtype)
+            # each row holds every channel's values one channel after the other
+            for row in range(rows):
+                for c in channels:
+                    dtype = pixel_dtypes[c['type']]
+                    size = dtype.itemsize * width
+                    block[c['name']][row] = np.frombuffer(data[start:start + size], dtype=dtype)
+                    start += size
+            yield y - y_min, block
+
+
+def read_exr(path):
+    # header and {channel: (height, width) array} of a whole file
+    with open(path, 'rb') as f:
+        header = read_header(f)
+    channels = {c['name']: np.empty((header['height'], header['width']), dtype=pixel_dtypes[c['type']])
+        for c in header['channels']}
+    for y, block in iter_blocks(path):
+        for name, values in block.items():
+            channels[name][y:y + len(values)] = values
+    return header, channels
+
+
+def group_passes(names):
+    # 'ViewLayer.Depth.Z' -> pass 'Depth', component 'Z'; plain 'R' belongs to 'Combined'
+    passes = {}
+    for name in names:
+        parts = name.split('.')
+        key = parts[-2] if len(parts) > 1 else 'Combined'
+        passes.setdefault(key, []).append(name)
+    order = 'RGBAXYZUVW'
+    for key in passes:
+        passes[key].sort(key=lambda n: order.find(n.split('.')[-1]) if n.split('.')[-1] in order else len(order))
+    return passes
@@ -0,0 +1,65 @@
+import os
+import json
+
+# Append-only completion journal for resumable renders. Every completed view
+# is one fsync'd JSON line with its output files, their sizes and its pose.
+# A view counts as done only if all its outputs still exist with that size
+# and, when asked with a pose, if it was rendered from that pose.
+
+
+class Journal(object):
+    def __init__(
+        self,
+        path: str,
+        resume: bool=False,
+    ):
+        super().__init__()
+        self.path = path
+        self.entries = {}
+        self.stale = 0 # journaled views whose pose no longer matches the plan
+        if resume and os.path.isfile(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # torn last line of a killed run
+                        continue
+                    self.entries[entry['view']] = entry
+        self.file = open(path, 'a' if resume else 'w')
+        if self.file.tell() > 0:
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self.file.write('\n')
+
+    def done(self, view, pose=None, tolerance=1e-6):
+        # with a pose, a view journaled with a different pose is not done: the
+        # plan changed and its outputs would be paired with the new camera
+        entry = self.entries.get(view)
+        if entry is None:
+            return False
+        if pose is not None and entry['pose'] is not None:
+            journaled = [x for p in entry['pose'] for x in p]
+            current = [float(x) for p in pose for x in p]
+            if len(journaled) != len(current) or any(abs(a - b) > tolerance for a, b in zip(journaled, current)):
+                self.stale += 1
+                return False
+        for path, size in entry['outputs'].items():
+            if not os.path.isfile(path) or os.path.getsize(path) != size:
+                return False
+        return True
+
+    def record(self, view, outputs, pose=None):
+        entry = {
+            'view': view,
+            'outputs': {path: os.path.getsize(path) for path in outputs},
+            'pose': None if pose is None else [list(map(float, p)) for p in pose],
+        }
+        self.entries[view] = entry
+        self.file.write(json.dumps(entry) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
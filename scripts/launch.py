@@ -0,0 +1,119 @@
+# Launch N background Blender workers that each render a disjoint shard of
+# the view plan, then merge their camera manifests into one dataset.
+#
+# Example:
+# python scripts/launch.py forest.py --blend D:/Mesh/scenes/forest/forest.blend --workers 8 --cam_folder D:/Mesh/scenes/forest/cams
+# python scripts/launch.py scripts/render.py --workers 4 -- --scene small --views 40
+# python scripts/launch.py scripts/example.py --workers 4 --tune tuning.json -- --engine CYCLES --tune_time 10 model.obj
+#
+# Workers receive '--shard i --shards N --threads T' after the '--' separator
+# and render views k with k % N == i.
+
+import os
+import sys
+import argparse
+import subprocess
+
+from manifest import Manifest, load_manifest, shard_name
+
+parser = argparse.ArgumentParser(description='Sharded Blender rendering')
+parser.add_argument('script', type=str, help='Render script run by every worker')
+parser.add_argument('--blender', default='blender', help='Blender executable')
+parser.add_argument('--blend', default='', help='.blend file every worker opens, forest.py needs its scene')
+parser.add_argument('-w', '--workers', type=int, default=os.cpu_count())
+parser.add_argument('-t', '--threads', type=int, default=0, help='render threads per worker, 0 splits the cores evenly')
+parser.add_argument('--cam_folder', default='', help='merge cams-XX-of-NN.npy manifests found here into cams.npy')
+parser.add_argument('--export', nargs='*', default=[], help="export the merged manifest to 'colmap' and/or 'nerf'")
+parser.add_argument('--resolution', type=int, nargs=2, default=[1280, 720], help='image size for --export')
+parser.add_argument('--tune', default='', help='tune Cycles once into this file and pass it to every worker (example.py)')
+parser.add_argument('--tile_folder', default='', help='stitch tiled frames found here into <tile_folder>/../blended_images')
+parser.add_argument('--log_folder', default='', help="worker logs, defaults to --cam_folder or the script's --io_folder / --output_folder")
+
+
+def merge_manifests(paths, path):
+    # every shard manifest covers the whole plan, with view == -1 where another shard rendered
+    shards = [load_manifest(p) for p in paths]
+    merged = Manifest(path, len(shards[0]), shards[0].dtype['image'].itemsize)
+    for records in shards:
+        written = records['view'] >= 0
+        merged.records[written] = records[written]
+    missing = int((merged.records['view'] < 0).sum())
+    merged.close()
+    return missing
+
+
+def log_folder(args, script_args):
+    # next to the outputs rather than in the working directory
+    if args.log_folder or args.cam_folder:
+        return args.log_folder or args.cam_folder
+    for flag in ('--io_folder', '--output_folder'):
+        if flag in script_args[:-1]:
+            return script_args[script_args.index(flag) + 1]
+    return '.'
+
+
+def blender_command(blender, blend, script):
+    # the .blend goes before --background so it is opened before the script runs
+    return [blender, *([blend] if blend else []), '--background', '--python', script, '--']
+
+
+def launch(script, workers, threads=0, blender='blender', script_args=(), log_folder='.', blend=''):
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    os.makedirs(log_folder, exist_ok=True)
+    processes = []
+    for shard in range(workers):
+        command = [*blender_command(blender, blend, script),
+            '--shard', str(shard), '--shards', str(workers), '--threads', str(threads), *script_args]
+        log = open(os.path.join(log_folder, f"{os.path.splitext(os.path.basename(script))[0]}-{shard:02d}.log"), 'w')
+        processes.append((subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT), log))
+    failed = []
+    for shard, (process, log) in enumerate(processes):
+        if process.wait() != 0:
+            failed.append(shard)
+        log.close()
+    return failed
+
+
+def tune(script, tuning, blender='blender', script_args=(), blend=''):
+    # one calibration run, every shard then renders with the same settings
+    command = [*blender_command(blender, blend, script), *script_args, '--tune_only', '--tuning', tuning]
+    return subprocess.run(command).returncode == 0 and os.path.isfile(tuning)
+
+
+def main(args, script_args):
+    if args.tune:
+        tuning = os.path.abspath(args.tune)
+        if not tune(args.script, tuning, args.blender, script_args, args.blend):
+            print(f"Tuning failed, {tuning} was not written")
+            return 1
+        script_args = [*script_args, '--tuning', tuning]
+    logs = log_folder(args, script_args)
+    failed = launch(args.script, args.workers, args.threads, args.blender, script_args, logs, args.blend)
+    if failed:
+        print(f"Shards {failed} failed, see their log files in {logs}")
+    paths = [os.path.join(args.cam_folder, shard_name(shard, args.workers)) for shard in range(args.workers)]
+    paths = [p for p in paths if os.path.isfile(p)]
+    if args.cam_folder and paths:
+        path = os.path.join(args.cam_folder, "cams.npy")
+        missing = merge_manifests(paths, path)
+        print(f"Merged {len(paths)} manifests into {path}, {missing} views missing")
+        if args.export:
+            from export import manifest2export
+            manifest2export(path, os.path.dirname(os.path.normpath(args.cam_folder)), *args.resolution,
+                image_folder='blended_images', colmap='colmap' in args.export, nerf='nerf' in args.export)
+    if args.tile_folder:
+        from tiles import stitch_folder
+        image_folder = os.path.join(os.path.dirname(os.path.normpath(args.tile_folder)), 'blended_images')
+        stitched, incomplete = stitch_folder(args.tile_folder, image_folder)
+        print(f"Stitched {len(stitched)} tiled frames into {image_folder}")
+        if incomplete:
+            print(f"{len(incomplete)} frames have missing tiles: {', '.join(incomplete)}")
+            return len(failed) + len(incomplete)
+    return len(failed)
+
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+    script_args = argv[argv.index("--") + 1:] if "--" in argv else []
+    argv = argv[:argv.index("--")] if "--" in argv else argv
+    sys.exit(main(parser.parse_args(argv), script_args))
@@ -0,0 +1,99 @@
+# Level of detail meshes for distant camera rings.
+#
+# generate_lods() decimates the scene with pymeshlab quadric edge collapse and
+# measures the Hausdorff distance of every level to the full mesh. select_lod()
+# picks the coarsest level whose error projects to less than max_pixel_error.
+#
+# Example:
+# python scripts/lod.py D:/Mesh/scenes/forest/scene.obj --ratios 0.5 0.25 0.1
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from raster import obj2blender
+
+lod_name = "lods.json"
+
+
+def blender_bounds(bounds_min, bounds_max):
+    # OBJ (Y up) box -> box of the mesh as Blender imports it (Z up), see obj2blender in scripts/raster.py
+    corners = np.array(np.meshgrid(*np.array([bounds_min, bounds_max], dtype=float).T)).reshape(3, -1).T
+    corners = corners @ obj2blender.T
+    return [corners.min(axis=0).tolist(), corners.max(axis=0).tolist()]
+
+
+def generate_lods(mesh_path, ratios=(0.5, 0.25, 0.1), folder=""):
+    import pymeshlab
+
+    folder = folder or os.path.join(os.path.dirname(mesh_path), "lod")
+    os.makedirs(folder, exist_ok=True)
+    ext = os.path.splitext(mesh_path)[1]
+    ms = pymeshlab.MeshSet()
+    ms.load_new_mesh(mesh_path)
+    full = ms.current_mesh()
+    bounds = blender_bounds(full.bounding_box().min(), full.bounding_box().max())
+    textured = full.has_wedge_tex_coord()
+    levels = [{'path': os.path.abspath(mesh_path), 'ratio': 1., 'error': 0.}]
+    for ratio in sorted(ratios, reverse=True):
+        # decimate a fresh copy of the full mesh, mesh 0
+        ms.set_current_mesh(0)
+        ms.apply_filter('generate_copy_of_current_mesh')
+        if textured:
+            ms.apply_filter('meshing_decimation_quadric_edge_collapse_with_texture', targetperc=ratio, preserveboundary=True)
+        else:
+            ms.apply_filter('meshing_decimation_quadric_edge_collapse', targetperc=ratio, preserveboundary=True, preservenormal=True)
+        lod_id = ms.current_mesh_id()
+        distance = ms.apply_filter('get_hausdorff_distance', sampledmesh=lod_id, targetmesh=0)
+        path = os.path.join(folder, f"scene_lod{len(levels)}{ext}")
+        ms.save_current_mesh(path)
+        levels.append({'path': os.path.abspath(path), 'ratio': ratio, 'error': float(distance['max'])})
+        print(f"lod {len(levels) - 1}: {ratio:.0%} faces, error {distance['max']:.5f}")
+    with open(os.path.join(folder, lod_name), 'w') as f:
+        json.dump({'levels': levels, 'bounds': bounds}, f, indent=4)
+    return levels
+
+
+def load_lods(folder):
+    with open(os.path.join(folder, lod_name), 'r') as f:
+        return json.load(f)
+
+
+def pixel_error(error, distance, lens, sensor_width, resolution_x):
+    # world space error seen from distance, in pixels
+    focal_px = lens / sensor_width * resolution_x
+    return np.asarray(error) * focal_px / np.maximum(distance, 1e-6)
+
+
+def ring_distance(locations, points, chunk=4096):
+    # closest the scene gets to a camera of the ring: the smallest distance
+    # between the camera locations and points sampled from the scene
+    locations, points = np.asarray(locations, dtype=float), np.asarray(points, dtype=float)
+    if not len(locations) or not len(points):
+        return 0.
+    distance = np.inf
+    for start in range(0, len(points), chunk):
+        d = np.linalg.norm(points[None, start:start + chunk] - locations[:, None], axis=2)
+        distance = min(distance, float(d.min()))
+    return distance
+
+
+def select_lod(levels, distance, lens, sensor_width, resolution_x, max_pixel_error=0.5):
+    # index of the coarsest level within the pixel error budget, 0 if a camera touches the scene
+    if distance <= 0:
+        return 0
+    errors = pixel_error([l['error'] for l in levels], distance, lens, sensor_width, resolution_x)
+    within = np.flatnonzero(errors <= max_pixel_error)
+    return int(within.max()) if len(within) else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate LOD meshes')
+    parser.add_argument('mesh', type=str, help='Full resolution scene mesh')
+    parser.add_argument('--ratios', type=float, nargs='+', default=[0.5, 0.25, 0.1], help='face ratio of every level')
+    parser.add_argument('--folder', default='', help='output folder, default lod/ next to the mesh')
+    args = parser.parse_args(sys.argv[1:])
+    generate_lods(args.mesh, args.ratios, args.folder)
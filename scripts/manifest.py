@@ -0,0 +1,124 @@
+import os
+import re
+import numpy as np
+from numpy.lib.format import open_memmap
+
+# Single binary camera manifest: one structured .npy record per view,
+# memory-mappable for random access. Unwritten records keep view == -1.
+
+def cam_dtype(path_length: int=256):
+    return np.dtype([
+        ('extrinsic', '<f8', (4, 4)),
+        ('intrinsic', '<f8', (3, 3)),
+        ('radius', '<f8'),
+        ('view', '<i4'),
+        ('image', f'S{path_length}'),
+    ])
+
+
+class Manifest(object):
+    def __init__(
+        self,
+        path: str,
+        size: int,
+        path_length: int=256,
+        resume: bool=False,
+    ):
+        super().__init__()
+        self.path = path
+        dtype = cam_dtype(path_length)
+        if resume and os.path.isfile(path):
+            # reopen to fill in missing records
+            self.records = open_memmap(path, mode='r+')
+            if self.records.shape != (size,) or self.records.dtype != dtype:
+                raise ValueError(f"{path} holds {self.records.shape} {self.records.dtype}, expected ({size},) {dtype}")
+        else:
+            # a fresh run starts over, records of an older plan do not survive
+            self.records = open_memmap(path, mode='w+', dtype=dtype, shape=(size,))
+            self.records['view'] = -1
+
+    def write(self, k, extrinsic, intrinsic, radius, view, image=''):
+        # numpy would cut a longer path silently
+        encoded = image.encode()
+        if len(encoded) > self.records.dtype['image'].itemsize:
+            raise ValueError(f"Image path {image} is longer than the {self.records.dtype['image'].itemsize} "
+                f"bytes of {self.path}, raise path_length")
+        record = self.records[k]
+        record['extrinsic'] = extrinsic
+        record['intrinsic'] = intrinsic
+        record['radius'] = radius
+        record['view'] = view
+        record['image'] = encoded
+
+    def flush(self):
+        self.records.flush()
+
+    def close(self):
+        self.flush()
+        del self.records
+
+
+def load_manifest(path: str, mmap_mode: str='r'):
+    return np.load(path, mmap_mode=mmap_mode)
+
+
+def mtx2str(array, digits=8):
+    lines = [''.join(f"{number:.{digits}f} " for number in line) for line in array.tolist()]
+    return '\n'.join(lines) + '\n'
+
+
+def cam2str(extrinsic, intrinsic, depth_range=None):
+    text = f"extrinsic\n{mtx2str(extrinsic)}\n\nintrinsic\n{mtx2str(intrinsic, digits=2)}\n\n"
+    if depth_range is not None:
+        # near / far of a linear 16 bit depth map, see scripts/depth.py
+        text += f"depth\n{mtx2str(np.array([depth_range]))}\n"
+    return text
+
+
+def str2cam(text):
+    # 'extrinsic' 16 numbers 'intrinsic' 9 numbers
+    tokens = text.split()
+    extrinsic = np.array(tokens[1:17], dtype=float).reshape(4, 4)
+    intrinsic = np.array(tokens[18:27], dtype=float).reshape(3, 3)
+    return extrinsic, intrinsic
+
+
+def str2depth_range(text):
+    # (near, far) of a record written with a depth range, else None
+    tokens = text.split()
+    if 'depth' not in tokens:
+        return None
+    i = tokens.index('depth')
+    return float(tokens[i + 1]), float(tokens[i + 2])
+
+
+def cam_name(radius, view):
+    return f"{int(radius):02d}-{view:0>3d}_cam.txt"
+
+
+def shard_name(shard, shards):
+    # manifest of one worker when the plan is split by scripts/launch.py
+    return f"cams-{shard:02d}-of-{shards:02d}.npy"
+
+
+def manifest2txt(path: str, cam_folder: str):
+    # write the legacy NN-III_cam.txt files back out
+    records = load_manifest(path)
+    os.makedirs(cam_folder, exist_ok=True)
+    for record in records[records['view'] >= 0]:
+        with open(os.path.join(cam_folder, cam_name(record['radius'], int(record['view']))), 'w') as f:
+            f.write(cam2str(record['extrinsic'], record['intrinsic']))
+
+
+def txt2manifest(cam_folder: str, path: str, image_format: str="{radius:02d}-{view:0>3d}-0001.jpg"):
+    pattern = re.compile(r'(\d+)-(\d+)_cam\.txt')
+    names = sorted(n for n in os.listdir(cam_folder) if pattern.fullmatch(n))
+    views = [tuple(int(g) for g in pattern.fullmatch(name).groups()) for name in names]
+    images = [image_format.format(radius=radius, view=view) for radius, view in views]
+    # the image field fits the longest path
+    manifest = Manifest(path, len(names), max([256] + [len(image.encode()) for image in images]))
+    for k, (name, (radius, view), image) in enumerate(zip(names, views, images)):
+        with open(os.path.join(cam_folder, name), 'r') as f:
+            extrinsic, intrinsic = str2cam(f.read())
+        manifest.write(k, extrinsic, intrinsic, radius, view, image)
+    manifest.close()
@@ -1,23 +1,95 @@
-from logging import root
 import pymeshlab
 import numpy as np
-import os, tqdm
+import os, tqdm, tempfile
+from multiprocessing import Pool
 
 root_folder = "D:/Mesh/scenes"
 mesh_list_path = os.path.join(root_folder, "./mesh_list_small.txt")
 output_mesh = os.path.join(root_folder, "scenes/small/scene.obj")
-mesh_list = []
-with open(mesh_list_path,'r') as f:
-    for line in f:
-        mesh_list.append(line.strip('\n'))
-print(f"len(mesh_list): {len(mesh_list)}")
-
-ms =  pymeshlab.MeshSet()
-print(ms.number_meshes())
-
-for i in tqdm.trange(len(mesh_list), ncols=80):
-    ms.load_new_mesh(mesh_list[i])
-print(ms.number_meshes())
-ms.apply_filter('generate_by_merging_visible_meshes')
-print(ms.number_meshes())
-ms.save_current_mesh(output_mesh)
+workers = os.cpu_count()
+max_memory = 16 # GB for all workers together, estimated from file sizes
+memory_factor = 4 # loaded mesh size relative to its file size
+
+
+def read_mesh_list(path):
+    mesh_list = []
+    with open(path,'r') as f:
+        for line in f:
+            if line.strip():
+                mesh_list.append(line.strip('\n'))
+    return mesh_list
+
+
+def loaded_size(paths):
+    return sum(os.path.getsize(p) * memory_factor for p in paths)
+
+
+def chunk_paths(paths, budget):
+    # Consecutive groups of meshes whose loaded size fits the budget. Every
+    # group holds at least two meshes so each merge level shrinks the list,
+    # a forced pair can exceed the budget.
+    if not paths:
+        raise ValueError("No meshes to merge")
+    sizes = [os.path.getsize(p) * memory_factor for p in paths]
+    chunks, chunk, total = [], [], 0
+    for path, size in zip(paths, sizes):
+        if len(chunk) >= 2 and total + size > budget:
+            chunks.append(chunk)
+            chunk, total = [], 0
+        chunk.append(path)
+        total += size
+    if len(chunk) == 1 and chunks:
+        chunks[-1].append(chunk[0])
+    elif chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def merge_chunk(job):
+    paths, output = job
+    ms = pymeshlab.MeshSet()
+    for path in paths:
+        ms.load_new_mesh(path)
+    if ms.number_meshes() > 1:
+        ms.apply_filter('generate_by_merging_visible_meshes')
+    ms.save_current_mesh(output)
+    return output
+
+
+def merge_meshes(mesh_list, output_mesh, workers=workers, max_memory=max_memory):
+    # Load and merge chunks in a process pool, then merge the merged chunks
+    # again level by level until a single mesh is left. Chunks above the per
+    # worker budget are merged one at a time after the pool, with all of
+    # max_memory; a chunk above max_memory raises.
+    budget = max_memory * 2**30 / workers
+    ext = os.path.splitext(output_mesh)[1]
+    paths = list(mesh_list)
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(output_mesh)) as tmp, Pool(workers) as pool:
+        level = 0
+        while True:
+            chunks = chunk_paths(paths, budget)
+            if len(chunks) == 1:
+                outputs = [output_mesh]
+            else:
+                outputs = [os.path.join(tmp, f"{level:02d}-{i:05d}{ext}") for i in range(len(chunks))]
+            sizes = [loaded_size(chunk) for chunk in chunks]
+            if max(sizes) > max_memory * 2**30:
+                raise ValueError(f"Level {level}: merging {chunks[int(np.argmax(sizes))]} needs "
+                    f"{max(sizes) / 2**30:.1f} GB, more than max_memory = {max_memory} GB")
+            serial = [job for job, size in zip(zip(chunks, outputs), sizes) if size > budget]
+            parallel = [job for job, size in zip(zip(chunks, outputs), sizes) if size <= budget]
+            print(f"level {level}: {len(paths)} meshes in {len(chunks)} chunks, {len(serial)} merged alone")
+            jobs = pool.imap_unordered(merge_chunk, parallel)
+            list(tqdm.tqdm(jobs, total=len(parallel), ncols=80))
+            for job in serial:
+                pool.apply(merge_chunk, (job,))
+            if len(chunks) == 1:
+                return output_mesh
+            paths = outputs
+            level += 1
+
+
+if __name__ == '__main__':
+    mesh_list = read_mesh_list(mesh_list_path)
+    print(f"len(mesh_list): {len(mesh_list)}")
+    merge_meshes(mesh_list, output_mesh)
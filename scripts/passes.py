@@ -0,0 +1,185 @@
+import bpy
+import numpy as np
+
+from animation import bake_keys
+
+# Shared render pass and compositor setup. Callers declare the outputs they
+# need, only those view layer passes and compositor branches are created.
+# Returns the File Output node of every requested output by name. With
+# viewer=True the composited image also goes to a Viewer node, whose pixels
+# viewer_pixels() reads back after a render. With depth_codec='linear' depth
+# is written as 16 bit codes between the near / far range that
+# set_depth_range() sets before every render, see scripts/depth.py.
+
+outputs_all = ('image', 'depth', 'normal', 'albedo', 'id')
+
+
+def setup_outputs(
+    outputs=('image',),
+    file_format='PNG',
+    color_depth='8',
+    depth_scale=1.4,
+    view_layer=None,
+    viewer=False,
+    depth_codec='map',
+    id_color_depth=None,
+):
+    unknown = set(outputs) - set(outputs_all)
+    if unknown:
+        raise ValueError(f"Unknown outputs {sorted(unknown)}, choose from {outputs_all}")
+    scene = bpy.context.scene
+    view_layer = view_layer or bpy.context.view_layer
+    view_layer.use_pass_z = 'depth' in outputs
+    view_layer.use_pass_normal = 'normal' in outputs
+    view_layer.use_pass_diffuse_color = 'albedo' in outputs
+    view_layer.use_pass_object_index = 'id' in outputs
+
+    scene.use_nodes = True
+    nodes = scene.node_tree.nodes
+    links = scene.node_tree.links
+    # Clear default nodes
+    for n in nodes:
+        nodes.remove(n)
+    render_layers = nodes.new('CompositorNodeRLayers')
+    # Blender refuses to render a node tree without an output node, which is
+    # the case with no outputs (tiles, async writes) or with every File Output
+    # muted (the preview pass, tuning.calibrate)
+    composite = nodes.new('CompositorNodeComposite')
+    links.new(render_layers.outputs['Image'], composite.inputs['Image'])
+    file_outputs = {}
+
+    def file_output(name, label):
+        node = nodes.new(type="CompositorNodeOutputFile")
+        node.label = label
+        node.base_path = ''
+        file_outputs[name] = node
+        return node
+
+    if 'image' in outputs:
+        image_file_output = file_output('image', 'Image')
+        links.new(render_layers.outputs['Image'], image_file_output.inputs[0])
+
+    if viewer:
+        viewer_node = nodes.new('CompositorNodeViewer')
+        viewer_node.use_alpha = True
+        links.new(render_layers.outputs['Image'], viewer_node.inputs[0])
+
+    if 'depth' in outputs:
+        depth_file_output = file_output('depth', 'Depth Output')
+        depth_file_output.file_slots[0].use_node_format = True
+        depth_file_output.format.file_format = file_format
+        depth_file_output.format.color_depth = color_depth
+        if file_format == 'OPEN_EXR':
+            links.new(render_layers.outputs['Depth'], depth_file_output.inputs[0])
+        elif depth_codec == 'linear':
+            depth_file_output.format.color_mode = "BW"
+            depth_file_output.format.color_depth = '16'
+            # codes are data, a view transform or dither noise would corrupt them
+            if not hasattr(depth_file_output.format, 'color_management'):
+                raise RuntimeError(f"Blender {bpy.app.version_string} can not override the color management "
+                    "of a File Output node, which linear depth needs")
+            depth_file_output.format.color_management = 'OVERRIDE'
+            depth_file_output.format.view_settings.view_transform = 'Raw'
+            # dithering is a render setting, this also turns it off for the image
+            scene.render.dither_intensity = 0
+
+            range_node = nodes.new(type="CompositorNodeMapRange")
+            range_node.name = range_node.label = 'Depth Range'
+            range_node.use_clamp = True
+            links.new(render_layers.outputs['Depth'], range_node.inputs['Value'])
+            links.new(range_node.outputs[0], depth_file_output.inputs[0])
+        else:
+            depth_file_output.format.color_mode = "BW"
+
+            # Remap as other types can not represent the full range of depth.
+            map = nodes.new(type="CompositorNodeMapValue")
+            # Size is chosen kind of arbitrarily, try out until you're satisfied with resulting depth map.
+            map.offset = [-0.7]
+            map.size = [depth_scale]
+            map.use_min = True
+            map.min = [0]
+
+            links.new(render_layers.outputs['Depth'], map.inputs[0])
+            links.new(map.outputs[0], depth_file_output.inputs[0])
+
+    if 'normal' in outputs:
+        scale_node = nodes.new(type="CompositorNodeMixRGB")
+        scale_node.blend_type = 'MULTIPLY'
+        scale_node.inputs[2].default_value = (0.5, 0.5, 0.5, 1)
+        links.new(render_layers.outputs['Normal'], scale_node.inputs[1])
+
+        bias_node = nodes.new(type="CompositorNodeMixRGB")
+        bias_node.blend_type = 'ADD'
+        bias_node.inputs[2].default_value = (0.5, 0.5, 0.5, 0)
+        links.new(scale_node.outputs[0], bias_node.inputs[1])
+
+        normal_file_output = file_output('normal', 'Normal Output')
+        normal_file_output.file_slots[0].use_node_format = True
+        normal_file_output.format.file_format = file_format
+        links.new(bias_node.outputs[0], normal_file_output.inputs[0])
+
+    if 'albedo' in outputs:
+        alpha_albedo = nodes.new(type="CompositorNodeSetAlpha")
+        links.new(render_layers.outputs['DiffCol'], alpha_albedo.inputs['Image'])
+        links.new(render_layers.outputs['Alpha'], alpha_albedo.inputs['Alpha'])
+
+        albedo_file_output = file_output('albedo', 'Albedo Output')
+        albedo_file_output.file_slots[0].use_node_format = True
+        albedo_file_output.format.file_format = file_format
+        albedo_file_output.format.color_mode = 'RGBA'
+        albedo_file_output.format.color_depth = color_depth
+        links.new(alpha_albedo.outputs['Image'], albedo_file_output.inputs[0])
+
+    if 'id' in outputs:
+        id_file_output = file_output('id', 'ID Output')
+        id_file_output.file_slots[0].use_node_format = True
+        id_file_output.format.file_format = file_format
+        # the ID pass can be deeper than the other outputs, None keeps color_depth
+        id_color_depth = id_color_depth or color_depth
+        id_file_output.format.color_depth = id_color_depth
+
+        if file_format == 'OPEN_EXR':
+            links.new(render_layers.outputs['IndexOB'], id_file_output.inputs[0])
+        else:
+            id_file_output.format.color_mode = 'BW'
+
+            divide_node = nodes.new(type='CompositorNodeMath')
+            divide_node.operation = 'DIVIDE'
+            divide_node.use_clamp = False
+            divide_node.inputs[1].default_value = 2**int(id_color_depth)
+
+            links.new(render_layers.outputs['IndexOB'], divide_node.inputs[0])
+            links.new(divide_node.outputs[0], id_file_output.inputs[0])
+
+    return file_outputs
+
+
+def range_max(near, far):
+    # far maps to code 65534, anything beyond clamps to the background code 65535
+    return near + (far - near) * 65535 / 65534
+
+
+def set_depth_range(near, far):
+    node = bpy.context.scene.node_tree.nodes['Depth Range']
+    node.inputs['From Min'].default_value = near
+    node.inputs['From Max'].default_value = range_max(near, far)
+    node.inputs['To Min'].default_value = 0.
+    node.inputs['To Max'].default_value = 1.
+
+
+def bake_depth_ranges(ranges, frame_start=1):
+    # (N, 2) near / far, one per frame of an animation render, keyed on the Depth Range node
+    ranges = np.asarray(ranges, dtype=float).reshape(-1, 2)
+    set_depth_range(*ranges[0])
+    tree = bpy.context.scene.node_tree
+    bake_keys(tree, 'nodes["Depth Range"].inputs[1].default_value', ranges[:, 0], frame_start)
+    bake_keys(tree, 'nodes["Depth Range"].inputs[2].default_value', range_max(ranges[:, 0], ranges[:, 1]), frame_start)
+
+
+def viewer_pixels():
+    # float RGBA of the last composited frame, (H, W, 4) with the bottom row first
+    image = bpy.data.images['Viewer Node']
+    width, height = image.size
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    return pixels.reshape(height, width, 4)
@@ -0,0 +1,130 @@
+# Greedy view planning. Every candidate pose is rasterized at a reduced
+# resolution with scripts/raster.py to get the faces it sees, then a lazy
+# greedy set cover picks views by visible surface area until the selection
+# covers `target` of the area seen by any candidate.
+#
+# Example, pick views from the candidates of a camera manifest:
+# python scripts/planner.py D:/Mesh/scenes/forest/scene.obj --manifest D:/Mesh/scenes/forest/cams/cams.npy --target 0.95
+
+import os
+import sys
+import heapq
+import json
+import argparse
+import numpy as np
+from multiprocessing import Pool
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from raster import rasterize, load_obj, load_cams
+
+
+def object_triangles(objects):
+    # world space (V, 3) vertices and (F, 3) triangles of Blender mesh objects
+    vertices, faces, offset = [], [], 0
+    for obj in objects:
+        mesh = obj.data
+        mesh.calc_loop_triangles()
+        co = np.empty(len(mesh.vertices) * 3)
+        mesh.vertices.foreach_get('co', co)
+        tris = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+        mesh.loop_triangles.foreach_get('vertices', tris)
+        matrix = np.array(obj.matrix_world)
+        vertices.append(co.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3])
+        faces.append(tris.reshape(-1, 3).astype(np.int64) + offset)
+        offset += len(mesh.vertices)
+    if not vertices:
+        return np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64)
+    return np.concatenate(vertices), np.concatenate(faces)
+
+
+def face_areas(vertices, faces):
+    tri = vertices[faces]
+    return np.linalg.norm(np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0]), axis=1) / 2
+
+
+def scale_intrinsic(intrinsic, scale):
+    # intrinsics of the same camera at `scale` times the resolution
+    intrinsic = np.array(intrinsic, dtype=float)
+    intrinsic[:2] *= scale
+    return intrinsic
+
+
+mesh = None
+
+
+def init_worker(vertices, faces):
+    global mesh
+    mesh = (vertices, faces)
+
+
+def visible_view(job):
+    extrinsic, intrinsic, width, height = job
+    _, face = rasterize(*mesh, intrinsic, extrinsic, width, height)
+    return np.unique(face[face >= 0])
+
+
+def visible_faces(vertices, faces, intrinsic, extrinsics, width, height, scale=0.25, workers=1):
+    # indices of the faces each pose sees, occlusion included
+    width, height = max(1, int(width * scale)), max(1, int(height * scale))
+    intrinsic = scale_intrinsic(intrinsic, scale)
+    jobs = [(extrinsic, intrinsic, width, height) for extrinsic in extrinsics]
+    if workers <= 1:
+        init_worker(vertices, faces)
+        return [visible_view(job) for job in jobs]
+    with Pool(workers, initializer=init_worker, initargs=(vertices, faces)) as pool:
+        return pool.map(visible_view, jobs)
+
+
+def greedy_cover(visible, weights, target=0.95, max_views=None):
+    # Lazy greedy set cover: a view's gain only shrinks as faces get covered,
+    # so a stale gain on the heap is an upper bound and only the top is
+    # re-evaluated. Returns the selected views in order and the covered
+    # fraction of the reachable area after each.
+    seen = np.zeros(len(weights), dtype=bool)
+    for v in visible:
+        seen[v] = True
+    total = weights[seen].sum()
+    covered = np.zeros(len(weights), dtype=bool)
+    heap = [(-weights[v].sum(), i) for i, v in enumerate(visible)]
+    heapq.heapify(heap)
+    selected, coverage, area = [], [], 0.
+    while heap and area < target * total and (max_views is None or len(selected) < max_views):
+        _, i = heapq.heappop(heap)
+        faces = visible[i][~covered[visible[i]]]
+        gain = weights[faces].sum()
+        if heap and gain < -heap[0][0]:
+            heapq.heappush(heap, (-gain, i))
+            continue
+        if gain <= 0:
+            break
+        covered[faces] = True
+        area += gain
+        selected.append(i)
+        coverage.append(area / total)
+    return np.array(selected, dtype=np.int64), np.array(coverage)
+
+
+def plan_views(vertices, faces, intrinsic, extrinsics, width, height, target=0.95, scale=0.25, workers=1, max_views=None):
+    visible = visible_faces(vertices, faces, intrinsic, extrinsics, width, height, scale, workers)
+    return greedy_cover(visible, face_areas(vertices, faces), target, max_views)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Select the fewest views covering a fraction of the scene surface')
+    parser.add_argument('mesh', type=str, help='OBJ scene, in the coordinates Blender imports it to')
+    parser.add_argument('--manifest', default='', help='cams.npy of the candidate views')
+    parser.add_argument('--cam_folder', default='', help='folder of candidate NN-III_cam.txt files, instead of --manifest')
+    parser.add_argument('--resolution', type=int, nargs=2, default=[1280, 720])
+    parser.add_argument('--target', type=float, default=0.95, help='fraction of the area seen by any candidate')
+    parser.add_argument('--scale', type=float, default=0.25, help='resolution scale of the visibility renders')
+    parser.add_argument('--max_views', type=int, default=None)
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--output', default='plan.json', help='selected views and their coverage')
+    args = parser.parse_args(sys.argv[1:])
+    vertices, faces, _ = load_obj(args.mesh)
+    cams = load_cams(args.manifest, args.cam_folder)
+    selected, coverage = plan_views(vertices, faces, cams[0][1], [cam[0] for cam in cams], *args.resolution,
+        args.target, args.scale, args.workers, args.max_views)
+    with open(args.output, 'w') as f:
+        json.dump({'views': [cams[i][2] for i in selected], 'coverage': coverage.tolist()}, f, indent=4)
+    print(f"{len(selected)} of {len(cams)} views cover {coverage[-1] if len(coverage) else 0.:.1%} of the reachable surface")
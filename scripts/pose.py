@@ -0,0 +1,157 @@
+import numpy as np
+from typing import Tuple, Sequence
+
+from sampling import sample_sphere, stream
+
+# Batch camera pose planning. Pure NumPy, usable outside of Blender.
+# Angles are in degrees and follow Blender's 'XYZ' euler convention,
+# the camera looks down its local -Z axis with +Y up.
+
+eps = 1e-8
+
+
+def euler2mtx(rotation: np.ndarray):
+    # (N, 3) XYZ euler angles in degrees -> (N, 3, 3) rotation matrices
+    rotation = np.radians(np.asarray(rotation, dtype=float).reshape(-1, 3))
+    cx, cy, cz = np.cos(rotation).T
+    sx, sy, sz = np.sin(rotation).T
+    mtx = np.empty((len(rotation), 3, 3))
+    # R = Rz @ Ry @ Rx
+    mtx[:, 0, 0] = cy*cz
+    mtx[:, 0, 1] = sx*sy*cz - cx*sz
+    mtx[:, 0, 2] = cx*sy*cz + sx*sz
+    mtx[:, 1, 0] = cy*sz
+    mtx[:, 1, 1] = sx*sy*sz + cx*cz
+    mtx[:, 1, 2] = cx*sy*sz - sx*cz
+    mtx[:, 2, 0] = -sy
+    mtx[:, 2, 1] = sx*cy
+    mtx[:, 2, 2] = cx*cy
+    return mtx
+
+
+def pose2mtx(
+    location: np.ndarray,
+    rotation: np.ndarray,
+):
+    # (N, 3) locations and euler angles -> (N, 4, 4) camera 2 world matrices
+    location = np.asarray(location, dtype=float).reshape(-1, 3)
+    mtx = np.zeros((len(location), 4, 4))
+    mtx[:, :3, :3] = euler2mtx(rotation)
+    mtx[:, :3, 3] = location
+    mtx[:, 3, 3] = 1.
+    return mtx
+
+
+def invert_pose(mtx: np.ndarray):
+    # (N, 4, 4) rigid camera 2 world matrices -> world 2 camera, without a general inverse
+    mtx = np.asarray(mtx, dtype=float).reshape(-1, 4, 4)
+    rotation_t = mtx[:, :3, :3].transpose(0, 2, 1)
+    inverse = np.zeros_like(mtx)
+    inverse[:, :3, :3] = rotation_t
+    inverse[:, :3, 3] = -np.einsum('nij,nj->ni', rotation_t, mtx[:, :3, 3])
+    inverse[:, 3, 3] = 1.
+    return inverse
+
+
+def track_batch(
+    cam_location: np.ndarray,
+    target_location: Tuple[float],
+):
+    # Euler angles pointing the camera -Z axis at the target, roll free
+    cam_location = np.asarray(cam_location, dtype=float).reshape(-1, 3)
+    relative = np.asarray(target_location, dtype=float) - cam_location
+    x, y, z = relative.T
+    l = np.linalg.norm(relative, ord=2, axis=1)
+    rotation = np.zeros((len(cam_location), 3))
+    # a camera sitting on the target keeps looking straight down
+    cos_x = np.where(l < eps, 1., -z / np.maximum(l, eps))
+    rotation[:, 0] = np.degrees(np.arccos(np.clip(cos_x, -1., 1.)))
+    # arctan2 covers y == 0, and x == y == 0 (looking straight up or down) gives 0
+    rotation[:, 2] = np.degrees(np.arctan2(-x, y))
+    return rotation
+
+
+def sphere_batch(
+    center: Tuple[float],
+    radius: float,
+    n: int,
+    rng: np.random.Generator=None,
+):
+    # Same distribution as the legacy random_sphere(): normalized cube samples
+    translation = (rng.random((n, 3)) if rng is not None else np.random.rand(n, 3)) - 0.5
+    norm = np.linalg.norm(translation, ord=2, axis=1, keepdims=True)
+    degenerate = norm[:, 0] < eps
+    translation[degenerate] = [0., 0., 1.]
+    norm[degenerate] = 1.
+    translation /= norm
+    return np.asarray(center, dtype=float) + translation*radius
+
+
+def pose_batch(
+    target_location: Tuple[float],
+    radius: Sequence[float],
+    views: int,
+    rng: np.random.Generator=None,
+    sampler: str='cube',
+    min_elevation: float=-90.,
+    max_elevation: float=90.,
+    seed: int=None,
+):
+    # All poses of a plan, ordered radius by radius, view by view:
+    # pose k belongs to radius[k // views] and view k % views.
+    # sampler 'cube' is the legacy distribution, any other is a
+    # scripts/sampling.py sampler drawn per ring within the elevation band.
+    # With a seed ring j draws from stream(seed, 'ring', j), independent of
+    # the other rings and of rng.
+    radius = np.asarray(radius, dtype=float).reshape(-1)
+    radii = np.repeat(radius, views)
+    if seed is not None:
+        rings = [stream(seed, 'ring', j) for j in range(len(radius))]
+    else:
+        rings = [np.random.default_rng(rng.integers(2**63)) if rng is not None else None for _ in radius]
+    if sampler == 'cube' and seed is None:
+        locations = sphere_batch(target_location, radii[:, None], len(radii), rng)
+    elif sampler == 'cube':
+        locations = np.concatenate([sphere_batch(target_location, r, views, ring) for r, ring in zip(radius, rings)])
+    else:
+        directions = np.concatenate([sample_sphere(sampler, views, ring, min_elevation, max_elevation) for ring in rings])
+        locations = np.asarray(target_location, dtype=float) + directions*radii[:, None]
+    rotations = track_batch(locations, target_location)
+    matrices = pose2mtx(locations, rotations)
+    return locations, rotations, matrices
+
+
+def track(
+    cam_location: Tuple[float],
+    target_location: Tuple[float],
+):
+    return track_batch(cam_location, target_location)[0]
+
+
+def random_sphere(
+    center: Tuple[float],
+    radius: float,
+):
+    return sphere_batch(center, radius, 1)[0]
+
+
+def mtx2quat(rotation: np.ndarray):
+    # (N, 3, 3) rotation matrices -> (N, 4) unit quaternions (w, x, y, z), w >= 0
+    r = np.asarray(rotation, dtype=float).reshape(-1, 3, 3)
+    k = np.zeros((len(r), 4, 4))
+    # symmetric matrix whose top eigenvector is the quaternion (x, y, z, w),
+    # only the lower triangle is read by eigh
+    k[:, 0, 0] = r[:, 0, 0] - r[:, 1, 1] - r[:, 2, 2]
+    k[:, 1, 0] = r[:, 0, 1] + r[:, 1, 0]
+    k[:, 1, 1] = r[:, 1, 1] - r[:, 0, 0] - r[:, 2, 2]
+    k[:, 2, 0] = r[:, 0, 2] + r[:, 2, 0]
+    k[:, 2, 1] = r[:, 1, 2] + r[:, 2, 1]
+    k[:, 2, 2] = r[:, 2, 2] - r[:, 0, 0] - r[:, 1, 1]
+    k[:, 3, 0] = r[:, 2, 1] - r[:, 1, 2]
+    k[:, 3, 1] = r[:, 0, 2] - r[:, 2, 0]
+    k[:, 3, 2] = r[:, 1, 0] - r[:, 0, 1]
+    k[:, 3, 3] = r[:, 0, 0] + r[:, 1, 1] + r[:, 2, 2]
+    _, vectors = np.linalg.eigh(k / 3.)
+    quat = vectors[:, [3, 0, 1, 2], -1]
+    quat[quat[:, 0] < 0] *= -1
+    return quat
@@ -0,0 +1,288 @@
+import numpy as np
+
+# Mesh cleanup with array access instead of edit-mode operators.
+# weld() matches bpy.ops.mesh.remove_doubles(), edge_split() matches the
+# EDGE_SPLIT modifier. Meshes are given as polygon soups:
+# co (V, 3), loop_vertex (L,) and per polygon loop_start / loop_total.
+# The array path keeps UVs, custom split normals, materials and smooth flags.
+# Meshes with vertex colors, vertex groups or sharp / seam edges are cleaned
+# with bmesh remove_doubles and the EDGE_SPLIT modifier instead, which keep
+# every layer.
+
+# Bump when the cleanup changes its result, scene caches are keyed by it
+version = '2'
+
+# Large primes of the spatial hash, products wrap around in int64
+hash_primes = np.array([73856093, 19349663, 83492791], dtype=np.int64)
+# Half of the 26 neighbouring cells plus the cell itself, every pair of cells is visited once
+cell_offsets = np.array([
+    (0, 0, 0), (1, 0, 0), (0, 1, 0), (0, 0, 1), (1, 1, 0), (1, -1, 0), (1, 0, 1),
+    (1, 0, -1), (0, 1, 1), (0, 1, -1), (1, 1, 1), (1, 1, -1), (1, -1, 1), (1, -1, -1),
+], dtype=np.int64)
+
+
+def union(n, i, j):
+    # connected components of the pairs (i, j) over n elements, labelled by their smallest member
+    labels = np.arange(n)
+    while True:
+        m = np.minimum(labels[i], labels[j])
+        old = labels.copy()
+        np.minimum.at(labels, i, m)
+        np.minimum.at(labels, j, m)
+        labels = labels[labels]
+        if np.array_equal(labels, old):
+            return labels
+
+
+def cell_hash(cell):
+    return (cell[:, 0] * hash_primes[0]) ^ (cell[:, 1] * hash_primes[1]) ^ (cell[:, 2] * hash_primes[2])
+
+
+def close_pairs(co, distance, cell_scale=4):
+    # All vertex pairs closer than distance, found through a hashed grid. Cells are
+    # cell_scale times distance wide, so only vertices near a cell border look next door.
+    scaled = co / (distance * cell_scale)
+    cell = np.floor(scaled).astype(np.int64)
+    frac = scaled - cell
+    keys = cell_hash(cell)
+    order = np.argsort(keys)
+    unique_keys, first, inverse, count = np.unique(keys[order], return_index=True, return_inverse=True, return_counts=True)
+    own = np.empty(len(co), dtype=np.int64)
+    own[order] = inverse.reshape(-1)
+    # per offset component -1 / 0 / 1, which vertices are close enough to that side
+    near = [frac < 1/cell_scale, np.ones_like(frac, dtype=bool), frac > 1 - 1/cell_scale]
+    pairs_i, pairs_j = [], []
+    for offset in cell_offsets:
+        if not offset.any():
+            i = np.flatnonzero(count[own] > 1)
+            slot = own[i]
+        else:
+            query = near[offset[0] + 1][:, 0] & near[offset[1] + 1][:, 1] & near[offset[2] + 1][:, 2]
+            i = np.flatnonzero(query)
+            neighbour = cell_hash(cell[i] + offset)
+            slot = np.minimum(np.searchsorted(unique_keys, neighbour), len(unique_keys) - 1)
+            hit = unique_keys[slot] == neighbour
+            i, slot = i[hit], slot[hit]
+        n = count[slot]
+        j = order[np.repeat(first[slot] - np.cumsum(n) + n, n) + np.arange(n.sum())]
+        i = np.repeat(i, n)
+        # hash collisions and the far corners of neighbour cells are dropped here
+        keep = (i < j) if not offset.any() else (i != j)
+        keep &= np.einsum('ij,ij->i', co[i] - co[j], co[i] - co[j]) <= distance**2
+        pairs_i.append(i[keep])
+        pairs_j.append(j[keep])
+    return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+
+def loop_next(loop_start, loop_total):
+    # index of the following loop inside the same polygon
+    n = loop_total.sum()
+    polygon = np.repeat(np.arange(len(loop_start)), loop_total)
+    following = np.arange(n) + 1
+    last = loop_start + loop_total - 1
+    following[last] = loop_start
+    return following, polygon
+
+
+def weld(co, loop_vertex, loop_start, loop_total, distance=1e-4):
+    # Merge vertices closer than distance into the lowest index one.
+    # Returns the new co and loop_vertex, and a loop mask and polygon mask of what
+    # survives: repeated corners are removed and polygons left with < 3 corners dropped.
+    i, j = close_pairs(co, distance)
+    labels = union(len(co), i, j)
+    used, remap = np.unique(labels, return_inverse=True)
+    co = co[used]
+    loop_vertex = remap[loop_vertex]
+
+    following, polygon = loop_next(loop_start, loop_total)
+    keep_loop = loop_vertex != loop_vertex[following]
+    total = np.bincount(polygon, weights=keep_loop, minlength=len(loop_start)).astype(int)
+    keep_polygon = total >= 3
+    keep_loop &= keep_polygon[polygon]
+    return co, loop_vertex[keep_loop], keep_loop, keep_polygon
+
+
+def polygon_normals(co, loop_vertex, loop_start, loop_total):
+    # Newell's method, also correct for non planar polygons
+    following, polygon = loop_next(loop_start, loop_total)
+    a = co[loop_vertex]
+    b = co[loop_vertex[following]]
+    cross = np.stack([
+        (a[:, 1] - b[:, 1]) * (a[:, 2] + b[:, 2]),
+        (a[:, 2] - b[:, 2]) * (a[:, 0] + b[:, 0]),
+        (a[:, 0] - b[:, 0]) * (a[:, 1] + b[:, 1]),
+    ], axis=1)
+    normals = np.zeros((len(loop_start), 3))
+    np.add.at(normals, polygon, cross)
+    norm = np.linalg.norm(normals, axis=1, keepdims=True)
+    return normals / np.maximum(norm, 1e-12)
+
+
+def edge_split(co, loop_vertex, loop_start, loop_total, split_angle=1.32645):
+    # Give every smooth fan of corners around a vertex its own vertex. Corners are
+    # joined across manifold edges whose face angle is at most split_angle.
+    # Returns the new co, loop_vertex and the original vertex of every new vertex.
+    following, polygon = loop_next(loop_start, loop_total)
+    a, b = loop_vertex, loop_vertex[following]
+    edge = np.sort(np.stack([a, b], axis=1), axis=1)
+    edge_key = edge[:, 0] * (len(co) + 1) + edge[:, 1]
+    order = np.argsort(edge_key, kind='stable')
+    sorted_key = edge_key[order]
+    _, first, count = np.unique(sorted_key, return_index=True, return_counts=True)
+    # only edges shared by exactly two polygons can be smooth
+    first = first[count == 2]
+    l, m = order[first], order[first + 1]
+
+    normals = polygon_normals(co, loop_vertex, loop_start, loop_total)
+    cos_angle = np.einsum('ij,ij->i', normals[polygon[l]], normals[polygon[m]])
+    smooth = cos_angle >= np.cos(split_angle)
+    l, m = l[smooth], m[smooth]
+
+    # corner of loop l at vertex a[l] meets the corner of m at the same vertex
+    same = a[l] == a[m]
+    m_at_a = np.where(same, m, following[m])
+    m_at_b = np.where(same, following[m], m)
+    i = np.concatenate([l, following[l]])
+    j = np.concatenate([m_at_a, m_at_b])
+    labels = union(len(loop_vertex), i, j)
+    used, remap = np.unique(labels, return_inverse=True)
+    origin = loop_vertex[used]
+    return co[origin], remap, origin
+
+
+def mesh_arrays(mesh):
+    co = np.empty(len(mesh.vertices) * 3)
+    mesh.vertices.foreach_get('co', co)
+    loop_vertex = np.empty(len(mesh.loops), dtype=np.int64)
+    mesh.loops.foreach_get('vertex_index', loop_vertex)
+    loop_start = np.empty(len(mesh.polygons), dtype=np.int64)
+    mesh.polygons.foreach_get('loop_start', loop_start)
+    loop_total = np.empty(len(mesh.polygons), dtype=np.int64)
+    mesh.polygons.foreach_get('loop_total', loop_total)
+    return co.reshape(-1, 3), loop_vertex, loop_start, loop_total
+
+
+def loop_normals(mesh):
+    # (L, 3) split normals, custom ones where the mesh has them
+    if hasattr(mesh, 'calc_normals_split'):
+        mesh.calc_normals_split()
+    normals = np.empty(len(mesh.loops) * 3)
+    mesh.loops.foreach_get('normal', normals)
+    return normals.reshape(-1, 3)
+
+
+def clean_mesh(mesh, remove_doubles=True, edge_split_angle=1.32645, distance=1e-4):
+    co, loop_vertex, loop_start, loop_total = mesh_arrays(mesh)
+    material = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get('material_index', material)
+    smooth = np.empty(len(mesh.polygons), dtype=bool)
+    mesh.polygons.foreach_get('use_smooth', smooth)
+    uvs = {}
+    for layer in mesh.uv_layers:
+        uv = np.empty(len(mesh.loops) * 2)
+        layer.data.foreach_get('uv', uv)
+        uvs[layer.name] = uv.reshape(-1, 2)
+    # OBJ files with vn lines import as custom normals, carried per loop
+    normals = loop_normals(mesh) if mesh.has_custom_normals else None
+
+    if remove_doubles:
+        co, loop_vertex, keep_loop, keep_polygon = weld(co, loop_vertex, loop_start, loop_total, distance)
+        loop_total = np.bincount(np.repeat(np.arange(len(loop_start)), loop_total)[keep_loop],
+            minlength=len(loop_start))[keep_polygon]
+        loop_start = np.concatenate([[0], np.cumsum(loop_total)[:-1]])
+        material, smooth = material[keep_polygon], smooth[keep_polygon]
+        uvs = {name: uv[keep_loop] for name, uv in uvs.items()}
+        normals = normals[keep_loop] if normals is not None else None
+    if edge_split_angle is not None:
+        co, loop_vertex, _ = edge_split(co, loop_vertex, loop_start, loop_total, edge_split_angle)
+
+    mesh.clear_geometry()
+    mesh.vertices.add(len(co))
+    mesh.vertices.foreach_set('co', co.ravel())
+    mesh.loops.add(len(loop_vertex))
+    mesh.loops.foreach_set('vertex_index', loop_vertex.astype(np.int32))
+    mesh.polygons.add(len(loop_start))
+    mesh.polygons.foreach_set('loop_start', loop_start.astype(np.int32))
+    mesh.polygons.foreach_set('loop_total', loop_total.astype(np.int32))
+    mesh.polygons.foreach_set('material_index', material)
+    mesh.polygons.foreach_set('use_smooth', smooth)
+    for name, uv in uvs.items():
+        layer = mesh.uv_layers.get(name) or mesh.uv_layers.new(name=name)
+        layer.data.foreach_set('uv', uv.ravel())
+    mesh.update(calc_edges=True)
+    mesh.validate()
+    if normals is not None:
+        if hasattr(mesh, 'use_auto_smooth'):
+            mesh.use_auto_smooth = True
+        mesh.normals_split_custom_set(normals)
+
+
+def dropped_layers(mesh, objects=()):
+    # data of the mesh clean_mesh() would lose, objects are its users for vertex groups
+    layers = []
+    colors = mesh.color_attributes if hasattr(mesh, 'color_attributes') else mesh.vertex_colors
+    if len(colors):
+        layers.append('vertex colors')
+    if any(len(obj.vertex_groups) for obj in objects):
+        layers.append('vertex groups')
+    for name, flag in (('sharp edges', 'use_edge_sharp'), ('seams', 'use_seam')):
+        flags = np.empty(len(mesh.edges), dtype=bool)
+        mesh.edges.foreach_get(flag, flags)
+        if flags.any():
+            layers.append(name)
+    return layers
+
+
+def clean_bmesh(obj, remove_doubles=True, edge_split_angle=1.32645, distance=1e-4):
+    # bmesh remove_doubles and the EDGE_SPLIT modifier, evaluated and written
+    # back into the mesh so shared meshes stay shared
+    import bpy
+    import bmesh
+    mesh = obj.data
+    if remove_doubles:
+        bm = bmesh.new()
+        bm.from_mesh(mesh)
+        bmesh.ops.remove_doubles(bm, verts=bm.verts, dist=distance)
+        bm.to_mesh(mesh)
+        bm.free()
+    if edge_split_angle is not None:
+        # only the split is evaluated, other modifiers stay as they are
+        shown = [(modifier, modifier.show_viewport) for modifier in obj.modifiers]
+        for modifier, _ in shown:
+            modifier.show_viewport = False
+        modifier = obj.modifiers.new("EdgeSplit", 'EDGE_SPLIT')
+        modifier.split_angle = edge_split_angle
+        split = bpy.data.meshes.new_from_object(obj.evaluated_get(bpy.context.evaluated_depsgraph_get()))
+        obj.modifiers.remove(modifier)
+        for modifier, show_viewport in shown:
+            modifier.show_viewport = show_viewport
+        bm = bmesh.new()
+        bm.from_mesh(split)
+        bm.to_mesh(mesh)
+        bm.free()
+        bpy.data.meshes.remove(split)
+    mesh.update()
+
+
+def clean_objects(objects, remove_doubles=True, edge_split=True, split_angle=1.32645, distance=1e-4, fallback=True):
+    # every selected mesh object, not just the first one. Meshes with layers the
+    # array path drops go through bmesh, or raise with fallback=False. Returns
+    # the objects whose mesh took the bmesh path.
+    users = {}
+    for obj in objects:
+        if obj.type == 'MESH':
+            users.setdefault(obj.data, []).append(obj)
+    fallbacks = []
+    for mesh, mesh_users in users.items():
+        layers = dropped_layers(mesh, mesh_users)
+        if not layers:
+            clean_mesh(mesh, remove_doubles, split_angle if edge_split else None, distance)
+        elif fallback:
+            fallbacks.append(mesh_users[0])
+        else:
+            raise ValueError(f"Mesh {mesh.name} has {', '.join(layers)}, which the array cleanup drops")
+    if fallbacks:
+        print(f"Cleaning {len(fallbacks)} meshes with bmesh to keep their layers")
+    for obj in fallbacks:
+        clean_bmesh(obj, remove_doubles, split_angle if edge_split else None, distance)
+    return fallbacks
@@ -0,0 +1,44 @@
+import os
+import json
+import numpy as np
+
+from writer import encode_png, quantize
+
+# Early preview of a pose plan. Every view is rendered at a reduced
+# resolution_percentage first; frames are read back from the Viewer node and
+# scored by the fraction of pixels showing the scene rather than the world
+# background and by their luminance contrast. Views that look empty or fully
+# occluded are flagged so the full resolution pass can skip them.
+
+
+def frame_stats(pixels, background=(1., 1., 1.), tolerance=1e-3):
+    # (H, W, 4) linear float pixels -> scene coverage and luminance contrast
+    color = pixels[..., :3]
+    empty = np.all(np.abs(color - np.asarray(background, dtype=np.float32)[:3]) < tolerance, axis=-1)
+    scene = ~(empty | (pixels[..., 3] <= 0))
+    luminance = color @ np.array([0.2126, 0.7152, 0.0722], dtype=np.float32)
+    return {
+        'coverage': float(scene.mean()),
+        'contrast': float(luminance[scene].std()) if scene.any() else 0.,
+    }
+
+
+def is_bad(stats, min_coverage=0.05, min_contrast=0.01):
+    return stats['coverage'] < min_coverage or stats['contrast'] < min_contrast
+
+
+def write_preview(path, pixels, color_depth='8', channels=3):
+    with open(path, 'wb') as f:
+        f.write(encode_png(quantize(pixels, color_depth, channels), level=1))
+
+
+def save_index(path, entries, **info):
+    # the preview set is published in one go, readers never see a partial index
+    with open(path + '.tmp', 'w') as f:
+        json.dump({**info, 'views': entries}, f, indent=4)
+    os.replace(path + '.tmp', path)
+
+
+def load_bad_views(path):
+    with open(path, 'r') as f:
+        return {entry['view'] for entry in json.load(f)['views'] if entry['bad']}
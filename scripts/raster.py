@@ -0,0 +1,378 @@
+# Blender free z-buffer rasterizer for the geometric passes. Takes a mesh and
+# the intrinsics / extrinsics of Camera.intrinsic() / Camera.extrinsic() and
+# returns depth, world space normal and object index maps in Blender's
+# conventions: depth is the camera space Z distance with 1e10 where nothing is
+# hit, normals are the geometric face normals and the index is the pass_index
+# of the importing scripts (1), 0 for the background.
+#
+# Pixels are sampled at their centres, triangles crossing the near plane are
+# dropped instead of clipped.
+#
+# Blender's PNG File Outputs encode through the scene view transform. The PNG
+# helpers reproduce 'Raw' (linear codes, the default) and 'Standard' (the sRGB
+# curve); Filmic / AgX are not reproduced. Render dithering adds noise on top,
+# set render.dither_intensity to 0 for exact codes.
+#
+# Example:
+# python scripts/raster.py D:/Mesh/scenes/forest/scene.obj --manifest D:/Mesh/scenes/forest/cams/cams.npy --workers 8
+# blender --background --python scripts/raster.py -- D:/Mesh/scenes/small/scene.obj --validate 4
+
+import os
+import sys
+import glob
+import argparse
+import numpy as np
+from multiprocessing import Pool
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from pose import invert_pose, pose_batch
+from export import gl2cv
+from manifest import load_manifest, str2cam
+from writer import encode_png, linear2srgb
+
+background_depth = 1e10
+view_transforms = ('Raw', 'Standard')
+# Blender's OBJ importer: forward -Z, up Y, (x, y, z) -> (x, -z, y)
+obj2blender = np.array([
+    [1., 0., 0.],
+    [0., 0., -1.],
+    [0., 1., 0.],
+])
+
+
+def load_obj(path, scale=1., object_ids=False):
+    # triangulated (V, 3) vertices, (F, 3) faces and (F,) object indices in
+    # Blender world space, object indices count 'o' / 'g' blocks from 1
+    vertices, faces, ids = [], [], []
+    object_id = 1
+    started = False
+    with open(path, 'r') as f:
+        for line in f:
+            if line.startswith('v '):
+                vertices.append(line.split()[1:4])
+            elif line.startswith('f '):
+                corners = [int(c.split('/')[0]) for c in line.split()[1:]]
+                corners = [c - 1 if c > 0 else len(vertices) + c for c in corners]
+                # fan triangulation
+                for a, b in zip(corners[1:-1], corners[2:]):
+                    faces.append((corners[0], a, b))
+                    ids.append(object_id)
+                started = True
+            elif object_ids and line[:2] in ('o ', 'g ') and started:
+                object_id += 1
+                started = False
+    vertices = np.array(vertices, dtype=float).reshape(-1, 3) @ obj2blender.T * scale
+    faces = np.array(faces, dtype=np.int64).reshape(-1, 3)
+    ids = np.array(ids, dtype=np.int32) if object_ids else np.ones(len(faces), dtype=np.int32)
+    return vertices, faces, ids
+
+
+def face_normals(vertices, faces):
+    tri = vertices[faces]
+    normals = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    norm = np.linalg.norm(normals, axis=1, keepdims=True)
+    return normals / np.maximum(norm, 1e-12)
+
+
+def project(vertices, intrinsic, extrinsic):
+    # Blender camera 2 world extrinsic -> (V, 2) pixel coordinates and (V,) camera space depth
+    world2cam = gl2cv @ invert_pose(extrinsic)[0]
+    cam = vertices @ world2cam[:3, :3].T + world2cam[:3, 3]
+    pixel = cam @ np.asarray(intrinsic).T
+    z = cam[:, 2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        uv = pixel[:, :2] / z[:, None]
+    return uv, z
+
+
+def setup_triangles(uv, z, faces, width, height, near):
+    # per triangle pixel bounding boxes and barycentric plane equations
+    tri_z = z[faces]
+    visible = (tri_z > near).all(axis=1)
+    faces_index = np.flatnonzero(visible)
+    tri = uv[faces[visible]]
+    x, y = tri[..., 0], tri[..., 1]
+    # pixel i covers [i, i + 1), sampled at i + 0.5
+    x_min = np.maximum(np.ceil(x.min(axis=1) - 0.5), 0).astype(np.int64)
+    x_max = np.minimum(np.floor(x.max(axis=1) - 0.5), width - 1).astype(np.int64)
+    y_min = np.maximum(np.ceil(y.min(axis=1) - 0.5), 0).astype(np.int64)
+    y_max = np.minimum(np.floor(y.max(axis=1) - 0.5), height - 1).astype(np.int64)
+    d = (y[:, 1] - y[:, 2]) * (x[:, 0] - x[:, 2]) + (x[:, 2] - x[:, 1]) * (y[:, 0] - y[:, 2])
+    keep = (x_min <= x_max) & (y_min <= y_max) & (np.abs(d) > 1e-12)
+    x, y, d, tri_z = x[keep], y[keep], d[keep], tri_z[visible][keep]
+    # b0 = a0 * px + c0 * py + e0, b1 likewise, b2 = 1 - b0 - b1
+    planes = np.stack([
+        (y[:, 1] - y[:, 2]) / d, (x[:, 2] - x[:, 1]) / d,
+        (y[:, 2] - y[:, 0]) / d, (x[:, 0] - x[:, 2]) / d,
+    ], axis=1)
+    return {
+        'face': faces_index[keep],
+        'x_min': x_min[keep], 'y_min': y_min[keep],
+        'x_size': x_max[keep] - x_min[keep] + 1, 'y_size': y_max[keep] - y_min[keep] + 1,
+        'origin': np.stack([x[:, 2], y[:, 2]], axis=1),
+        'planes': planes,
+        'inv_z': 1. / tri_z,
+    }
+
+
+def rasterize(vertices, faces, intrinsic, extrinsic, width, height, near=1e-3, budget=2**21):
+    # (H, W) depth and (H, W) index of the visible face, -1 for the background
+    uv, z = project(vertices, intrinsic, extrinsic)
+    tris = setup_triangles(uv, z, faces, width, height, near)
+    zbuffer = np.full(width * height, np.inf)
+    face_buffer = np.full(width * height, -1, dtype=np.int64)
+    counts = tris['x_size'] * tris['y_size']
+    # chunks of triangles covering about `budget` candidate pixels
+    bounds = np.searchsorted(np.cumsum(counts), np.arange(budget, counts.sum() + budget, budget), side='right')
+    bounds = np.unique(np.concatenate([[0], np.maximum(bounds, 1), [len(counts)]]))
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        count = counts[start:stop]
+        t = np.repeat(np.arange(start, stop), count)
+        offset = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        px = tris['x_min'][t] + offset % tris['x_size'][t]
+        py = tris['y_min'][t] + offset // tris['x_size'][t]
+        dx = px + 0.5 - tris['origin'][t, 0]
+        dy = py + 0.5 - tris['origin'][t, 1]
+        planes = tris['planes'][t]
+        b0 = planes[:, 0] * dx + planes[:, 1] * dy
+        b1 = planes[:, 2] * dx + planes[:, 3] * dy
+        b2 = 1. - b0 - b1
+        inside = (b0 >= 0) & (b1 >= 0) & (b2 >= 0)
+        t, px, py = t[inside], px[inside], py[inside]
+        # 1 / z is linear in screen space
+        inv_z = tris['inv_z'][t]
+        depth = 1. / (b0[inside] * inv_z[:, 0] + b1[inside] * inv_z[:, 1] + b2[inside] * inv_z[:, 2])
+        pixel = py * width + px
+        # nearest candidate per pixel, then against the buffer
+        order = np.lexsort((depth, pixel))
+        pixel, depth, t = pixel[order], depth[order], t[order]
+        first = np.concatenate([[True], pixel[1:] != pixel[:-1]]) if len(pixel) else np.zeros(0, dtype=bool)
+        pixel, depth, t = pixel[first], depth[first], t[first]
+        closer = depth < zbuffer[pixel]
+        zbuffer[pixel[closer]] = depth[closer]
+        face_buffer[pixel[closer]] = tris['face'][t[closer]]
+    zbuffer[face_buffer < 0] = background_depth
+    return zbuffer.reshape(height, width), face_buffer.reshape(height, width)
+
+
+def render_passes(vertices, faces, ids, intrinsic, extrinsic, width, height, normals=None, radial=False):
+    depth, face = rasterize(vertices, faces, intrinsic, extrinsic, width, height)
+    hit = face >= 0
+    if radial:
+        # distance to the camera centre instead of the Z distance
+        u, v = np.meshgrid(np.arange(width) + 0.5, np.arange(height) + 0.5)
+        ray = np.linalg.solve(intrinsic, np.stack([u, v, np.ones_like(u)]).reshape(3, -1)).T.reshape(height, width, 3)
+        depth = np.where(hit, depth * np.linalg.norm(ray, axis=2), background_depth)
+    normals = face_normals(vertices, faces) if normals is None else normals
+    normal = np.where(hit[..., None], normals[np.maximum(face, 0)], 0.)
+    index = np.where(hit, ids[np.maximum(face, 0)], 0)
+    return depth.astype(np.float32), normal.astype(np.float32), index.astype(np.int32)
+
+
+def encode_view(value, color_depth='8', view_transform='Raw'):
+    # compositor values -> PNG codes through a view transform
+    if view_transform not in view_transforms:
+        raise ValueError(f"View transform {view_transform} is not reproduced, choose from {view_transforms}")
+    value = linear2srgb(value) if view_transform == 'Standard' else np.clip(value, 0., 1.)
+    scale, dtype = (65535, np.uint16) if color_depth == '16' else (255, np.uint8)
+    return (value * scale + 0.5).astype(dtype)
+
+
+def depth2png(depth, depth_scale=1.4, offset=-0.7, color_depth='8', view_transform='Raw'):
+    # the Map Value node of scripts/passes.py: (depth + offset) * size, min 0
+    return encode_view((depth + offset) * depth_scale, color_depth, view_transform)
+
+
+def normal2png(normal, color_depth='8', view_transform='Raw'):
+    # the Multiply / Add nodes of scripts/passes.py
+    return encode_view(normal * 0.5 + 0.5, color_depth, view_transform)
+
+
+def index2png(index, color_depth='8', view_transform='Raw'):
+    # the Divide node of scripts/passes.py: index / 2**color_depth
+    return encode_view(index / 2**int(color_depth), color_depth, view_transform)
+
+
+def load_cams(manifest='', cam_folder=''):
+    # (extrinsic, intrinsic, name) of every written view
+    cams = []
+    if manifest:
+        records = load_manifest(manifest)
+        for k in np.flatnonzero(records['view'] >= 0):
+            name = os.path.splitext(records['image'][k].decode())[0] or f"{k:05d}"
+            cams.append((np.array(records['extrinsic'][k]), np.array(records['intrinsic'][k]), name))
+    for path in sorted(glob.glob(os.path.join(cam_folder, '*_cam.txt'))) if cam_folder else []:
+        with open(path, 'r') as f:
+            extrinsic, intrinsic = str2cam(f.read())
+        cams.append((extrinsic, intrinsic, os.path.basename(path)[:-len('_cam.txt')]))
+    return cams
+
+
+mesh = None
+
+
+def init_worker(vertices, faces, ids):
+    global mesh
+    mesh = (vertices, faces, ids, face_normals(vertices, faces))
+
+
+def raster_view(job):
+    extrinsic, intrinsic, name, folder, width, height, outputs, color_depth, view_transform = job
+    vertices, faces, ids, normals = mesh
+    depth, normal, index = render_passes(vertices, faces, ids, intrinsic, extrinsic, width, height, normals)
+    path = os.path.join(folder, name)
+    if 'depth' in outputs:
+        np.save(f"{path}-depth.npy", depth)
+    if 'depth_png' in outputs:
+        write_png(f"{path}-depth.png", depth2png(depth, color_depth=color_depth, view_transform=view_transform))
+    if 'normal' in outputs:
+        write_png(f"{path}-normal.png", normal2png(normal, color_depth, view_transform))
+    if 'id' in outputs:
+        write_png(f"{path}-id.png", index2png(index, color_depth, view_transform))
+    return name
+
+
+def write_png(path, array):
+    with open(path, 'wb') as f:
+        f.write(encode_png(array))
+
+
+def raster_views(vertices, faces, ids, cams, folder, width, height, outputs=('depth', 'normal', 'id'), color_depth='8',
+        workers=1, view_transform='Raw'):
+    os.makedirs(folder, exist_ok=True)
+    jobs = [(extrinsic, intrinsic, name, folder, width, height, outputs, color_depth, view_transform) for extrinsic, intrinsic, name in cams]
+    if workers <= 1:
+        init_worker(vertices, faces, ids)
+        return [raster_view(job) for job in jobs]
+    with Pool(workers, initializer=init_worker, initargs=(vertices, faces, ids)) as pool:
+        return list(pool.imap_unordered(raster_view, jobs))
+
+
+def compare_passes(depth, normal, index, ref_depth, ref_normal, ref_index, depth_tolerance=1e-2):
+    # agreement with Blender's passes on the pixels both consider covered
+    hit, ref_hit = depth < background_depth / 2, ref_depth < background_depth / 2
+    both = hit & ref_hit
+    depth_error = np.abs(depth - ref_depth)[both]
+    relative = depth_error / np.maximum(ref_depth[both], 1e-6)
+    cosine = (normal * ref_normal).sum(axis=-1)[both]
+    return {
+        'coverage_iou': float(both.sum() / max((hit | ref_hit).sum(), 1)),
+        'depth_abs_median': float(np.median(depth_error)) if both.any() else 0.,
+        'depth_rel_p99': float(np.percentile(relative, 99)) if both.any() else 0.,
+        'depth_within_tolerance': float((relative < depth_tolerance).mean()) if both.any() else 1.,
+        # Blender may shade both sides, compare the normal lines
+        'normal_angle_median': float(np.degrees(np.median(np.arccos(np.clip(np.abs(cosine), 0, 1))))) if both.any() else 0.,
+        'index_agreement': float((index == ref_index)[both].mean()) if both.any() else 1.,
+    }
+
+
+def compare_pngs(codes, depth, normal, index, hit, bits, view_transform='Standard'):
+    # median code difference of the PNG helpers to Blender's PNG outputs per pass
+    expected = {
+        'depth': depth2png(depth, color_depth=str(bits['depth']), view_transform=view_transform),
+        'normal': normal2png(normal, str(bits['normal']), view_transform)[..., :3],
+        'id': index2png(index, str(bits['id']), view_transform),
+    }
+    return {f"{name}_png_code_median": float(np.median(np.abs(codes[name].astype(np.int64) - expected[name])[hit]))
+        if hit.any() else 0. for name in expected}
+
+
+def validate(obj_path, views=4, width=320, height=240, seed=0):
+    # render depth / normal / index with Cycles and compare with the rasterizer,
+    # once as EXR and once as PNG through the Standard view transform
+    import bpy
+    from passes import setup_outputs
+
+    scene = bpy.context.scene
+    render = scene.render
+    for obj in list(scene.objects):
+        if obj.type == 'MESH':
+            bpy.data.objects.remove(obj, do_unlink=True)
+    bpy.ops.import_scene.obj(filepath=obj_path)
+    for obj in bpy.context.selected_objects:
+        obj.pass_index = 1
+    render.engine = 'CYCLES'
+    scene.cycles.samples = 1
+    # a single sample at the pixel centre, like the rasterizer
+    scene.cycles.pixel_filter_type = 'BOX'
+    scene.cycles.filter_width = 0.01
+    render.resolution_x, render.resolution_y, render.resolution_percentage = width, height, 100
+    scene.view_settings.view_transform = 'Standard'
+    render.dither_intensity = 0
+
+    vertices, faces, ids = load_obj(obj_path)
+    center = (vertices.min(axis=0) + vertices.max(axis=0)) / 2
+    extent = np.linalg.norm(vertices.max(axis=0) - vertices.min(axis=0))
+    locations, rotations, matrices = pose_batch(center, [extent], views, np.random.default_rng(seed))
+    camera = scene.camera
+    camera.rotation_mode = 'XYZ'
+    camera.data.shift_x = camera.data.shift_y = 0
+    focal = camera.data.lens / camera.data.sensor_width * width
+    intrinsic = np.array([[focal, 0, width / 2], [0, focal, height / 2], [0, 0, 1]])
+    camera.data.sensor_fit = 'HORIZONTAL'
+    folder = bpy.app.tempdir
+    reports = []
+    for k in range(views):
+        camera.location = locations[k]
+        camera.rotation_euler = np.radians(rotations[k])
+        ref, codes, bits = {}, {}, {}
+        for file_format, color_depth, ext in (('OPEN_EXR', '32', 'exr'), ('PNG', '16', 'png')):
+            file_outputs = setup_outputs(['depth', 'normal', 'id'], file_format, color_depth)
+            if file_format == 'OPEN_EXR':
+                # raw normals, the rasterizer does not apply the PNG scale and bias
+                render_layers = scene.node_tree.nodes['Render Layers']
+                scene.node_tree.links.new(render_layers.outputs['Normal'], file_outputs['normal'].inputs[0])
+            for name, node in file_outputs.items():
+                node.file_slots[0].path = os.path.join(folder, f"validate-{k:03d}-{name}-")
+            bpy.ops.render.render()
+            for name, node in file_outputs.items():
+                image = bpy.data.images.load(os.path.join(folder, f"validate-{k:03d}-{name}-{scene.frame_current:04d}.{ext}"))
+                image.colorspace_settings.name = 'Non-Color'
+                pixels = np.empty(width * height * image.channels, dtype=np.float32)
+                image.pixels.foreach_get(pixels)
+                pixels = np.flipud(pixels.reshape(height, width, image.channels))
+                bpy.data.images.remove(image)
+                if ext == 'exr':
+                    ref[name] = pixels
+                else:
+                    # Non-Color PNG pixels are the codes over their maximum
+                    bits[name] = int(node.format.color_depth)
+                    codes[name] = np.rint(pixels * (2**bits[name] - 1)).astype(np.int64)
+        depth, normal, index = render_passes(vertices, faces, ids, intrinsic, matrices[k], width, height)
+        report = compare_passes(depth, normal, index,
+            ref['depth'][..., 0], ref['normal'][..., :3], np.round(ref['id'][..., 0]).astype(np.int32))
+        hit = (depth < background_depth / 2) & (ref['depth'][..., 0] < background_depth / 2)
+        report.update(compare_pngs({'depth': codes['depth'][..., 0], 'normal': codes['normal'][..., :3],
+            'id': codes['id'][..., 0]}, depth, normal, index, hit, bits))
+        print(f"view {k}: {report}")
+        reports.append(report)
+    return reports
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rasterize depth, normal and object index maps without Blender')
+    parser.add_argument('mesh', type=str, help='OBJ scene, in the coordinates Blender imports it to')
+    parser.add_argument('--manifest', default='', help='cams.npy of the views')
+    parser.add_argument('--cam_folder', default='', help='folder of NN-III_cam.txt files, instead of --manifest')
+    parser.add_argument('--output_folder', default='', help='default raster/ next to the mesh')
+    parser.add_argument('--resolution', type=int, nargs=2, default=[1280, 720])
+    parser.add_argument('--outputs', type=str, nargs='+', default=['depth', 'normal', 'id'],
+        help='any of depth (float32 .npy), depth_png, normal, id')
+    parser.add_argument('--color_depth', default='8', help='PNG bits per channel, 8 or 16')
+    parser.add_argument('--view_transform', default='Raw', choices=view_transforms,
+        help="view transform of the Blender scene the PNGs should match, 'Raw' writes linear codes")
+    parser.add_argument('--scale', type=float, default=1., help='scale applied to the mesh, like scripts/render.py')
+    parser.add_argument('--object_ids', action='store_true', default=False, help='one index per OBJ object instead of 1')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--validate', type=int, default=0, help='inside Blender, compare this many views with Cycles')
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    args = parser.parse_args(argv)
+    if args.validate:
+        validate(args.mesh, args.validate)
+        sys.exit(0)
+    vertices, faces, ids = load_obj(args.mesh, args.scale, args.object_ids)
+    cams = load_cams(args.manifest, args.cam_folder)
+    folder = args.output_folder or os.path.join(os.path.dirname(args.mesh), "raster")
+    names = raster_views(vertices, faces, ids, cams, folder, *args.resolution, args.outputs, args.color_depth,
+        args.workers, args.view_transform)
+    print(f"Rasterized {len(names)} views of {len(faces)} triangles to {folder}")
@@ -5,6 +5,14 @@ import math
 import argparse
 from typing import Tuple
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from journal import Journal
+from cache import cache_path, load_scene, save_scene
+from preprocess import clean_objects
+from animation import bake_keys, clear_animation, render_frames, rename_frames
+from passes import setup_outputs
+from timing import Timer, write_summary
+
 parser = argparse.ArgumentParser(description='Blender Camera')
 
 parser.add_argument('--root_folder', default='D:/Mesh/scenes/')
@@ -16,10 +24,11 @@ parser.add_argument('--color_depth', default='8')
 parser.add_argument('--color_mode', default='RGBA')
 parser.add_argument('-x', '--resolution_x', default=1280)
 parser.add_argument('-y', '--resolution_y', default=720)
-parser.add_argument('-v', '--views', default=5)
+parser.add_argument('-v', '--views', type=int, default=5)
 parser.add_argument('--scale', default=1.)
 parser.add_argument('--remove_doubles', default=True)
 parser.add_argument('--edge_split', default=True)
+parser.add_argument('--no_cache', action='store_true', default=False, help='always reimport and preprocess scene.obj')
 
 parser.add_argument('--location', default=[5., 5., -1.5], help='camera location')
 parser.add_argument('--rotation', default=[180., 0., 0.], help='camera rotation')
@@ -30,6 +39,13 @@ parser.add_argument('--sun_location', default=[0., 0., 10])
 parser.add_argument('--sun_rotation', default=[180., 0., 0.])
 parser.add_argument('--energy', default=20)
 
+parser.add_argument('--shard', type=int, default=0, help='render views i with i %% shards == shard')
+parser.add_argument('--shards', type=int, default=1)
+parser.add_argument('--threads', type=int, default=0, help='render threads, 0 for auto')
+parser.add_argument('--resume', action='store_true', default=False, help='skip views completed by a previous run')
+parser.add_argument('--animation', action='store_true', default=False, help='bake the orbit into keyframes and render it in one call')
+parser.add_argument('--timing_format', default='jsonl', help="per view stage timings file, 'jsonl' or 'csv'")
+
 argv = sys.argv[sys.argv.index("--") + 1:]
 args = parser.parse_args(argv)
 
@@ -40,13 +56,19 @@ render = scene.render
 
 def delete_and_import(
     no_load = True,
-    obj_folder = ""
+    obj_folder = "",
+    cache = "",
 ):
+    # returns True if the prepared scene was loaded from the cache
     if not no_load:
         context.active_object.select_set(True)
         bpy.ops.object.delete()
+        if cache and os.path.isfile(cache):
+            load_scene(cache)
+            return True
         obj_path = os.path.join(obj_folder, "scene.obj")
         bpy.ops.import_scene.obj(filepath=obj_path)
+    return False
 
 
 class Camera(object):
@@ -125,48 +147,39 @@ def main(args=None):
     render.resolution_y = args.resolution_y
     render.resolution_percentage = 100
     render.film_transparent = True
+    if args.threads:
+        render.threads_mode = 'FIXED'
+        render.threads = args.threads
 
     # Set up 3D model
     io_folder = os.path.join(args.root_folder, args.scene)
-    delete_and_import(args.no_load, io_folder)
-
-    # Set output nodes
-    scene.use_nodes = True
-    scene.view_layers["ViewLayer"].use_pass_normal = True
-    scene.view_layers["ViewLayer"].use_pass_diffuse_color = True
-    scene.view_layers["ViewLayer"].use_pass_object_index = True
-    tree = scene.node_tree
-    links = tree.links
-    # Clear default nodes
-    for n in tree.nodes:
-        tree.nodes.remove(n)
-    render_layers = tree.nodes.new('CompositorNodeRLayers')
-
-    # Set up output files
-    image_file_output = tree.nodes.new(type="CompositorNodeOutputFile")
-    image_file_output.label = 'Image'
-    image_file_output.base_path = ''
-    links.new(render_layers.outputs['Image'], image_file_output.inputs[0])
+    cache = ""
+    if not (args.no_load or args.no_cache):
+        cache = cache_path(os.path.join(io_folder, "scene.obj"), scale=float(args.scale),
+            remove_doubles=bool(args.remove_doubles), edge_split=bool(args.edge_split))
+    cached = delete_and_import(args.no_load, io_folder, cache)
+
+    # Set output nodes, only the image pass is written
+    image_file_output = setup_outputs(['image'], view_layer=scene.view_layers["ViewLayer"])['image']
 
     # Select object
     obj = bpy.context.selected_objects[0]
     # obj.rotation_euler[0] += 180
     context.view_layer.objects.active = obj
-    for slot in obj.material_slots:
-        node = slot.material.node_tree.nodes['Principled BSDF']
-        node.inputs['Specular'].default_value = 0.05
-    if args.scale != 1:
-        bpy.ops.transform.resize(value=(args.scale,args.scale,args.scale))
-        bpy.ops.object.transform_apply(scale=True)
-    if args.remove_doubles:
-        bpy.ops.object.mode_set(mode='EDIT')
-        bpy.ops.mesh.remove_doubles()
-        bpy.ops.object.mode_set(mode='OBJECT')
-    if args.edge_split:
-        bpy.ops.object.modifier_add(type='EDGE_SPLIT')
-        context.object.modifiers["EdgeSplit"].split_angle = 1.32645
-        bpy.ops.object.modifier_apply(modifier="EdgeSplit")
-    obj.pass_index = 1
+    if not cached:
+        for selected in bpy.context.selected_objects:
+            for slot in selected.material_slots:
+                node = slot.material.node_tree.nodes['Principled BSDF']
+                node.inputs['Specular'].default_value = 0.05
+        if args.scale != 1:
+            bpy.ops.transform.resize(value=(args.scale,args.scale,args.scale))
+            bpy.ops.object.transform_apply(scale=True)
+        if args.remove_doubles or args.edge_split:
+            clean_objects(bpy.context.selected_objects, args.remove_doubles, args.edge_split, split_angle=1.32645)
+        for selected in bpy.context.selected_objects:
+            selected.pass_index = 1
+        if cache:
+            save_scene(cache, bpy.context.selected_objects)
 
     # Light
     light = Light(args.sun_location, args.sun_rotation, args.energy)
@@ -177,14 +190,50 @@ def main(args=None):
     # Rendering
     render.filepath = os.path.join(io_folder, "blender_camera/")
     print(f"{'-'*15}Start Rendering{'-'*15}")
+    journal_name = "journal.jsonl" if args.shards == 1 else f"journal-{args.shard:02d}-of-{args.shards:02d}.jsonl"
+    journal = Journal(os.path.join(io_folder, journal_name), args.resume)
+    timing_name = "timings" if args.shards == 1 else f"timings-{args.shard:02d}-of-{args.shards:02d}"
+    timer = Timer(os.path.join(io_folder, f"{timing_name}.{args.timing_format}"), args.resume)
+    timer.watch_render()
     stepsize = 360.0 / args.views
+    pending = []
     for i in range(args.views):
         step_angle = stepsize * i
+        if i % args.shards != args.shard or journal.done(i, ([step_angle],)):
+            continue
+        image = f"image_{int(step_angle):0>3d}{scene.frame_current:04d}{render.file_extension}"
+        if args.animation:
+            pending.append((i, step_angle, image))
+            continue
         print(f"Rotation {step_angle}, {math.radians(step_angle)}")
 
+        timer.start(i)
+        with timer.stage('set_camera'):
+            cam.empty.rotation_euler[2] = math.radians(step_angle)
         image_file_output.file_slots[0].path = render.filepath + f"image_{int(step_angle):0>3d}"
-        bpy.ops.render.render(write_still=True)
-        cam.empty.rotation_euler[2] += math.radians(stepsize)
+        with timer.stage('render'):
+            bpy.ops.render.render(write_still=True)
+        with timer.stage('journal'):
+            journal.record(i, [render.filepath + image], ([step_angle],))
+    if pending:
+        print(f"Rendering {len(pending)} rotations as one animation")
+        timer.start('animation', len(pending))
+        angles = [[0., 0., math.radians(step_angle)] for _, step_angle, _ in pending]
+        with timer.stage('bake'):
+            bake_keys(cam.empty, 'rotation_euler', angles)
+        image_file_output.file_slots[0].path = render.filepath + "frame_"
+        with timer.stage('render'):
+            render_frames(len(pending), keep_output=False)
+        with timer.stage('rename'):
+            rename_frames(render.filepath + "frame_", [render.filepath + image for _, _, image in pending], render.file_extension)
+        with timer.stage('journal'):
+            for i, step_angle, image in pending:
+                journal.record(i, [render.filepath + image], ([step_angle],))
+        clear_animation(cam.empty)
+    if journal.stale:
+        print(f"Resume: re-rendered {journal.stale} views journaled with a different pose")
+    journal.close()
+    write_summary(timer.close(), os.path.join(io_folder, f"{timing_name}-summary.json"))
 
 if __name__ == '__main__':
     main(args)
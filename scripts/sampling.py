@@ -0,0 +1,88 @@
+import zlib
+import numpy as np
+
+# Sphere and hemisphere samplers for camera directions. Pure NumPy.
+# All samplers return (n, 3) unit vectors inside an elevation band, given in
+# degrees above the horizontal plane: -90, 90 is the full sphere, 0, 90 the
+# upper hemisphere. Heights are drawn uniformly within the band, which is
+# uniform in area on the sphere.
+#
+# stream(seed, *keys) gives an independent generator per key, e.g. one per
+# radius ring or per shard, that does not depend on the order it is drawn in.
+
+golden_ratio = (1 + 5 ** 0.5) / 2
+
+
+def stream(seed, *keys):
+    # keys are ints or names, e.g. stream(seed, 'ring', 2)
+    keys = tuple(k if isinstance(k, (int, np.integer)) else zlib.crc32(str(k).encode()) for k in keys)
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=keys))
+
+
+def band2sphere(u, v, min_elevation=-90., max_elevation=90.):
+    # unit square samples -> directions, u picks the height, v the azimuth
+    z0, z1 = np.sin(np.radians([min_elevation, max_elevation]))
+    z = z0 + (z1 - z0) * np.asarray(u, dtype=float)
+    r = np.sqrt(np.maximum(1. - z**2, 0.))
+    phi = 2 * np.pi * np.asarray(v, dtype=float)
+    return np.stack([r * np.cos(phi), r * np.sin(phi), z], axis=1)
+
+
+def uniform_sphere(n, rng=None, min_elevation=-90., max_elevation=90.):
+    rng = rng if rng is not None else np.random.default_rng()
+    return band2sphere(rng.random(n), rng.random(n), min_elevation, max_elevation)
+
+
+def fibonacci_sphere(n, rng=None, min_elevation=-90., max_elevation=90.):
+    # Fibonacci lattice, rotated about Z by a random angle if rng is given
+    i = np.arange(n)
+    offset = rng.random() if rng is not None else 0.
+    return band2sphere((i + 0.5) / max(n, 1), (i / golden_ratio + offset) % 1., min_elevation, max_elevation)
+
+
+def stratified_sphere(n, rng=None, min_elevation=-90., max_elevation=90.):
+    # one jittered sample per equal area cell, rows of cells stacked in height
+    rng = rng if rng is not None else np.random.default_rng()
+    rows = max(1, int(round(np.sqrt(n / 2))))
+    per_row = np.full(rows, n // rows) + (np.arange(rows) < n % rows)
+    row = np.repeat(np.arange(rows), per_row)
+    column = np.arange(n) - np.repeat(np.cumsum(per_row) - per_row, per_row)
+    u = (row + rng.random(n)) / rows
+    v = (column + rng.random(n)) / np.maximum(per_row[row], 1)
+    return band2sphere(u, v, min_elevation, max_elevation)
+
+
+def radical_inverse(index, base):
+    index = np.asarray(index, dtype=np.int64).copy()
+    result = np.zeros(index.shape)
+    scale = 1. / base
+    while index.any():
+        result += (index % base) * scale
+        index //= base
+        scale /= base
+    return result
+
+
+def halton_sphere(n, rng=None, min_elevation=-90., max_elevation=90., start=0):
+    # Halton points 2, 3 from index start + 1, randomly shifted (Cranley-Patterson) if rng is given
+    i = np.arange(start + 1, start + n + 1)
+    shift = rng.random(2) if rng is not None else np.zeros(2)
+    u = (radical_inverse(i, 2) + shift[0]) % 1.
+    v = (radical_inverse(i, 3) + shift[1]) % 1.
+    return band2sphere(u, v, min_elevation, max_elevation)
+
+
+samplers = {
+    'uniform': uniform_sphere,
+    'fibonacci': fibonacci_sphere,
+    'stratified': stratified_sphere,
+    'halton': halton_sphere,
+}
+
+
+def sample_sphere(sampler, n, rng=None, min_elevation=-90., max_elevation=90.):
+    if sampler not in samplers:
+        raise ValueError(f"Unknown sampler {sampler}, choose from {sorted(samplers)}")
+    if min_elevation > max_elevation:
+        raise ValueError(f"Elevation band {min_elevation}, {max_elevation} is empty")
+    return samplers[sampler](n, rng, min_elevation, max_elevation)
@@ -0,0 +1,133 @@
+# Conversion of rendered OPEN_EXR passes into one preallocated memory mapped
+# array per pass, shape (N, H, W, C): float16 for depth and normals, uint16
+# for object indices. Frames are streamed block by block into the mapping by
+# worker processes, so no frame is held as a whole. frames.json maps the
+# frame index to its view and pose. Training reads the arrays with
+# np.load(path, mmap_mode='r'), without decoding or copying.
+#
+# Depths beyond the float16 range, the 1e10 of the background, become inf.
+#
+# Example:
+# python scripts/tensors.py /tmp/model --passes depth normal id --workers 8
+
+import os
+import re
+import sys
+import glob
+import json
+import argparse
+import numpy as np
+from multiprocessing import Pool
+from numpy.lib.format import open_memmap
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from exr import read_header, iter_blocks, group_passes
+from manifest import str2cam
+
+# channels and dtype of every pass
+pass_formats = {
+    'depth': (1, np.float16),
+    'normal': (3, np.float16),
+    'albedo': (4, np.float16),
+    'id': (1, np.uint16),
+}
+
+
+def find_frames(folder, passes):
+    # {(view, frame): {pass: path}} of <view>[_]<pass>[_]NNNN.exr files, sorted:
+    # example.py's m_r_030_depth0001.exr and blender_small.py's blenderdepth_0001.exr
+    frames = {}
+    for name in passes:
+        pattern = re.compile(rf"(.*?)_?{name}_?(\d{{4}})\.exr")
+        for path in glob.glob(os.path.join(folder, f"*{name}*.exr")):
+            match = pattern.fullmatch(os.path.basename(path))
+            if match:
+                frames.setdefault((match.group(1), int(match.group(2))), {})[name] = path
+    return {key: frames[key] for key in sorted(frames)}
+
+
+def pass_channels(header, channels):
+    # the first `channels` channels of the first pass in the file
+    names = [c['name'] for c in header['channels']]
+    return next(iter(group_passes(names).values()))[:channels]
+
+
+def view_pose(view, cam_folder=''):
+    # camera record of the view if there is one, else the turntable angle of its name
+    cam_path = os.path.join(cam_folder, view + "_cam.txt")
+    if cam_folder and os.path.isfile(cam_path):
+        with open(cam_path, 'r') as f:
+            extrinsic, _ = str2cam(f.read())
+        return {'extrinsic': extrinsic.tolist()}
+    match = re.search(r'_r_(\d+)$', view)
+    return {'rotation': float(match.group(1))} if match else None
+
+
+def convert_frame(job):
+    # stream one EXR into row `index` of an existing array
+    path, array_path, index = job
+    array = np.load(array_path, mmap_mode='r+')
+    with open(path, 'rb') as f:
+        header = read_header(f)
+    if (header['height'], header['width']) != array.shape[1:3]:
+        raise ValueError(f"{path} is {header['width']}x{header['height']}, expected {array.shape[2]}x{array.shape[1]}")
+    names = pass_channels(header, array.shape[3])
+    for y, block in iter_blocks(path):
+        values = np.stack([block[n] for n in names], axis=-1).astype(np.float32)
+        if array.dtype == np.uint16:
+            values = np.clip(np.rint(values), 0, 65535)
+        else:
+            values = np.where(np.abs(values) > np.finfo(np.float16).max, np.copysign(np.inf, values), values)
+        array[index, y:y + len(values), :, :len(names)] = values.astype(array.dtype)
+    array.flush()
+    del array
+    return index
+
+
+def convert(folder, output_folder, passes=('depth', 'normal', 'id'), workers=os.cpu_count(), cam_folder=''):
+    frames = find_frames(folder, passes)
+    if not frames:
+        raise ValueError(f"No {'/'.join(passes)} EXR files in {folder}")
+    views = list(frames)
+    os.makedirs(output_folder, exist_ok=True)
+    jobs, arrays = [], {}
+    for name in passes:
+        paths = [frames[view].get(name) for view in views]
+        first = next((p for p in paths if p), None)
+        if first is None:
+            continue
+        with open(first, 'rb') as f:
+            header = read_header(f)
+        channels, dtype = pass_formats[name]
+        arrays[name] = os.path.join(output_folder, f"{name}.npy")
+        # frames missing a pass stay zero
+        open_memmap(arrays[name], mode='w+', dtype=dtype,
+            shape=(len(views), header['height'], header['width'], channels)).flush()
+        jobs += [(path, arrays[name], index) for index, path in enumerate(paths) if path]
+    with Pool(max(1, workers)) as pool:
+        for _ in pool.imap_unordered(convert_frame, jobs):
+            pass
+    sidecar = {
+        'passes': {name: os.path.basename(path) for name, path in arrays.items()},
+        'frames': [{'index': index, 'view': view, 'frame': frame, 'pose': view_pose(view, cam_folder),
+            'files': {name: os.path.basename(path) for name, path in frames[(view, frame)].items()}}
+            for index, (view, frame) in enumerate(views)],
+    }
+    with open(os.path.join(output_folder, "frames.json"), 'w') as f:
+        json.dump(sidecar, f, indent=4)
+    return arrays
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert EXR passes to memory mapped arrays')
+    parser.add_argument('folder', type=str, help='folder of <view>[_]<pass>[_]NNNN.exr files')
+    parser.add_argument('--output_folder', default='', help='default: <folder>/tensors')
+    parser.add_argument('--passes', nargs='+', default=['depth', 'normal', 'id'], choices=list(pass_formats))
+    parser.add_argument('--cam_folder', default='', help='<view>_cam.txt records for the poses')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args(sys.argv[1:])
+    arrays = convert(args.folder, args.output_folder or os.path.join(args.folder, "tensors"),
+        args.passes, args.workers, args.cam_folder)
+    for name, path in arrays.items():
+        array = np.load(path, mmap_mode='r')
+        print(f"{name}: {array.shape} {array.dtype} -> {path}")
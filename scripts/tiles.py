@@ -0,0 +1,142 @@
+# Tiled rendering of frames larger than memory. A frame is rendered as a
+# grid of cropped border regions, each written as a multilayer EXR holding
+# every enabled pass, and stitched band by band of tiles: the image streams
+# into a PNG, the other passes into float32 .npy memmaps next to it. Peak
+# memory follows the tile size, not the frame size. The camera and its
+# intrinsics are the same for all tiles of a frame.
+#
+# Example, stitch the tiles of a sharded run:
+# python scripts/tiles.py D:/Mesh/scenes/forest/tiles --output_folder D:/Mesh/scenes/forest/blended_images
+
+import os
+import sys
+import glob
+import json
+import argparse
+import numpy as np
+from numpy.lib.format import open_memmap
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from exr import read_exr, group_passes
+from writer import PngStream, quantize
+
+layout_name = "tiles.json"
+
+# view layer flags of the passes a tile can carry
+pass_flags = {
+    'depth': 'use_pass_z',
+    'normal': 'use_pass_normal',
+    'albedo': 'use_pass_diffuse_color',
+    'id': 'use_pass_object_index',
+}
+
+
+def tile_grid(width, height, columns, rows):
+    # (x0, y0, x1, y1) pixel ranges, rows counted from the top, row by row
+    xs = np.linspace(0, width, columns + 1).round().astype(int)
+    ys = np.linspace(0, height, rows + 1).round().astype(int)
+    return [(int(xs[c]), int(ys[r]), int(xs[c + 1]), int(ys[r + 1])) for r in range(rows) for c in range(columns)]
+
+
+def set_border(render, tile, width, height):
+    # Blender truncates border * resolution to whole pixels and counts y from
+    # the bottom, a quarter pixel keeps float error on the right side
+    x0, y0, x1, y1 = tile
+    render.use_border = True
+    render.use_crop_to_border = True
+    render.border_min_x = min((x0 + 0.25) / width, 1.)
+    render.border_max_x = min((x1 + 0.25) / width, 1.)
+    render.border_min_y = min((height - y1 + 0.25) / height, 1.)
+    render.border_max_y = min((height - y0 + 0.25) / height, 1.)
+
+
+def clear_border(render):
+    render.use_border = False
+    render.use_crop_to_border = False
+
+
+def tile_path(folder, stem, t):
+    return os.path.join(folder, f"{stem}-tile{t:03d}.exr")
+
+
+def save_layout(folder, width, height, columns, rows, color_depth='8', channels=4):
+    with open(os.path.join(folder, layout_name), 'w') as f:
+        json.dump({'resolution': [width, height], 'grid': [columns, rows],
+            'color_depth': color_depth, 'channels': channels}, f, indent=4)
+
+
+def load_layout(folder):
+    with open(os.path.join(folder, layout_name), 'r') as f:
+        return json.load(f)
+
+
+def stitch(paths, grid, width, height, image_path, color_depth='8', channels=4):
+    # tiles of one frame -> image PNG and one <image>-<pass>.npy per other pass,
+    # returns the written files
+    stem = os.path.splitext(image_path)[0]
+    dtype = np.uint16 if color_depth == '16' else np.uint8
+    png = PngStream(image_path, width, height, dtype, channels)
+    outputs, arrays = [image_path], {}
+    bands = {}
+    for t, tile in enumerate(grid):
+        bands.setdefault((tile[1], tile[3]), []).append(t)
+    for (y0, y1), members in sorted(bands.items()):
+        band = {}
+        for t in members:
+            x0, _, x1, _ = grid[t]
+            header, values = read_exr(paths[t])
+            if (header['width'], header['height']) != (x1 - x0, y1 - y0):
+                raise ValueError(f"{paths[t]} is {header['width']}x{header['height']}, expected {x1 - x0}x{y1 - y0}")
+            for name, names in group_passes(values).items():
+                tile_values = np.stack([values[n] for n in names], axis=-1).astype(np.float32)
+                if name not in band:
+                    band[name] = np.zeros((y1 - y0, width, len(names)), dtype=np.float32)
+                band[name][:, x0:x1] = tile_values
+        combined = band.pop('Combined')
+        if combined.shape[2] < channels:
+            combined = np.concatenate([combined, np.ones(combined.shape[:2] + (channels - combined.shape[2],), np.float32)], axis=2)
+        png.write(quantize(combined, color_depth, channels, flip=False))
+        for name, values in band.items():
+            if name not in arrays:
+                path = f"{stem}-{name.lower()}.npy"
+                arrays[name] = open_memmap(path, mode='w+', dtype=np.float32, shape=(height, width, values.shape[2]))
+                outputs.append(path)
+            arrays[name][y0:y1] = values
+    png.close()
+    for array in arrays.values():
+        array.flush()
+    return outputs
+
+
+def stitch_folder(folder, output_folder, remove=True):
+    # stitch every frame whose tiles are all present, frames with missing
+    # tiles are left as they are and returned as incomplete
+    layout = load_layout(folder)
+    width, height = layout['resolution']
+    grid = tile_grid(width, height, *layout['grid'])
+    stitched, incomplete = [], []
+    stems = {os.path.basename(p).rsplit("-tile", 1)[0] for p in glob.glob(os.path.join(folder, "*-tile[0-9][0-9][0-9].exr"))}
+    for stem in sorted(stems):
+        paths = [tile_path(folder, stem, t) for t in range(len(grid))]
+        if not all(os.path.isfile(p) for p in paths):
+            incomplete.append(stem)
+            continue
+        stitch(paths, grid, width, height, os.path.join(output_folder, stem + ".png"), layout['color_depth'], layout['channels'])
+        if remove:
+            for path in paths:
+                os.remove(path)
+        stitched.append(stem)
+    return stitched, incomplete
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stitch tiled renders')
+    parser.add_argument('folder', type=str, help='tile folder with tiles.json')
+    parser.add_argument('--output_folder', default='', help='default: the tile folder')
+    parser.add_argument('--keep', action='store_true', default=False, help='keep the tiles after stitching')
+    args = parser.parse_args(sys.argv[1:])
+    stitched, incomplete = stitch_folder(args.folder, args.output_folder or args.folder, not args.keep)
+    print(f"Stitched {len(stitched)} frames")
+    if incomplete:
+        print(f"{len(incomplete)} frames have missing tiles: {', '.join(incomplete)}")
+    sys.exit(1 if incomplete else 0)
@@ -0,0 +1,206 @@
+# Per view timing of the render loops. Every view is one record with the
+# wall and CPU seconds of each stage, written to a JSONL file or a long format
+# CSV (view, views, stage, wall, cpu). CPU time is process wide, so it includes
+# the render threads. summary() reports percentiles, throughput and the
+# slowest views.
+#
+# Example, summarise the timings of all shards of a run:
+# python scripts/timing.py D:/Mesh/scenes/forest/timings-*.jsonl
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import contextlib
+import numpy as np
+
+percentiles = (50, 90, 99)
+
+# bpy handler events splitting a timed bpy.ops.render.render() call, and the
+# stage the time after each event is booked to
+render_events = (
+    ('render_pre', 'render'),
+    ('composite_pre', 'composite'),
+    ('composite_post', 'write'),
+)
+
+
+def clock():
+    return time.perf_counter(), time.process_time()
+
+
+class Timer(object):
+    def __init__(
+        self,
+        path: str,
+        resume: bool=False,
+    ):
+        super().__init__()
+        self.path = path
+        self.csv = path.endswith('.csv')
+        append = resume and os.path.isfile(path) and os.path.getsize(path) > 0
+        self.file = open(path, 'a' if append else 'w', newline='')
+        if self.csv:
+            self.writer = csv.writer(self.file)
+            if not append:
+                self.writer.writerow(['view', 'views', 'stage', 'wall', 'cpu'])
+        self.records = []
+        self.record = None
+        self.render_stage = None
+        self.marks = []
+        self.handlers = []
+        self.begin = clock()
+
+    def watch_render(self, stage='render'):
+        # split the time of `stage` at the render, compositor and write handlers
+        import bpy
+        self.render_stage = stage
+        for event, _ in render_events:
+            handlers = getattr(bpy.app.handlers, event, None)
+            if handlers is not None:
+                handler = self.mark(event)
+                handlers.append(handler)
+                self.handlers.append((handlers, handler))
+
+    def stop_render(self):
+        # remove the handlers of watch_render(), a second Timer in the same
+        # session would otherwise have its marks taken twice
+        for handlers, handler in self.handlers:
+            if handler in handlers:
+                handlers.remove(handler)
+        self.handlers = []
+        self.render_stage = None
+
+    def mark(self, event):
+        def handler(*_):
+            self.marks.append((event, *clock()))
+        return handler
+
+    def start(self, view, views=1):
+        # views > 1 for one render of several views, e.g. an animation ring
+        self.end()
+        self.record = {'view': view, 'views': views, 'wall': {}, 'cpu': {}}
+
+    def add(self, stage, wall, cpu):
+        if self.record is None:
+            self.start('setup', 0)
+        self.record['wall'][stage] = self.record['wall'].get(stage, 0.) + wall
+        self.record['cpu'][stage] = self.record['cpu'].get(stage, 0.) + cpu
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self.marks = []
+        wall, cpu = clock()
+        try:
+            yield
+        finally:
+            end = clock()
+            if name == self.render_stage and self.marks:
+                label = name
+                for event, wall_event, cpu_event in self.marks:
+                    self.add(label, wall_event - wall, cpu_event - cpu)
+                    label = dict(render_events).get(event, label)
+                    wall, cpu = wall_event, cpu_event
+                name = label
+            self.add(name, end[0] - wall, end[1] - cpu)
+
+    def end(self):
+        record, self.record = self.record, None
+        if record is None:
+            return None
+        self.records.append(record)
+        if self.csv:
+            for stage in record['wall']:
+                self.writer.writerow([record['view'], record['views'], stage,
+                    f"{record['wall'][stage]:.6f}", f"{record['cpu'][stage]:.6f}"])
+        else:
+            self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+        return record
+
+    def close(self):
+        self.end()
+        self.stop_render()
+        self.file.close()
+        elapsed = time.perf_counter() - self.begin[0]
+        return summary(self.records, elapsed)
+
+
+def load_timings(path):
+    if not path.endswith('.csv'):
+        with open(path, 'r') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    records = {}
+    with open(path, 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            view = int(row['view']) if row['view'].lstrip('-').isdigit() else row['view']
+            record = records.setdefault(view, {'view': view, 'views': int(row['views']), 'wall': {}, 'cpu': {}})
+            record['wall'][row['stage']] = float(row['wall'])
+            record['cpu'][row['stage']] = float(row['cpu'])
+    return list(records.values())
+
+
+def summary(records, elapsed=None, slowest=5):
+    # per view seconds of every stage; records rendering several views at once
+    # are spread evenly over them
+    views = [r for r in records if r['views'] > 0]
+    n = sum(r['views'] for r in views)
+    report = {'views': n, 'stages': {}, 'slowest': []}
+    if not views:
+        return report
+    weights = np.array([r['views'] for r in views], dtype=float)
+    stages = list(dict.fromkeys(s for r in views for s in r['wall']))
+    for stage in stages + ['total']:
+        for kind in ('wall', 'cpu'):
+            if stage == 'total':
+                seconds = np.array([sum(r[kind].values()) for r in views]) / weights
+            else:
+                seconds = np.array([r[kind].get(stage, 0.) for r in views]) / weights
+            values = np.repeat(seconds, weights.astype(int))
+            report['stages'].setdefault(stage, {})[kind] = {
+                'mean': float(values.mean()),
+                **{f"p{p}": float(np.percentile(values, p)) for p in percentiles},
+                'max': float(values.max()),
+                'sum': float(values.sum()),
+            }
+    totals = np.array([sum(r['wall'].values()) for r in views]) / weights
+    for index in np.argsort(-totals)[:slowest]:
+        report['slowest'].append({'view': views[index]['view'], 'wall': float(totals[index])})
+    busy = report['stages']['total']['wall']['sum']
+    report['elapsed'] = float(elapsed) if elapsed is not None else busy
+    report['throughput'] = n / report['elapsed'] if report['elapsed'] > 0 else 0.
+    return report
+
+
+def format_summary(report):
+    lines = [f"{report['views']} views in {report.get('elapsed', 0.):.1f} s, {report.get('throughput', 0.):.3f} views/s"]
+    columns = ['mean'] + [f"p{p}" for p in percentiles] + ['max']
+    lines.append(f"{'stage':<12}{'':>5}" + ''.join(f"{c:>10}" for c in columns))
+    for stage, kinds in report['stages'].items():
+        for kind, values in kinds.items():
+            lines.append(f"{stage:<12}{kind:>5}" + ''.join(f"{values[c]:>10.4f}" for c in columns))
+    if report['slowest']:
+        lines.append("slowest: " + ', '.join(f"{s['view']} ({s['wall']:.3f} s)" for s in report['slowest']))
+    return '\n'.join(lines)
+
+
+def write_summary(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(format_summary(report))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarise per view timings')
+    parser.add_argument('paths', type=str, nargs='+', help='timings .jsonl or .csv files, shards are combined')
+    parser.add_argument('--slowest', type=int, default=5, help='number of slowest views listed')
+    parser.add_argument('--output', default='', help='also write the summary as JSON')
+    args = parser.parse_args(sys.argv[1:])
+    records = [r for path in args.paths for r in load_timings(path)]
+    report = summary(records, slowest=args.slowest)
+    if args.output:
+        write_summary(report, args.output)
+    else:
+        print(format_summary(report))
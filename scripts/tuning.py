@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import bpy
+import numpy as np
+
+from passes import viewer_pixels
+
+# Cycles sample budget tuning. A few calibration views are rendered at a
+# reduced resolution at two sample counts, twice each with different seeds.
+# Render time is fitted as t = t0 + c * samples * pixels and noise (the
+# standard deviation of the seed to seed difference / sqrt(2)) as
+# a / sqrt(samples). The fits pick max samples, the adaptive sampling
+# threshold and denoising for a per frame time or noise target. Sharded
+# runs tune once and hand the saved result to every worker.
+
+
+def ensure_viewer():
+    # a Viewer node fed by the render layer, returns it if it was added
+    tree = bpy.context.scene.node_tree
+    if any(node.type == 'VIEWER' for node in tree.nodes):
+        return None
+    render_layers = next(node for node in tree.nodes if node.type == 'R_LAYERS')
+    viewer = tree.nodes.new('CompositorNodeViewer')
+    tree.links.new(render_layers.outputs['Image'], viewer.inputs[0])
+    return viewer
+
+
+def timed_render(samples, seed):
+    cycles = bpy.context.scene.cycles
+    cycles.samples = samples
+    cycles.seed = seed
+    start = time.perf_counter()
+    bpy.ops.render.render()
+    elapsed = time.perf_counter() - start
+    return elapsed, viewer_pixels()
+
+
+def noise(a, b):
+    # per channel noise of one render from two renders that differ by seed
+    covered = a[..., 3] > 0
+    covered = covered if covered.any() else np.ones(covered.shape, dtype=bool)
+    return float(np.std((a[..., :3] - b[..., :3])[covered]) / np.sqrt(2))
+
+
+def calibrate(set_view, views, samples=(16, 64), percentage=25):
+    # times and noise of every view at every sample count, at `percentage` resolution
+    scene = bpy.context.scene
+    render = scene.render
+    state = (render.resolution_percentage, scene.cycles.samples, scene.cycles.seed,
+        scene.cycles.use_adaptive_sampling, scene.cycles.use_denoising)
+    # no files are written while calibrating
+    outputs = [node for node in scene.node_tree.nodes if node.type == 'OUTPUT_FILE' and not node.mute]
+    for node in outputs:
+        node.mute = True
+    viewer = ensure_viewer()
+    render.resolution_percentage = percentage
+    scene.cycles.use_adaptive_sampling = False
+    scene.cycles.use_denoising = False
+    measurements = []
+    try:
+        for view in views:
+            set_view(view)
+            # the first render of a view also pays for scene sync, it is not measured
+            timed_render(min(samples), 0)
+            for s in samples:
+                t0, a = timed_render(s, 0)
+                t1, b = timed_render(s, 1)
+                measurements.append({'view': view, 'samples': s, 'time': (t0 + t1) / 2, 'noise': noise(a, b)})
+    finally:
+        (render.resolution_percentage, scene.cycles.samples, scene.cycles.seed,
+            scene.cycles.use_adaptive_sampling, scene.cycles.use_denoising) = state
+        for node in outputs:
+            node.mute = False
+        if viewer is not None:
+            scene.node_tree.nodes.remove(viewer)
+    return measurements
+
+
+def fit(measurements, percentage=25):
+    # full resolution t0, per sample time and noise constant from calibration
+    samples = np.array([m['samples'] for m in measurements], dtype=float)
+    times = np.array([m['time'] for m in measurements])
+    noises = np.array([m['noise'] for m in measurements])
+    slope, intercept = np.polyfit(samples, times, 1) if len(set(samples)) > 1 else (times.mean() / samples.mean(), 0.)
+    pixel_ratio = (100. / percentage) ** 2
+    return {
+        't0': float(max(intercept, 0.)),
+        'time_per_sample': float(max(slope, 1e-9) * pixel_ratio),
+        # the worst view decides, noise per pixel does not depend on resolution
+        'noise_constant': float(np.max(noises * np.sqrt(samples))),
+    }
+
+
+def choose_settings(model, time_target=None, noise_target=None, min_samples=4, max_samples=4096, denoiser=True):
+    # Samples meeting the noise target, capped by the time target. The
+    # adaptive threshold stops converged pixels early; denoising is turned on
+    # when the time budget leaves the noise above the target.
+    samples = max_samples
+    if noise_target:
+        samples = min(samples, np.ceil((model['noise_constant'] / noise_target) ** 2))
+    if time_target:
+        samples = min(samples, np.floor((time_target - model['t0']) / model['time_per_sample']))
+    samples = int(np.clip(samples, min_samples, max_samples))
+    predicted_noise = model['noise_constant'] / np.sqrt(samples)
+    threshold = noise_target if noise_target else predicted_noise
+    return {
+        'samples': samples,
+        'use_adaptive_sampling': True,
+        'adaptive_threshold': float(np.clip(threshold, 0.001, 1.)),
+        'use_denoising': bool(denoiser and noise_target and predicted_noise > noise_target),
+        'predicted_time': float(model['t0'] + model['time_per_sample'] * samples),
+        'predicted_noise': float(predicted_noise),
+    }
+
+
+def apply_settings(settings):
+    cycles = bpy.context.scene.cycles
+    cycles.samples = settings['samples']
+    cycles.use_adaptive_sampling = settings['use_adaptive_sampling']
+    cycles.adaptive_threshold = settings['adaptive_threshold']
+    cycles.use_denoising = settings['use_denoising']
+    if settings['use_denoising'] and getattr(bpy.app.build_options, 'openimagedenoise', False):
+        # OpenImageDenoise runs on the CPU
+        cycles.denoiser = 'OPENIMAGEDENOISE'
+
+
+def tune(set_view, views, time_target=None, noise_target=None, samples=(16, 64), percentage=25, max_samples=4096):
+    # calibrate, choose and apply, returns everything for the run metadata
+    measurements = calibrate(set_view, views, samples, percentage)
+    model = fit(measurements, percentage)
+    denoiser = getattr(bpy.app.build_options, 'openimagedenoise', True)
+    settings = choose_settings(model, time_target, noise_target, max_samples=max_samples, denoiser=denoiser)
+    apply_settings(settings)
+    return {
+        'time_target': time_target,
+        'noise_target': noise_target,
+        'calibration': measurements,
+        'model': model,
+        'settings': settings,
+    }
+
+
+def save_tuning(path, tuning):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(tuning, f, indent=4)
+    os.replace(path + '.tmp', path)
+
+
+def load_tuning(path):
+    # a saved tune() result, applied as is
+    with open(path, 'r') as f:
+        tuning = json.load(f)
+    apply_settings(tuning['settings'])
+    return tuning
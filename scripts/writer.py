@@ -0,0 +1,157 @@
+import os
+import zlib
+import queue
+import struct
+import threading
+import numpy as np
+
+# Asynchronous image writing. Raw float pass buffers are handed to a bounded
+# queue and encoded and written by background threads while the next frame
+# renders; write() blocks once max_pending frames wait, which bounds memory.
+# zlib and file IO release the GIL, so threads are enough.
+# done() and close() return the tags of finished writes only, a failed write
+# never returns its tag. check() raises once a write failed, write() calls it;
+# after close() record the returned tags, then call check().
+
+
+def png_chunk(kind, data):
+    chunk = kind + data
+    return struct.pack('>I', len(data)) + chunk + struct.pack('>I', zlib.crc32(chunk) & 0xffffffff)
+
+
+def png_header(width, height, dtype, channels):
+    bit_depth = {np.dtype(np.uint8): 8, np.dtype(np.uint16): 16}[np.dtype(dtype)]
+    color_type = {1: 0, 2: 4, 3: 2, 4: 6}[channels]
+    header = struct.pack('>IIBBBBB', width, height, bit_depth, color_type, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + png_chunk(b'IHDR', header)
+
+
+def png_rows(array):
+    # (H, W, C) integer array -> raw scanlines, filter type 0 in front of every row
+    height = len(array)
+    rows = array.astype(array.dtype.newbyteorder('>')).reshape(height, -1).view(np.uint8)
+    return np.concatenate([np.zeros((height, 1), dtype=np.uint8), rows], axis=1).tobytes()
+
+
+def encode_png(array, level=6):
+    # (H, W) or (H, W, C) uint8 / uint16 array, C in 1..4, to PNG bytes
+    array = np.asarray(array)
+    if array.ndim == 2:
+        array = array[:, :, None]
+    height, width, channels = array.shape
+    return b''.join([
+        png_header(width, height, array.dtype, channels),
+        png_chunk(b'IDAT', zlib.compress(png_rows(array), level)),
+        png_chunk(b'IEND', b''),
+    ])
+
+
+class PngStream(object):
+    # PNG written band by band of rows, for images larger than memory
+    def __init__(
+        self,
+        path: str,
+        width: int,
+        height: int,
+        dtype=np.uint8,
+        channels: int=4,
+        level: int=6,
+    ):
+        super().__init__()
+        self.path = path
+        self.file = open(path + '.tmp', 'wb')
+        self.file.write(png_header(width, height, dtype, channels))
+        self.compressor = zlib.compressobj(level)
+
+    def write(self, rows):
+        rows = np.asarray(rows)
+        data = self.compressor.compress(png_rows(rows if rows.ndim == 3 else rows[:, :, None]))
+        if data:
+            self.file.write(png_chunk(b'IDAT', data))
+
+    def close(self):
+        self.file.write(png_chunk(b'IDAT', self.compressor.flush()))
+        self.file.write(png_chunk(b'IEND', b''))
+        self.file.close()
+        os.replace(self.path + '.tmp', self.path)
+
+
+def linear2srgb(pixels):
+    pixels = np.clip(pixels, 0., 1.)
+    return np.where(pixels <= 0.0031308, pixels * 12.92, 1.055 * np.power(pixels, 1 / 2.4) - 0.055)
+
+
+def quantize(pixels, color_depth='8', channels=4, srgb=True, flip=True):
+    # Blender float buffer (H, W, 4), bottom row first -> top row first integer image
+    pixels = pixels[:, :, :channels]
+    pixels = np.flipud(pixels) if flip else pixels
+    if srgb:
+        color = linear2srgb(pixels[:, :, :3])
+        pixels = np.concatenate([color, np.clip(pixels[:, :, 3:], 0., 1.)], axis=2)
+    else:
+        pixels = np.clip(pixels, 0., 1.)
+    scale = 65535 if color_depth == '16' else 255
+    dtype = np.uint16 if color_depth == '16' else np.uint8
+    return (pixels * scale + 0.5).astype(dtype)
+
+
+class AsyncWriter(object):
+    def __init__(
+        self,
+        workers: int=2,
+        max_pending: int=8,
+        color_depth: str='8',
+        channels: int=4,
+        srgb: bool=True,
+        level: int=6,
+    ):
+        super().__init__()
+        self.options = dict(color_depth=color_depth, channels=channels, srgb=srgb)
+        self.level = level
+        self.pending = queue.Queue(max_pending)
+        self.finished = queue.SimpleQueue()
+        self.errors = []
+        self.threads = [threading.Thread(target=self.run, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def run(self):
+        while True:
+            job = self.pending.get()
+            if job is None:
+                return
+            path, pixels, tag = job
+            try:
+                data = encode_png(quantize(pixels, **self.options), self.level)
+                # never leave a truncated file under the final name
+                with open(path + '.tmp', 'wb') as f:
+                    f.write(data)
+                os.replace(path + '.tmp', path)
+                self.finished.put(tag)
+            except Exception as e:
+                self.errors.append((path, tag, e))
+
+    def check(self):
+        if self.errors:
+            path, _, error = self.errors[0]
+            raise RuntimeError(f"Writing {len(self.errors)} images failed, the first {path}: {error}") from error
+
+    def write(self, path, pixels, tag=None):
+        self.check()
+        self.pending.put((path, pixels, tag))
+
+    def done(self):
+        # tags of every write finished since the last call
+        tags = []
+        while not self.finished.empty():
+            tags.append(self.finished.get())
+        return tags
+
+    def close(self):
+        # tags of the writes finished since the last done(), call check() once
+        # they are journaled
+        for _ in self.threads:
+            self.pending.put(None)
+        for thread in self.threads:
+            thread.join()
+        return self.done()
@@ -0,0 +1,75 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from preprocess import weld, edge_split
+
+# two triangles of a square with the shared corners duplicated, like an OBJ
+# export without shared vertices
+square_co = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 0, 0], [1, 1, 0], [0, 1, 0]], dtype=float)
+square_loops = np.arange(6)
+square_start = np.array([0, 3])
+square_total = np.array([3, 3])
+
+cube_obj = """\
+v -1 -1 -1
+v 1 -1 -1
+v 1 1 -1
+v -1 1 -1
+v -1 -1 1
+v 1 -1 1
+v 1 1 1
+v -1 1 1
+vn 0 0 -1
+vn 0 0 1
+vn 0 -1 0
+vn 1 0 0
+vn 0 1 0
+vn -1 0 0
+f 1//1 4//1 3//1 2//1
+f 5//2 6//2 7//2 8//2
+f 1//3 2//3 6//3 5//3
+f 2//4 3//4 7//4 6//4
+f 3//5 4//5 8//5 7//5
+f 4//6 1//6 5//6 8//6
+"""
+
+
+def test_weld_merges_duplicates():
+    co, loop_vertex, keep_loop, keep_polygon = weld(square_co, square_loops, square_start, square_total)
+    assert len(co) == 4
+    assert keep_loop.all() and keep_polygon.all()
+    assert loop_vertex[3] == loop_vertex[0] and loop_vertex[4] == loop_vertex[2]
+
+
+def test_edge_split_keeps_flat_fans():
+    co, loop_vertex, _, _ = weld(square_co, square_loops, square_start, square_total)
+    co, loop_vertex, origin = edge_split(co, loop_vertex, square_start, square_total)
+    # coplanar triangles are smooth across their shared edge, nothing splits
+    assert len(co) == 4
+    np.testing.assert_array_equal(co, square_co[[0, 1, 2, 5]])
+
+
+def test_obj_normals_take_array_path(tmp_path):
+    bpy = pytest.importorskip('bpy')
+    from preprocess import clean_objects, dropped_layers, loop_normals
+    path = tmp_path / "cube.obj"
+    path.write_text(cube_obj)
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    if hasattr(bpy.ops.wm, 'obj_import'):
+        bpy.ops.wm.obj_import(filepath=str(path))
+    else:
+        bpy.ops.import_scene.obj(filepath=str(path))
+    objects = list(bpy.context.selected_objects)
+    mesh = objects[0].data
+    assert mesh.has_custom_normals
+    assert dropped_layers(mesh, objects) == []
+    assert clean_objects(objects) == []
+    # the flat face normals of the vn lines survive the weld and the split
+    assert mesh.has_custom_normals
+    normals = loop_normals(mesh)
+    polygon = np.repeat(np.arange(len(mesh.polygons)), [p.loop_total for p in mesh.polygons])
+    face_normals = np.array([tuple(p.normal) for p in mesh.polygons])
+    np.testing.assert_allclose(normals, face_normals[polygon], atol=1e-4)